@@ -0,0 +1,66 @@
+"""Synthetic CMS-style inpatient claims shared by the benchmark scripts."""
+from pathlib import Path
+import sys
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = Path(__file__).parent.parent
+SERVER_DIR = ROOT_DIR / "server"
+
+# server modules import each other as top-level modules (they are run from server/)
+if str(SERVER_DIR) not in sys.path:
+    sys.path.insert(0, str(SERVER_DIR))
+
+secondary_diagnosis_cols = [f"ICD_DGNS_CD{i}" for i in range(1, 26)]
+
+
+def make_claims(n_claims: int, n_codes: int = 5_000, seed: int = 0) -> pd.DataFrame:
+    """Return one row per claim with principal/secondary ICD codes, dates and charges.
+
+    Secondary code slots fill from the left and trail off with None, like the CMS
+    extract, so later columns are mostly empty.
+    """
+    rng = np.random.default_rng(seed)
+    vocab = np.array([f"{chr(65 + i % 26)}{i:05d}" for i in range(n_codes)], dtype=object)
+
+    n_filled = rng.integers(1, 26, size=n_claims)
+    codes = vocab[rng.zipf(1.3, size=(n_claims, 25)) % n_codes]
+    codes[np.arange(25)[None, :] >= n_filled[:, None]] = None
+
+    from_dt = pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 365, size=n_claims), unit="D")
+    num_days = rng.integers(0, 30, size=n_claims)
+
+    df = pd.DataFrame(codes, columns=secondary_diagnosis_cols)
+    df.insert(0, "CLM_ID", np.arange(n_claims, dtype=np.int64) + 1)
+    df.insert(1, "PRNCPAL_DGNS_CD", vocab[rng.zipf(1.3, size=n_claims) % n_codes])
+    df.insert(2, "CLM_TOT_CHRG_AMT", rng.integers(500, 250_000, size=n_claims))
+    df["CLM_FROM_DT"] = from_dt.strftime("%Y-%m-%d")
+    df["CLM_THRU_DT"] = (from_dt + pd.to_timedelta(num_days, unit="D")).strftime("%Y-%m-%d")
+    df["CLM_NUM_DAYS"] = num_days
+    return df
+
+
+def make_feature_claims(n_claims: int, n_patients: int = None, n_providers: int = 2_000, seed: int = 0) -> pd.DataFrame:
+    """Return claims shaped for claims_prep.create_fraud_features.
+
+    Patient and provider ids repeat, service dates are datetimes (a few NaT), and there
+    are amount and dx/procedure code columns; about 1% of rows have no patient.
+    """
+    rng = np.random.default_rng(seed)
+    n_patients = n_patients or max(n_claims // 10, 1)
+    patient_id = rng.integers(0, n_patients, size=n_claims).astype(np.float64)
+    patient_id[rng.random(n_claims) < 0.01] = np.nan
+    service_date = pd.Series(pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 730, size=n_claims), unit="D"))
+    service_date[rng.random(n_claims) < 0.01] = pd.NaT
+    dx_vocab = np.array([f"D{i:04d}" for i in range(5_000)], dtype=object)
+    cpt_vocab = np.array([f"{i:05d}" for i in range(2_000)], dtype=object)
+    return pd.DataFrame({
+        "claim_id": np.arange(n_claims, dtype=np.int64),
+        "patient_id": patient_id,
+        "provider_id": rng.integers(10**9, 10**9 + n_providers, size=n_claims),
+        "service_date": service_date,
+        "total_charge": rng.gamma(2.0, 800.0, size=n_claims).round(2),
+        "dx_code": pd.Series(dx_vocab[rng.zipf(1.3, size=n_claims) % len(dx_vocab)], dtype="str"),
+        "procedure_code": pd.Series(cpt_vocab[rng.integers(0, len(cpt_vocab), size=n_claims)], dtype="str"),
+    })
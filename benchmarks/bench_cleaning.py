@@ -0,0 +1,87 @@
+"""Benchmark per-chunk cleaning: uncompiled regexes + format-less date parsing vs today's functions.
+
+    python benchmarks/bench_cleaning.py --chunks 20 --chunk-size 50000 --columns 300
+
+Builds one chunk of synthetic claims (make_claims) with raw CMS-style headers, an
+extra non-ISO (%m/%d/%Y) date column and filler columns up to --columns, then cleans
+it --chunks times the way a chunked reader would:
+
+- legacy: clean_column_names + infer_and_parse_dates as they were (three uncompiled
+  re.sub per column, every matching column parsed with pd.to_datetime and no format)
+- functions: today's clean_column_names + infer_and_parse_dates (memoized names, the
+  format detected per chunk, each distinct date parsed once)
+
+Reports wall time per method and checks both yield the same frame.
+"""
+import argparse
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from _synthetic import ROOT_DIR, make_claims
+
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from claims_prep.cleaning import clean_column_names, infer_and_parse_dates  # noqa: E402
+
+
+def legacy_clean_name(name):
+    name = str(name).strip().lower()
+    name = re.sub(r"[^\w\s]", "", name)
+    name = re.sub(r"\s+", "_", name)
+    name = re.sub(r"_+", "_", name)
+    return name
+
+
+def legacy_clean(df):
+    """clean_column_names + infer_and_parse_dates as they were (infer_datetime_format is gone from pandas 2+)."""
+    df = df.rename(columns=legacy_clean_name)
+    for c in [c for c in df.columns if re.search(r"date|dt|time", c)]:
+        try:
+            df[c] = pd.to_datetime(df[c], errors="coerce")
+        except Exception:
+            pass
+    return df
+
+
+def _raw_chunk(n: int, n_columns: int) -> pd.DataFrame:
+    df = make_claims(n)
+    df.columns = [f" {c.replace('_', ' ')} " for c in df.columns]
+    rng = np.random.default_rng(1)
+    days = pd.Timestamp("2015-01-01") + pd.to_timedelta(rng.integers(0, 3_000, size=n), unit="D")
+    df["NCH Wkly Proc Dt"] = pd.Series(days.strftime("%m/%d/%Y"), dtype=object)
+    filler = {f"Filler Amt ({i})": rng.random(n) for i in range(max(n_columns - df.shape[1], 0))}
+    return pd.concat([df, pd.DataFrame(filler)], axis=1)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--chunks", type=int, default=20)
+    p.add_argument("--chunk-size", type=int, default=50_000)
+    p.add_argument("--columns", type=int, default=300)
+    args = p.parse_args(argv)
+
+    raw = _raw_chunk(args.chunk_size, args.columns)
+    print(f"{args.chunks} chunks of {args.chunk_size} rows x {raw.shape[1]} columns")
+
+    def functions(df):
+        return infer_and_parse_dates(clean_column_names(df))
+
+    print(f"{'method':>10} {'seconds':>9} {'speedup':>8}  same")
+    expected, t_legacy = None, None
+    for name, fn in [("legacy", legacy_clean), ("functions", functions)]:
+        t0 = time.perf_counter()
+        for _ in range(args.chunks):
+            out = fn(raw.copy(deep=False))
+        elapsed = time.perf_counter() - t0
+        if expected is None:
+            expected, t_legacy = out, elapsed
+        print(f"{name:>10} {elapsed:>9.2f} {t_legacy / elapsed:>7.1f}x  {out.equals(expected)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Benchmark diagnosis codes as strings vs code dictionary Categoricals.
+
+    python benchmarks/bench_code_dictionary.py --claims 1000000 --batches 200
+
+Builds synthetic claims, encodes PRNCPAL_DGNS_CD and the 25 ICD_DGNS_CD columns with a
+CodeDictionary (server/code_dictionary.py, stored in a temporary SQLite file) and
+compares, strings against Categoricals: the memory of the 26 code columns, the
+secondary (melt + groupby) and principal tmean builds, and ClaimCodes + tmean lookups
+for two models, once over the whole frame and over --batches small batches the way the
+scoring service sees them. Every pair of results is checked to be equal.
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+
+from _synthetic import make_claims, secondary_diagnosis_cols
+from code_dictionary import CodeDictionary
+from tmean import ClaimCodes, principal_code_tmean, secondary_code_tmean, tmean_lookups
+
+CODE_COLS = ["PRNCPAL_DGNS_CD"] + secondary_diagnosis_cols
+TARGETS = ["CLM_TOT_CHRG_AMT", "CLM_NUM_DAYS"]
+
+
+def _timed(fn, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return out, best
+
+
+def _as_objects(df_tmean):
+    return df_tmean.astype({df_tmean.columns[0]: object})
+
+
+def _mib(df):
+    return df[CODE_COLS].memory_usage(deep=True, index=False).sum() / 2**20
+
+
+def _score(df, lookups, dictionary=None):
+    codes = ClaimCodes(df, dictionary)
+    return [codes.tmean_matrix(*pair) for pair in lookups]
+
+
+def _score_batches(batches, lookups, dictionary=None):
+    return [_score(batch, lookups, dictionary) for batch in batches]
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--claims", type=int, default=1_000_000)
+    p.add_argument("--batches", type=int, default=200, help="service-sized batches of 256 claims")
+    args = p.parse_args(argv)
+
+    df = make_claims(args.claims)
+    df[CODE_COLS] = df[CODE_COLS].astype(object)
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "codes.db"))
+        dictionary = CodeDictionary.load(conn)
+        t0 = time.perf_counter()
+        coded = dictionary.categorize(df.copy(), CODE_COLS, conn)
+        t_encode = time.perf_counter() - t0
+        conn.close()
+    print(f"{args.claims} claims, {len(dictionary)} codes; encoding (one-off, new codes stored) {t_encode:.2f}s")
+    print(f"code columns: strings {_mib(df):.1f} MiB, categorical {_mib(coded):.1f} MiB")
+
+    print(f"{'step':>26} {'strings s':>10} {'codes s':>9} {'speedup':>8}  same")
+
+    def report(name, fn, same=lambda a, b: a.equals(b)):
+        old, t_old = _timed(fn, df)
+        new, t_new = _timed(fn, coded)
+        print(f"{name:>26} {t_old:>10.3f} {t_new:>9.3f} {t_old / t_new:>7.1f}x  {same(old, new)}")
+        return old
+
+    report("secondary tmean", lambda d: secondary_code_tmean(d, TARGETS[0]),
+           lambda a, b: _as_objects(a).equals(_as_objects(b)))
+    # grouped by a Categorical, the principal table comes out in dictionary order
+    report("principal tmean", lambda d: principal_code_tmean(d, TARGETS[0]),
+           lambda a, b: _as_objects(a).equals(_as_objects(b).sort_values("PRNCPAL_DGNS_CD", ignore_index=True)))
+
+    lookups = [tmean_lookups(principal_code_tmean(df, t), secondary_code_tmean(df, t)) for t in TARGETS]
+    same_matrices = lambda a, b: all(np.array_equal(x, y, equal_nan=True) for x, y in zip(a, b))
+    report("ClaimCodes + 2 lookups", lambda d: _score(d, lookups), same_matrices)
+
+    # the service keeps strings and maps them with the dictionary, batch after batch
+    batches = [df.iloc[i * 256:(i + 1) * 256] for i in range(args.batches)]
+    old, t_old = _timed(_score_batches, batches, lookups)
+    new, t_new = _timed(_score_batches, batches, lookups, dictionary)
+    same = all(same_matrices(a, b) for a, b in zip(old, new))
+    print(f"{f'{args.batches} batches of 256':>26} {t_old:>10.3f} {t_new:>9.3f} {t_old / t_new:>7.1f}x  {same}")
+
+
+if __name__ == "__main__":
+    main()
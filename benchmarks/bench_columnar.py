@@ -0,0 +1,110 @@
+"""Benchmark reading the scoring columns of a wide claims table from SQLite vs Parquet.
+
+    python benchmarks/bench_columnar.py --rows 200000 1000000 --extra-cols 100
+
+Builds a claims table with --extra-cols filler columns on top of the ~30 the models
+use, stores it in SQLite and as Parquet (claims_prep.columnar), then reads the scoring
+columns and an "unscored" slice (CLM_ID above a watermark) from each. Every read runs
+in a fresh process so its wall time and peak RSS growth are measured in isolation.
+Needs pyarrow; RSS is read from /proc, so Linux only.
+"""
+import argparse
+import json
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from _synthetic import ROOT_DIR, make_claims, secondary_diagnosis_cols
+
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from claims_prep.columnar import read_parquet_table, write_parquet  # noqa: E402
+from claims_prep.db import read_table  # noqa: E402
+
+SCORING_COLS = ["CLM_ID", "PRNCPAL_DGNS_CD", "CLM_TOT_CHRG_AMT", "CLM_FROM_DT", "CLM_THRU_DT"] + secondary_diagnosis_cols
+
+
+def _build(tmp, n_rows, n_extra):
+    db_path = Path(tmp) / "claims.db"
+    parquet_path = Path(tmp) / "claims.parquet"
+    conn = sqlite3.connect(db_path)
+    chunks = []
+    step = 200_000
+    for start in range(0, n_rows, step):
+        df = make_claims(min(step, n_rows - start), seed=start)
+        df["CLM_ID"] += start
+        rng = np.random.default_rng(start)
+        for i in range(n_extra):
+            df[f"EXTRA_{i}"] = rng.random(len(df)) if i % 2 else rng.integers(0, 1_000_000, len(df))
+        df.to_sql("cms_claims", conn, if_exists="append", index=False)
+        chunks.append(df)
+    conn.close()
+    write_parquet(chunks, parquet_path)
+    return db_path, parquet_path
+
+
+def _status_kb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def _child(backend, path, watermark):
+    if backend == "parquet":
+        import pyarrow.parquet  # noqa: F401  (keep the import out of the timing)
+    # VmHWM is the peak RSS of this process image (ru_maxrss would carry the parent's
+    # peak across exec), so report its growth over the post-import RSS
+    baseline = _status_kb("VmRSS")
+    filters = [("CLM_ID", ">", watermark)] if watermark is not None else None
+    t0 = time.perf_counter()
+    if backend == "sqlite":
+        df = read_table(path, "cms_claims", columns=SCORING_COLS, filters=filters)
+    else:
+        df = read_parquet_table(path, columns=SCORING_COLS, filters=filters)
+    elapsed = time.perf_counter() - t0
+    peak = _status_kb("VmHWM")
+    print(json.dumps({"seconds": elapsed, "rss_mb": (peak - baseline) / 1024, "rows": len(df)}))
+
+
+def _run(backend, path, watermark):
+    cmd = [sys.executable, __file__, "--child", backend, str(path)]
+    if watermark is not None:
+        cmd += ["--watermark", str(watermark)]
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--rows", type=int, nargs="+", default=[200_000, 1_000_000])
+    p.add_argument("--extra-cols", type=int, default=100, help="Filler columns the models never read")
+    p.add_argument("--new-fraction", type=float, default=0.01, help="Share of claims above the watermark")
+    p.add_argument("--child", nargs=2, metavar=("BACKEND", "PATH"), help=argparse.SUPPRESS)
+    p.add_argument("--watermark", type=int, default=None, help=argparse.SUPPRESS)
+    args = p.parse_args(argv)
+
+    if args.child:
+        _child(args.child[0], args.child[1], args.watermark)
+        return
+
+    print(f"{'rows':>10} {'read':<9} {'backend':<8} {'seconds':>9} {'RSS MB':>9} {'rows out':>10}")
+    for n_rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path, parquet_path = _build(tmp, n_rows, args.extra_cols)
+            watermark = int(n_rows * (1 - args.new_fraction))
+            for label, wm in (("columns", None), ("unscored", watermark)):
+                for backend, path in (("sqlite", db_path), ("parquet", parquet_path)):
+                    r = _run(backend, path, wm)
+                    print(f"{n_rows:>10} {label:<9} {backend:<8} {r['seconds']:>9.3f} {r['rss_mb']:>9.1f} {r['rows']:>10}")
+
+
+if __name__ == "__main__":
+    main()
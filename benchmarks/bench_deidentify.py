@@ -0,0 +1,82 @@
+"""Benchmark deidentify_ids: per-row Series.apply hashing vs hashing unique values once.
+
+    python benchmarks/bench_deidentify.py --rows 10000000 --patients 1000000 --providers 20000
+
+Builds a claims-like frame with repeated patient and provider IDs, hashes both columns
+with the old per-row lambda and with claims_prep.features.deidentify_ids (also streamed in
+--chunk-rows chunks through deidentify_id_chunks), and checks the hashes are identical.
+"""
+import argparse
+import hashlib
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from _synthetic import ROOT_DIR
+
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from claims_prep.features import deidentify_id_chunks, deidentify_ids  # noqa: E402
+
+ID_COLS = ["patient_id", "provider_id"]
+
+
+def legacy_deidentify_ids(df, id_cols, salt=""):
+    """The per-row hashing deidentify_ids used to do."""
+    for c in id_cols:
+        df[f"{c}_hash"] = df[c].astype(str).fillna("").apply(
+            lambda x: hashlib.blake2b((x + salt).encode("utf-8"), digest_size=10).hexdigest()
+        )
+        df = df.drop(columns=[c])
+    return df
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--rows", type=int, default=10_000_000)
+    p.add_argument("--patients", type=int, default=1_000_000)
+    p.add_argument("--providers", type=int, default=20_000)
+    p.add_argument("--chunk-rows", type=int, default=1_000_000)
+    args = p.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "patient_id": pd.Series(rng.integers(0, args.patients, args.rows)).map("{:010d}".format),
+        "provider_id": rng.integers(10**9, 10**9 + args.providers, args.rows),
+    })
+    print(f"{args.rows} rows, {df['patient_id'].nunique()} patients, {df['provider_id'].nunique()} providers")
+
+    t0 = time.perf_counter()
+    expected = legacy_deidentify_ids(df.copy(), ID_COLS, salt="salt")
+    t_legacy = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    out = deidentify_ids(df.copy(), ID_COLS, salt="salt")
+    t_unique = time.perf_counter() - t0
+    unique_identical = out.equals(expected)
+    del out
+
+    # compare each streamed chunk as it comes, so only one is held at a time
+    t_streamed, streamed_identical, start = 0.0, True, 0
+    chunks = (df.iloc[i:i + args.chunk_rows].copy() for i in range(0, len(df), args.chunk_rows))
+    stream = deidentify_id_chunks(chunks, ID_COLS, salt="salt")
+    while True:
+        t0 = time.perf_counter()
+        chunk = next(stream, None)
+        t_streamed += time.perf_counter() - t0
+        if chunk is None:
+            break
+        streamed_identical &= chunk.equals(expected.iloc[start:start + len(chunk)])
+        start += len(chunk)
+
+    print(f"{'method':>22} {'seconds':>9} {'rows/s':>11} {'speedup':>8}  identical")
+    for name, seconds, identical in [("per-row apply", t_legacy, True), ("unique values", t_unique, unique_identical),
+                                     (f"chunks of {args.chunk_rows}", t_streamed, streamed_identical)]:
+        print(f"{name:>22} {seconds:>9.2f} {args.rows / seconds:>11.0f} {t_legacy / seconds:>7.1f}x  {identical}")
+
+
+if __name__ == "__main__":
+    main()
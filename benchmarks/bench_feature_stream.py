@@ -0,0 +1,80 @@
+"""Benchmark create_fraud_features on a CSV: load-then-compute vs the two-pass stream.
+
+    python benchmarks/bench_feature_stream.py --rows 1000000 --chunk-rows 100000 500000
+
+Writes synthetic claims to a temporary CSV, then (a) reads it whole and runs
+claims_prep.create_fraud_features, and (b) streams it through
+claims_prep.feature_stream.write_fraud_features_csv, writing features CSVs in both
+cases. Reports wall time and tracemalloc peak, and for up to --check-max-rows rows
+checks that the streamed features equal the in-memory ones. tracemalloc and the CSV
+writing dominate the wall times; compare them with each other only.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from _synthetic import ROOT_DIR, make_feature_claims
+
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from claims_prep.feature_stream import stream_fraud_features, write_fraud_features_csv  # noqa: E402
+from claims_prep.features import create_fraud_features  # noqa: E402
+
+DATES = ["service_date"]
+
+
+def in_memory(csv_path, out_path, chunk_rows):
+    df = pd.read_csv(csv_path, parse_dates=DATES)
+    create_fraud_features(df).to_csv(out_path, index=False)
+
+
+def streamed(csv_path, out_path, chunk_rows):
+    write_fraud_features_csv(lambda: pd.read_csv(csv_path, parse_dates=DATES, chunksize=chunk_rows), out_path)
+
+
+def _measure(fn, *args):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 2**20
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--rows", type=int, default=1_000_000)
+    p.add_argument("--chunk-rows", type=int, nargs="+", default=[100_000, 500_000])
+    p.add_argument("--check-max-rows", type=int, default=1_000_000)
+    args = p.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "claims.csv")
+        out_path = os.path.join(tmp, "features.csv")
+        make_feature_claims(args.rows).to_csv(csv_path, index=False)
+        print(f"{args.rows} claims, {os.path.getsize(csv_path) / 2**20:.0f} MiB CSV")
+
+        print(f"{'method':>20} {'seconds':>9} {'peak MiB':>9}")
+        elapsed, peak = _measure(in_memory, csv_path, out_path, None)
+        print(f"{'load + compute':>20} {elapsed:>9.2f} {peak:>9.1f}")
+        for chunk_rows in args.chunk_rows:
+            elapsed, peak = _measure(streamed, csv_path, out_path, chunk_rows)
+            print(f"{f'stream {chunk_rows}':>20} {elapsed:>9.2f} {peak:>9.1f}")
+
+        if args.rows <= args.check_max_rows:
+            chunk_rows = args.chunk_rows[0]
+            expected = create_fraud_features(pd.read_csv(csv_path, parse_dates=DATES))
+            got = pd.concat(stream_fraud_features(lambda: pd.read_csv(csv_path, parse_dates=DATES, chunksize=chunk_rows)))
+            pd.testing.assert_frame_equal(expected, got, check_exact=False, rtol=1e-9)
+            print("streamed features match the in-memory ones")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Benchmark scoring feature assembly: 26 chained merges vs one lookup per tmean table.
+
+    python benchmarks/bench_features.py --sizes 10000 100000 500000
+
+Reports wall time and tracemalloc peak for each path and checks that both
+produce the same X_test matrix.
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from _synthetic import make_claims, secondary_diagnosis_cols
+from tmean import assemble_tmean_features, principal_code_tmean, secondary_code_tmean, secondary_diagnosis_tmean_cols
+
+X_COLS = secondary_diagnosis_tmean_cols + ['PRNCPAL_DGNS_CD_TMEAN']
+
+
+def legacy_assemble(df_claims, df_principal_tmean, df_secondary_tmean, target_col):
+    """The merge chain that used to live in score_total_charge/score_length_of_stay."""
+    df = df_claims[['CLM_ID', 'PRNCPAL_DGNS_CD', target_col] + secondary_diagnosis_cols].copy()
+    df = df.merge(df_principal_tmean, how='left', left_on='PRNCPAL_DGNS_CD', right_on='PRNCPAL_DGNS_CD')
+    for i, col in enumerate(secondary_diagnosis_cols):
+        df = df.merge(
+            df_secondary_tmean.rename(columns={'SECONDARY_DGNS_CD': f'_SECONDARY_DGNS_CD{i}'}),
+            how='left', left_on=col, right_on=f'_SECONDARY_DGNS_CD{i}',
+        ).rename(columns={'SECONDARY_DGNS_TMEAN': f'{col}_TMEAN'}).drop(columns=[f'_SECONDARY_DGNS_CD{i}'])
+    return df
+
+
+def _measure(fn, *args):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    out = fn(*args)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, elapsed, peak / 2**20
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 500_000])
+    args = p.parse_args(argv)
+
+    print(f"{'claims':>10} {'merge s':>9} {'merge MiB':>10} {'lookup s':>9} {'lookup MiB':>11}  same X_test")
+    for n in args.sizes:
+        df = make_claims(n)
+        df_principal = principal_code_tmean(df, "CLM_TOT_CHRG_AMT")
+        df_secondary = secondary_code_tmean(df, "CLM_TOT_CHRG_AMT")
+
+        old, t_old, m_old = _measure(legacy_assemble, df, df_principal, df_secondary, "CLM_TOT_CHRG_AMT")
+        new, t_new, m_new = _measure(assemble_tmean_features, df, df_principal, df_secondary, "CLM_TOT_CHRG_AMT")
+        same = np.array_equal(old[X_COLS].to_numpy(), new[X_COLS].to_numpy(), equal_nan=True) and list(old.columns) == list(new.columns)
+        print(f"{n:>10} {t_old:>9.3f} {m_old:>10.1f} {t_new:>9.3f} {m_new:>11.1f}  {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Benchmark compiled-forest inference against sklearn's RandomForestRegressor.predict.
+
+    python benchmarks/bench_forest.py --sizes 1 256 10000 100000 --trees 100
+
+Fits an RF on tmean features of synthetic claims (default: unbounded depth,
+like the notebooks' models), compiles it with server/forest_compile.py, and
+reports per-call latency (median over --repeats calls) and throughput for
+sklearn and each engine, checking that predictions are bit-identical. sklearn
+runs single-threaded (n_jobs=None), as the deployed models do.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+
+from _synthetic import make_claims
+from forest_compile import _compiled_kernel, compile_forest
+from pipeline import feature_cols
+from tmean import ClaimCodes, principal_code_tmean, secondary_code_tmean, tmean_lookups
+
+
+def _features(df, target_col):
+    lookups = tmean_lookups(principal_code_tmean(df, target_col), secondary_code_tmean(df, target_col))
+    tmean = ClaimCodes(df).tmean_matrix(*lookups)
+    # feature_cols order: secondary tmeans, then the principal tmean
+    return pd.DataFrame(np.concatenate([tmean[:, 1:], tmean[:, :1]], axis=1), columns=feature_cols)
+
+
+def _time(fn, X, repeats):
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        out = fn(X)
+        times.append(time.perf_counter() - t0)
+    return out, float(np.median(times))
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--sizes", type=int, nargs="+", default=[1, 256, 10_000, 100_000])
+    p.add_argument("--trees", type=int, default=100)
+    p.add_argument("--max-depth", type=int, default=None)
+    p.add_argument("--train", type=int, default=50_000)
+    p.add_argument("--repeats", type=int, default=5)
+    args = p.parse_args(argv)
+
+    df = make_claims(max(args.train, max(args.sizes)))
+    X_all = _features(df, "CLM_TOT_CHRG_AMT")
+    y_all = df["CLM_TOT_CHRG_AMT"].to_numpy()
+    rf = RandomForestRegressor(n_estimators=args.trees, max_depth=args.max_depth, random_state=0)
+    rf.fit(X_all.iloc[:args.train].fillna(0), y_all[:args.train])
+
+    t0 = time.perf_counter()
+    forest = compile_forest(rf)
+    t_compile = time.perf_counter() - t0
+    engines = {"sklearn": rf.predict, "numpy": lambda X: forest.predict(X, engine="numpy")}
+    if _compiled_kernel() is not None:
+        forest.predict(X_all.iloc[:1])
+        engines["numba"] = lambda X: forest.predict(X, engine="numba")
+    print(f"{args.trees} trees, max depth {forest.max_depth}, {len(forest.feature)} nodes, compiled in {t_compile:.2f}s")
+
+    print(f"{'rows':>8} {'engine':>8} {'ms/call':>10} {'rows/s':>11}  same")
+    for n in args.sizes:
+        X = X_all.iloc[:n]
+        expected = None
+        for name, fn in engines.items():
+            out, seconds = _time(fn, X, args.repeats if n <= 10_000 else 1)
+            expected = out if expected is None else expected
+            print(f"{n:>8} {name:>8} {seconds * 1e3:>10.3f} {n / seconds:>11.0f}  {np.array_equal(out, expected)}")
+
+
+if __name__ == "__main__":
+    main()
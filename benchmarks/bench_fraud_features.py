@@ -0,0 +1,110 @@
+"""Benchmark create_fraud_features: the old copy + merge + sort pipeline vs groupby transforms.
+
+    python benchmarks/bench_fraud_features.py --sizes 100000 1000000 10000000
+
+For each size, builds synthetic claims (make_feature_claims) and times the old
+implementation, create_fraud_features, and create_fraud_features(inplace=True),
+reporting wall time and tracemalloc peak, and checks all three return the same frame.
+tracemalloc slows everything down; use --no-memory for wall times alone.
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from _synthetic import ROOT_DIR, make_feature_claims
+
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from claims_prep.cleaning import detect_amount_column, detect_id_columns  # noqa: E402
+from claims_prep.features import create_fraud_features  # noqa: E402
+
+
+def legacy_create_fraud_features(df, amount_col=None, date_col=None):
+    """create_fraud_features as it was: full copy, three merges and a sort round trip."""
+    df = df.copy()
+    amount_col = amount_col or detect_amount_column(df)
+    if amount_col:
+        df["amount"] = pd.to_numeric(df[amount_col], errors="coerce").fillna(0.0)
+        df["amount_log1p"] = np.log1p(df["amount"].clip(lower=0))
+        df["amount_z"] = (df["amount"] - df["amount"].mean()) / (df["amount"].std() + 1e-9)
+    if date_col is None:
+        date_cols = [c for c in df.columns if pd.api.types.is_datetime64_any_dtype(df[c])]
+        date_col = date_cols[0] if date_cols else None
+    if date_col:
+        df["_claim_dt"] = pd.to_datetime(df[date_col], errors="coerce")
+        df["claim_dayofweek"] = df["_claim_dt"].dt.dayofweek.fillna(-1).astype(int)
+        df["claim_hour"] = df["_claim_dt"].dt.hour.fillna(-1).astype(int)
+    else:
+        df["_claim_dt"] = pd.NaT
+    patient_cols, provider_cols = detect_id_columns(df)
+    patient_col = patient_cols[0] if patient_cols else None
+    provider_col = provider_cols[0] if provider_cols else None
+    if patient_col and "amount" in df.columns:
+        agg = df.groupby(patient_col)["amount"].agg(
+            patient_claim_count="count", patient_total_amount="sum",
+            patient_mean_amount="mean", patient_std_amount="std",
+        )
+        df = df.merge(agg, how="left", left_on=patient_col, right_index=True)
+        if date_col:
+            df = df.sort_values([patient_col, "_claim_dt"])
+            df["prev_dt"] = df.groupby(patient_col)["_claim_dt"].shift(1)
+            df["days_since_prev_claim"] = (df["_claim_dt"] - df["prev_dt"]).dt.days.fillna(-1)
+            df = df.sort_index()
+    if provider_col and "amount" in df.columns:
+        agg_p = df.groupby(provider_col)["amount"].agg(
+            provider_claim_count="count", provider_total_amount="sum", provider_mean_amount="mean",
+        )
+        df = df.merge(agg_p, how="left", left_on=provider_col, right_index=True)
+    code_cols = [c for c in df.columns if pd.api.types.is_string_dtype(df[c]) and any(substr in c for substr in ("dx", "diagnosis", "cpt", "procedure", "hcpcs"))]
+    if code_cols and patient_col:
+        uniq_codes = df.groupby(patient_col)[code_cols].nunique().sum(axis=1).rename("patient_unique_codes")
+        df = df.merge(uniq_codes, how="left", left_on=patient_col, right_index=True)
+    for f in ["amount", "amount_log1p", "amount_z", "patient_claim_count", "patient_total_amount",
+              "patient_mean_amount", "patient_std_amount", "provider_claim_count", "provider_total_amount",
+              "provider_mean_amount", "days_since_prev_claim", "patient_unique_codes"]:
+        if f in df.columns:
+            df[f] = pd.to_numeric(df[f], errors="coerce").fillna(0.0)
+    return df
+
+
+def _measure(fn, df, memory):
+    if memory:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    out = fn(df)
+    elapsed = time.perf_counter() - t0
+    peak = 0.0
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return out, elapsed, peak
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000, 10_000_000])
+    p.add_argument("--no-memory", action="store_true", help="skip tracemalloc")
+    args = p.parse_args(argv)
+    memory = not args.no_memory
+
+    print(f"{'claims':>10} {'method':>10} {'seconds':>9} {'peak MiB':>9} {'speedup':>8}  same")
+    for n in args.sizes:
+        df = make_feature_claims(n)
+        expected, t_legacy, m_legacy = _measure(legacy_create_fraud_features, df, memory)
+        print(f"{n:>10} {'legacy':>10} {t_legacy:>9.2f} {m_legacy:>9.1f} {1:>7.1f}x")
+        for name, fn, source in [("transform", create_fraud_features, df),
+                                 ("inplace", lambda d: create_fraud_features(d, inplace=True), df.copy())]:
+            out, elapsed, peak = _measure(fn, source, memory)
+            same = out.equals(expected)
+            print(f"{n:>10} {name:>10} {elapsed:>9.2f} {peak:>9.1f} {t_legacy / elapsed:>7.1f}x  {same}")
+            del out
+        del df, expected, source
+
+
+if __name__ == "__main__":
+    main()
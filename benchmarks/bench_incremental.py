@@ -0,0 +1,96 @@
+"""Benchmark "score only new claims" selection as scored history grows.
+
+    python benchmarks/bench_incremental.py --history 100000 1000000 5000000 --new 1000
+
+For each history size, builds a DB whose claims_dedup rows all already have a
+prediction in the narrow predictions table, appends --new claims, and times the
+old NOT IN query against the selection score_models uses: read_claims_since from
+the model's watermark, then unscored_claims_mask (one CLM_ID range lookup on the
+predictions primary key).
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import _synthetic  # noqa: F401  (puts server/ on sys.path)
+from claims_access import read_claims_since
+from incremental import ensure_clm_id_index, set_watermark, unscored_claims_mask
+from predictions import model_id
+
+MODEL = "bench"
+COLUMNS = ["CLM_ID", "PRNCPAL_DGNS_CD", "CLM_TOT_CHRG_AMT"]
+
+
+def _build(db_path, n_history):
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE claims_dedup (CLM_ID INTEGER, PRNCPAL_DGNS_CD TEXT, CLM_TOT_CHRG_AMT INTEGER);")
+    ensure_clm_id_index(conn, "claims_dedup", unique=True)
+    bench_id = model_id(conn, MODEL)
+    rng = np.random.default_rng(0)
+    step = 500_000
+    for start in range(0, n_history, step):
+        ids = np.arange(start, min(start + step, n_history), dtype=np.int64)
+        amounts = rng.integers(500, 250_000, size=len(ids))
+        conn.executemany("INSERT INTO claims_dedup VALUES (?, 'A00001', ?);", zip(ids.tolist(), amounts.tolist()))
+        conn.executemany("INSERT INTO predictions (CLM_ID, model_id, model_version, pred, diff_score) "
+                         "VALUES (?, ?, 'v1', 0.0, 0.0);", ((i, bench_id) for i in ids.tolist()))
+    conn.commit()
+    return conn
+
+
+def _append_new(conn, n_history, n_new):
+    ids = range(n_history, n_history + n_new)
+    conn.executemany("INSERT INTO claims_dedup VALUES (?, 'A00001', 1000);", ((i,) for i in ids))
+    conn.commit()
+
+
+def legacy_select(conn):
+    return pd.read_sql_query("""
+        SELECT *
+        FROM claims_dedup
+        WHERE claims_dedup.CLM_ID NOT IN (
+            SELECT CLM_ID FROM predictions
+        )
+        GROUP BY claims_dedup.CLM_ID;
+    """, conn)
+
+
+def watermark_select(conn, last_rowid):
+    df_claims = read_claims_since(conn, last_rowid, COLUMNS)
+    return df_claims[unscored_claims_mask(conn, df_claims, MODEL, "v1")]
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--history", type=int, nargs="+", default=[100_000, 1_000_000, 5_000_000])
+    p.add_argument("--new", type=int, default=1_000)
+    args = p.parse_args(argv)
+
+    print(f"{'scored':>10} {'new':>6} {'NOT IN s':>9} {'watermark s':>12} {'rows':>6}")
+    for n_history in args.history:
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = _build(os.path.join(tmp, "bench.db"), n_history)
+            _append_new(conn, n_history, args.new)
+
+            t0 = time.perf_counter()
+            old = legacy_select(conn)
+            t_old = time.perf_counter() - t0
+
+            # the watermark sits at the end of history
+            set_watermark(conn, MODEL, "claims_dedup", n_history, "v1")
+
+            t0 = time.perf_counter()
+            new = watermark_select(conn, n_history)
+            t_new = time.perf_counter() - t0
+            assert len(old) == len(new) == args.new
+            print(f"{n_history:>10} {args.new:>6} {t_old:>9.3f} {t_new:>12.4f} {len(new):>6}")
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark sqlite ingestion rows/sec: per-chunk DataFrame.to_sql vs bulk_load.
+
+    python benchmarks/bench_ingest_bulk.py --files 4 --rows 250000 --chunk-size 100000
+
+Writes one synthetic dataset directory, ingests it into a new DB with each mode
+(and into an existing DB, which bulk_load fills in WAL mode), and checks that the
+tables hold the same rows.
+"""
+import argparse
+import hashlib
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from _synthetic import ROOT_DIR, make_claims
+
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from claims_prep.db import create_sqlite_db_from_dir  # noqa: E402
+
+
+def _db_digest(db_path):
+    digest = hashlib.sha256()
+    conn = sqlite3.connect(db_path)
+    try:
+        for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name;"):
+            for row in conn.execute(f'SELECT * FROM "{name}" ORDER BY rowid;'):
+                digest.update(repr(row).encode("utf-8"))
+    finally:
+        conn.close()
+    return digest.hexdigest()
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--files", type=int, default=4)
+    p.add_argument("--rows", type=int, default=250_000, help="Claims per CSV file")
+    p.add_argument("--chunk-size", type=int, default=100_000)
+    p.add_argument("--no-preprocess", action="store_true")
+    p.add_argument("--dir", default=None, help="Scratch directory; journaling and fsync costs only show on a real disk, not tmpfs")
+    args = p.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        data_dir = Path(tmp) / "data"
+        data_dir.mkdir()
+        for f in range(args.files):
+            make_claims(args.rows, seed=f).to_csv(data_dir / f"claims_part{f}.csv", index=False)
+        total_rows = args.files * args.rows
+
+        runs = [
+            ("to_sql", dict(bulk_load=False), False),
+            ("bulk_load (new DB)", dict(bulk_load=True), False),
+            ("bulk_load (existing DB)", dict(bulk_load=True), True),
+        ]
+        reference = None
+        baseline = None
+        print(f"{'mode':<24} {'seconds':>9} {'rows/s':>11} {'speedup':>8}  identical")
+        for i, (label, kwargs, existing) in enumerate(runs):
+            db_path = Path(tmp) / f"run{i}.db"
+            if existing:
+                sqlite3.connect(db_path).execute("CREATE TABLE other (x INTEGER);").connection.close()
+            t0 = time.perf_counter()
+            create_sqlite_db_from_dir(data_dir, db_path, chunk_size=args.chunk_size,
+                                      preprocess=not args.no_preprocess, **kwargs)
+            elapsed = time.perf_counter() - t0
+
+            if existing:
+                conn = sqlite3.connect(db_path)
+                conn.execute("DROP TABLE other;")
+                conn.close()
+            digest = _db_digest(db_path)
+            if reference is None:
+                reference, baseline = digest, elapsed
+            print(f"{label:<24} {elapsed:>9.2f} {total_rows / elapsed:>11,.0f} {baseline / elapsed:>7.2f}x  "
+                  f"{digest == reference}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark building per-dataset sqlite DBs serially vs with --workers.
+
+    python benchmarks/bench_ingest_parallel.py --datasets 16 --files 3 --rows 50000 --workers 1 2 4 8
+
+Writes --datasets synthetic dataset directories of --files CSVs each, runs
+create_sqlite_databases_for_data_root once per --workers value, and checks that
+every run produced byte-for-byte the same table contents as the serial one.
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from _synthetic import ROOT_DIR, make_claims
+
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from claims_prep.db import create_sqlite_databases_for_data_root  # noqa: E402
+
+
+def _write_datasets(root, n_datasets, n_files, n_rows):
+    for d in range(n_datasets):
+        dataset_dir = root / f"dataset{d:03d}"
+        dataset_dir.mkdir(parents=True)
+        for f in range(n_files):
+            df = make_claims(n_rows, seed=d * n_files + f)
+            df.to_csv(dataset_dir / f"claims_part{f}.csv", index=False)
+
+
+def _db_digest(db_path):
+    """Hash of every table's schema and rows in rowid order."""
+    digest = hashlib.sha256()
+    conn = sqlite3.connect(db_path)
+    try:
+        for name, sql in conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table' ORDER BY name;"):
+            digest.update(sql.encode("utf-8"))
+            for row in conn.execute(f'SELECT * FROM "{name}" ORDER BY rowid;'):
+                digest.update(repr(row).encode("utf-8"))
+    finally:
+        conn.close()
+    return digest.hexdigest()
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--datasets", type=int, default=16)
+    p.add_argument("--files", type=int, default=3, help="CSV files per dataset")
+    p.add_argument("--rows", type=int, default=50_000, help="Claims per CSV file")
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    args = p.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_root = Path(tmp) / "data"
+        t0 = time.perf_counter()
+        _write_datasets(data_root, args.datasets, args.files, args.rows)
+        total_rows = args.datasets * args.files * args.rows
+        print(f"wrote {args.datasets} datasets x {args.files} files x {args.rows} rows "
+              f"in {time.perf_counter() - t0:.1f}s")
+
+        reference = None
+        baseline = None
+        print(f"{'workers':>8} {'seconds':>9} {'rows/s':>11} {'speedup':>8}  identical")
+        for workers in args.workers:
+            databases_dir = Path(tmp) / f"databases_w{workers}"
+            t0 = time.perf_counter()
+            created = create_sqlite_databases_for_data_root(data_root, databases_dir, workers=workers)
+            elapsed = time.perf_counter() - t0
+
+            digests = [_db_digest(db) for db in created]
+            if reference is None:
+                reference, baseline = digests, elapsed
+            print(f"{workers:>8} {elapsed:>9.2f} {total_rows / elapsed:>11,.0f} {baseline / elapsed:>7.2f}x  "
+                  f"{digests == reference}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Benchmark the tabulated residual isolation forest against IsolationForest.decision_function.
+
+    python benchmarks/bench_iso_lookup.py --sizes 1 256 10000 1000000
+    python benchmarks/bench_iso_lookup.py --model server/models/iso_diff-total-charge.pkl
+
+Fits an IsolationForest on synthetic 1-D residuals (or loads --model), compiles it
+with server/forest_compile.compile_iso_lookup (which runs the exactness check), and
+reports per-call time for both at each batch size, checking the scores are identical.
+"""
+import argparse
+import time
+
+import joblib
+import numpy as np
+from sklearn.ensemble import IsolationForest
+
+import _synthetic  # noqa: F401  (puts server/ on sys.path)
+from forest_compile import compile_iso_lookup
+
+
+def _time(fn, x, repeats):
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        out = fn(x)
+        times.append(time.perf_counter() - t0)
+    return out, float(np.median(times))
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--sizes", type=int, nargs="+", default=[1, 256, 10_000, 1_000_000])
+    p.add_argument("--model", help="iso_diff-*.pkl artifact to use instead of a synthetic fit")
+    p.add_argument("--repeats", type=int, default=5)
+    args = p.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    if args.model:
+        iso = joblib.load(args.model)
+    else:
+        # heavy-tailed residuals, like actual minus predicted charges
+        iso = IsolationForest(random_state=0).fit(rng.standard_t(3, size=(100_000, 1)) * 20_000)
+
+    t0 = time.perf_counter()
+    lookup = compile_iso_lookup(iso)
+    t_compile = time.perf_counter() - t0
+    print(f"{len(lookup.breakpoints)} breakpoints, compiled and verified in {t_compile:.2f}s")
+
+    span = float(np.abs(lookup.breakpoints).max())
+    print(f"{'rows':>9} {'sklearn ms':>11} {'lookup ms':>10} {'speedup':>8}  same")
+    for n in args.sizes:
+        x = rng.uniform(-1.5 * span, 1.5 * span, size=n)
+        repeats = args.repeats if n <= 10_000 else 1
+        expected, t_sklearn = _time(lambda v: iso.decision_function(v.reshape(-1, 1)), x, repeats)
+        actual, t_lookup = _time(lookup.decision_function, x, repeats)
+        print(f"{n:>9} {t_sklearn * 1e3:>11.3f} {t_lookup * 1e3:>10.3f} {t_sklearn / t_lookup:>8.0f}  {np.array_equal(expected, actual)}")
+
+
+if __name__ == "__main__":
+    main()
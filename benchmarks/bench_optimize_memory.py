@@ -0,0 +1,81 @@
+"""Benchmark optimize_memory against downcast_numeric on synthetic claims.
+
+    python benchmarks/bench_optimize_memory.py --claims 1000000 --arrow-strings
+
+Builds synthetic claims (make_claims, with code and date columns as plain Python
+strings) plus the flag columns CMS extracts carry: a Y/N indicator, a 0/1 indicator
+and a whole-number count with missing values. Reports the deep memory of the frame
+after downcast_numeric and after optimize_memory, the time each takes, and
+optimize_memory's per-column report. Every column is checked to round-trip to the
+original values.
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from _synthetic import ROOT_DIR, make_claims
+
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from claims_prep.cleaning import downcast_numeric, optimize_memory  # noqa: E402
+
+
+def _claims_with_flags(n: int) -> pd.DataFrame:
+    df = make_claims(n).astype(object)
+    rng = np.random.default_rng(1)
+    df["CLM_ID"] = df["CLM_ID"].astype(np.int64)
+    df["CLM_TOT_CHRG_AMT"] = df["CLM_TOT_CHRG_AMT"].astype(np.float64)
+    df["CLM_NUM_DAYS"] = df["CLM_NUM_DAYS"].astype(np.int64)
+    df["NCH_BENE_DSCHRG_IND"] = pd.Series(rng.choice(["Y", "N"], size=n), dtype=object)
+    df["CLM_MDCR_NON_PMT_IND"] = rng.integers(0, 2, size=n)
+    df["CLM_UTLZTN_DAY_CNT"] = np.where(rng.random(n) < 0.1, np.nan, rng.integers(0, 120, size=n))
+    return df
+
+
+def _mib(df):
+    return df.memory_usage(deep=True, index=False).sum() / 2**20
+
+
+def _same_values(original, optimized):
+    for c in original.columns:
+        a, b = original[c], optimized[c]
+        if c == "NCH_BENE_DSCHRG_IND":
+            b = b.map({True: "Y", False: "N"})
+        if pd.api.types.is_numeric_dtype(a) and not pd.api.types.is_bool_dtype(b):
+            if not np.allclose(a.astype(float), b.astype(float), rtol=1e-6, equal_nan=True):
+                return False
+        elif not a.astype(object).where(a.notna(), None).equals(b.astype(object).where(b.notna(), None)):
+            return False
+    return True
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--claims", type=int, default=1_000_000)
+    p.add_argument("--arrow-strings", action="store_true", help="also store the remaining text columns in pyarrow")
+    args = p.parse_args(argv)
+
+    df = _claims_with_flags(args.claims)
+    print(f"{args.claims} claims, {df.shape[1]} columns: {_mib(df):.1f} MiB as loaded")
+
+    t0 = time.perf_counter()
+    downcast = downcast_numeric(df.copy())
+    t_downcast = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    optimized, report = optimize_memory(df.copy(), arrow_strings=args.arrow_strings)
+    t_optimize = time.perf_counter() - t0
+
+    print(f"{'method':>16} {'MiB':>9} {'seconds':>8}")
+    print(f"{'downcast_numeric':>16} {_mib(downcast):>9.1f} {t_downcast:>8.2f}")
+    print(f"{'optimize_memory':>16} {_mib(optimized):>9.1f} {t_optimize:>8.2f}")
+    print(f"same values: {_same_values(df, optimized)}")
+    report = report.assign(MiB_before=report["bytes_before"] / 2**20, MiB_after=report["bytes_after"] / 2**20)
+    print(report[["dtype_before", "dtype_after", "conversion", "MiB_before", "MiB_after"]].round(2).to_string())
+
+
+if __name__ == "__main__":
+    main()
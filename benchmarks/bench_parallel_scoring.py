@@ -0,0 +1,136 @@
+"""Benchmark cold multi-model scoring throughput against the number of worker processes.
+
+    python benchmarks/bench_parallel_scoring.py --claims 500000 --workers 1 2 4 8 16 32
+
+Fits two stand-in models (an RF on the 26 tmean features plus a residual isolation
+forest, like the deployed ones) on synthetic claims and builds a database with their
+tmean tables. Each pool size then scores a fresh copy of that database with
+server/pipeline.score_models in a new process, so the time includes what a cold
+server run pays: loading and compiling the models and starting the pool. The stored
+predictions are checked against the first run's. Speedup is relative to that run.
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest, RandomForestRegressor
+
+from _synthetic import make_claims
+from claims_access import materialize_claims_dedup
+from LengthOfState_rf_tmean import length_of_stay_model
+from pipeline import ModelSpec, feature_cols, init_model_tables, score_models
+from sqlite import init_fraud_table
+from tmean import ClaimCodes, principal_code_tmean, secondary_code_tmean, tmean_lookups
+
+
+def _specs(model_dir):
+    los = length_of_stay_model
+    return [
+        ModelSpec("length-of-stay", "CLM_NUM_DAYS", os.path.join(model_dir, "rf-length-of-stay.pkl"),
+                  os.path.join(model_dir, "iso-length-of-stay.pkl"), "bench_los_predictions",
+                  "bench_los_principal_tmean", "bench_los_secondary_tmean",
+                  source_cols=los.source_cols, target=los.target, target_sql=los.target_sql),
+        ModelSpec("total-charge", "CLM_TOT_CHRG_AMT", os.path.join(model_dir, "rf-total-charge.pkl"),
+                  os.path.join(model_dir, "iso-total-charge.pkl"), "bench_charge_predictions",
+                  "bench_charge_principal_tmean", "bench_charge_secondary_tmean"),
+    ]
+
+
+def _fit(spec, df, codes, n_trees):
+    lookups = tmean_lookups(principal_code_tmean(df, spec.target_col), secondary_code_tmean(df, spec.target_col))
+    tmean = codes.tmean_matrix(*lookups)
+    # feature_cols order: secondary tmeans, then the principal tmean
+    X = pd.DataFrame(np.concatenate([tmean[:, 1:], tmean[:, :1]], axis=1), columns=feature_cols)
+    target = df[spec.target_col].to_numpy(dtype=np.float64)
+
+    sample = slice(0, min(len(target), 20_000))
+    rf = RandomForestRegressor(n_estimators=n_trees, max_depth=12, random_state=0)
+    rf.fit(X[sample], target[sample])
+    iso = IsolationForest(random_state=0)
+    iso.fit((target[sample] - rf.predict(X[sample])).reshape(-1, 1))
+    joblib.dump(rf, spec.rf_model_path)
+    joblib.dump(iso, spec.iso_model_path)
+
+
+def _build(db_path, model_dir, n_claims, n_trees):
+    df = make_claims(n_claims)
+    codes = ClaimCodes(df)
+    specs = _specs(model_dir)
+    for spec in specs:
+        _fit(spec, df, codes, n_trees)
+
+    conn = sqlite3.connect(db_path)
+    df.drop(columns="CLM_NUM_DAYS").to_sql("cms_claims", conn, index=False)
+    conn.close()
+    init_fraud_table(db_path)
+    conn = sqlite3.connect(db_path)
+    materialize_claims_dedup(conn)
+    for spec in specs:
+        init_model_tables(conn, spec)
+    conn.close()
+
+
+def _score(db_path, model_dir, workers):
+    """Score in this (fresh) process and print the seconds score_models took."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        t0 = time.perf_counter()
+        score_models(db_path, _specs(model_dir), workers=workers)
+        elapsed = time.perf_counter() - t0
+    print(elapsed)
+
+
+def _predictions(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT model_id, CLM_ID, pred, diff_score FROM predictions ORDER BY model_id, CLM_ID;")
+    predictions = np.array(rows.fetchall(), dtype=np.float64)
+    conn.close()
+    return predictions
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--claims", type=int, default=500_000)
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    p.add_argument("--trees", type=int, default=100)
+    # internal: score one database copy in a child process
+    p.add_argument("--score", nargs=3, metavar=("DB", "MODEL_DIR", "WORKERS"), help=argparse.SUPPRESS)
+    args = p.parse_args(argv)
+
+    if args.score:
+        db_path, model_dir, workers = args.score
+        _score(db_path, model_dir, int(workers))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base_db = os.path.join(tmp, "base.db")
+        with contextlib.redirect_stdout(io.StringIO()):
+            _build(base_db, tmp, args.claims, args.trees)
+
+        print(f"{os.cpu_count()} CPUs, {args.claims} claims, 2 models of {args.trees} trees")
+        print(f"{'workers':>8} {'seconds':>9} {'claims/s':>10} {'speedup':>8}  same")
+        base = expected = None
+        for workers in args.workers:
+            db_path = os.path.join(tmp, f"workers-{workers}.db")
+            shutil.copyfile(base_db, db_path)
+            child = subprocess.run([sys.executable, __file__, "--score", db_path, tmp, str(workers)],
+                                   check=True, capture_output=True, text=True)
+            elapsed = float(child.stdout.split()[-1])
+            base = base or elapsed
+            predictions = _predictions(db_path)
+            expected = predictions if expected is None else expected
+            same = np.array_equal(predictions, expected)
+            print(f"{workers:>8} {elapsed:>9.2f} {args.claims / elapsed:>10.0f} {base / elapsed:>8.2f}  {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Benchmark prediction storage: the old 57-column wide table vs the narrow layout.
+
+    python benchmarks/bench_prediction_storage.py --claims 1000000 --batch 50000
+
+Appends the same scored batches for one model to a fresh DB in each layout and
+reports append throughput and the DB size they add. The narrow layout writes the
+(CLM_ID, model_id, model_version, pred, diff_score) rows plus one compressed
+feature snapshot per batch (server/predictions.py); claims_dedup, which both
+layouts need anyway, is not counted.
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+
+from _synthetic import make_claims, secondary_diagnosis_cols
+from pipeline import ModelSpec
+from predictions import write_predictions
+from tmean import ClaimCodes, principal_code_tmean, secondary_code_tmean, secondary_diagnosis_tmean_cols, tmean_lookups
+
+TARGET = "CLM_TOT_CHRG_AMT"
+SPEC = ModelSpec("bench", TARGET, None, None, "bench_predictions", "bench_principal_tmean", "bench_secondary_tmean")
+
+
+def _scored_frame(n):
+    df = make_claims(n)
+    lookups = tmean_lookups(principal_code_tmean(df, TARGET), secondary_code_tmean(df, TARGET))
+    tmean = ClaimCodes(df).tmean_matrix(*lookups)
+    scored = df[["CLM_ID", "PRNCPAL_DGNS_CD", TARGET] + secondary_diagnosis_cols].copy()
+    scored["PRNCPAL_DGNS_CD_TMEAN"] = tmean[:, 0]
+    scored[secondary_diagnosis_tmean_cols] = tmean[:, 1:]
+    rng = np.random.default_rng(1)
+    scored[SPEC.pred_col] = scored[TARGET] * rng.uniform(0.5, 1.5, n)
+    scored[SPEC.diff_col] = rng.uniform(-0.5, 0.5, n)
+    return scored
+
+
+def legacy_create(conn):
+    """The wide table init_prediction_table used to create."""
+    columns = (
+        [("CLM_ID", "INTEGER"), ("PRNCPAL_DGNS_CD", "TEXT"), (TARGET, "INTEGER")]
+        + [(c, "TEXT") for c in secondary_diagnosis_cols]
+        + [(c, "REAL") for c in ["PRNCPAL_DGNS_CD_TMEAN"] + secondary_diagnosis_tmean_cols]
+        + [(SPEC.pred_col, "REAL"), (SPEC.diff_col, "REAL")]
+    )
+    body = ", ".join(f'"{name}" {sql_type}' for name, sql_type in columns)
+    conn.execute(f'CREATE TABLE "{SPEC.predictions_table}" ({body});')
+    conn.execute(f'CREATE UNIQUE INDEX "idx_{SPEC.predictions_table}_clm_id" ON "{SPEC.predictions_table}" (CLM_ID);')
+
+
+def legacy_append(conn, batch):
+    batch.to_sql(SPEC.predictions_table, conn, if_exists="append", index=False)
+
+
+def narrow_append(conn, batch):
+    write_predictions(conn, SPEC, batch, "v1")
+
+
+def _db_bytes(conn):
+    page_count = conn.execute("PRAGMA page_count;").fetchone()[0]
+    return page_count * conn.execute("PRAGMA page_size;").fetchone()[0]
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--claims", type=int, default=1_000_000)
+    p.add_argument("--batch", type=int, default=50_000)
+    args = p.parse_args(argv)
+
+    scored = _scored_frame(args.claims)
+    batches = [scored.iloc[i:i + args.batch] for i in range(0, len(scored), args.batch)]
+
+    print(f"{args.claims} claims in batches of {args.batch}")
+    print(f"{'layout':>8} {'seconds':>9} {'rows/s':>10} {'MiB':>8} {'bytes/claim':>12}")
+    for name, create, append in [("wide", legacy_create, legacy_append), ("narrow", None, narrow_append)]:
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = sqlite3.connect(os.path.join(tmp, "bench.db"))
+            if create is not None:
+                create(conn)
+                conn.commit()
+            else:
+                write_predictions(conn, SPEC, scored.iloc[:0], "v1")
+            base = _db_bytes(conn)
+
+            t0 = time.perf_counter()
+            for batch in batches:
+                append(conn, batch)
+            elapsed = time.perf_counter() - t0
+
+            added = _db_bytes(conn) - base
+            conn.close()
+            print(f"{name:>8} {elapsed:>9.2f} {args.claims / elapsed:>10.0f} {added / 2**20:>8.1f} {added / args.claims:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Benchmark the secondary-diagnosis target-mean builder against the old per-code loop.
+
+    python benchmarks/bench_tmean.py --sizes 10000 100000 1000000
+
+The legacy loop is O(unique_codes x rows x 25); above --legacy-max-rows it is skipped
+and only the vectorized timing is reported.
+"""
+import argparse
+import time
+
+import pandas as pd
+
+from _synthetic import make_claims, secondary_diagnosis_cols
+from tmean import secondary_code_tmean
+
+
+def legacy_secondary_code_tmean(df, target_col):
+    """The loop that used to live in init_*secondary_dgns_cd_tmean_table."""
+    all_secondary_codes = pd.unique(df[secondary_diagnosis_cols].values.ravel())
+    secondary_code_tmean = {}
+    for code in all_secondary_codes:
+        if pd.isna(code) or code == 'None':
+            continue
+        mask = (df[secondary_diagnosis_cols] == code).any(axis=1)
+        secondary_code_tmean[code] = df.loc[mask, target_col].mean()
+    return pd.DataFrame(list(secondary_code_tmean.items()), columns=['SECONDARY_DGNS_CD', 'SECONDARY_DGNS_TMEAN'])
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    p.add_argument("--n-codes", type=int, default=5_000)
+    p.add_argument("--legacy-max-rows", type=int, default=100_000, help="Skip the legacy loop above this many claims")
+    args = p.parse_args(argv)
+
+    print(f"{'claims':>10} {'codes':>7} {'legacy s':>10} {'vector s':>10} {'speedup':>8}  identical")
+    for n in args.sizes:
+        df = make_claims(n, n_codes=args.n_codes)
+
+        t0 = time.perf_counter()
+        new = secondary_code_tmean(df, "CLM_TOT_CHRG_AMT")
+        t_new = time.perf_counter() - t0
+
+        if n <= args.legacy_max_rows:
+            t0 = time.perf_counter()
+            old = legacy_secondary_code_tmean(df, "CLM_TOT_CHRG_AMT")
+            t_old = time.perf_counter() - t0
+            identical = old.equals(new)
+            print(f"{n:>10} {len(new):>7} {t_old:>10.3f} {t_new:>10.3f} {t_old / t_new:>7.1f}x  {identical}")
+        else:
+            print(f"{n:>10} {len(new):>7} {'skipped':>10} {t_new:>10.3f} {'-':>8}  -")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Benchmark building the tmean tables from SQLite in one read vs streamed chunks.
+
+    python benchmarks/bench_tmean_chunked.py --claims 1000000 --chunk-rows 50000 250000
+
+Writes synthetic claims to a temporary claims_dedup, then builds both tmean tables
+by reading every claim into one DataFrame (the old init_model_tables) and by
+streaming chunks into server/tmean.chunked_code_tmeans. Reports wall time and the
+peak Python heap tracemalloc sees (NumPy and pandas buffers included), and checks
+the tables are identical, for the whole-number charges and for a fractional
+charge per day. tracemalloc slows both methods alike, so compare the times with
+each other only.
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+from _synthetic import make_claims, secondary_diagnosis_cols
+from claims_access import read_claims
+from tmean import chunked_code_tmeans, principal_code_tmean, secondary_code_tmean
+
+TARGET = "CLM_TOT_CHRG_AMT"
+# fractional, so the sums round: the chunked tables must still match exactly
+FRACTIONAL_TARGET = "CHRG_PER_DAY"
+COLUMNS = ["CLM_ID", "PRNCPAL_DGNS_CD", TARGET, FRACTIONAL_TARGET] + secondary_diagnosis_cols
+
+
+def in_memory(conn, target, chunk_rows):
+    df = read_claims(conn, COLUMNS)
+    return principal_code_tmean(df, target), secondary_code_tmean(df, target)
+
+
+def chunked(conn, target, chunk_rows):
+    return chunked_code_tmeans(read_claims(conn, COLUMNS, chunk_rows=chunk_rows), target)
+
+
+def _measure(fn, conn, chunk_rows):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    out = fn(conn, TARGET, chunk_rows)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, elapsed, peak
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--claims", type=int, default=1_000_000)
+    p.add_argument("--chunk-rows", type=int, nargs="+", default=[50_000, 250_000])
+    args = p.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "bench.db"))
+        df = make_claims(args.claims)
+        df[FRACTIONAL_TARGET] = df[TARGET] / (df["CLM_NUM_DAYS"] + 1)
+        df[COLUMNS].to_sql("claims_dedup", conn, index=False)
+        conn.execute("CREATE UNIQUE INDEX idx_claims_dedup_clm_id ON claims_dedup (CLM_ID);")
+        conn.commit()
+
+        print(f"{args.claims} claims")
+        print(f"{'method':>16} {'seconds':>9} {'peak MiB':>9}  identical  fractional")
+        expected, elapsed, peak = _measure(in_memory, conn, None)
+        expected_fractional = in_memory(conn, FRACTIONAL_TARGET, None)
+        print(f"{'one read':>16} {elapsed:>9.2f} {peak / 2**20:>9.1f}  {'-':>9}  {'-':>10}")
+        for chunk_rows in args.chunk_rows:
+            out, elapsed, peak = _measure(chunked, conn, chunk_rows)
+            identical = all(a.equals(b) for a, b in zip(expected, out))
+            out = chunked(conn, FRACTIONAL_TARGET, chunk_rows)
+            fractional = all(a.equals(b) for a, b in zip(expected_fractional, out))
+            print(f"{f'chunks of {chunk_rows}':>16} {elapsed:>9.2f} {peak / 2**20:>9.1f}  {identical!s:>9}  {fractional!s:>10}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Benchmark updating the tmean tables with a new batch vs rebuilding them from every claim.
+
+    python benchmarks/bench_tmean_update.py --claims 1000000 --batches 1000 10000 100000
+
+Loads synthetic claims into a temporary claims_dedup and builds one model's tmean
+statistics (server/tmean_stats.py). Then, for each batch size, appends that many new
+claims and times update_model_tables (reads only the new rows) against a full rebuild
+of the same tables, checking both give identical tmean tables, for the whole-number
+charges and for a fractional charge per day.
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+import pandas as pd
+
+from _synthetic import make_claims, secondary_diagnosis_cols
+from incremental import set_watermark
+from pipeline import ModelSpec
+from tmean_stats import tmean_watermark_name, update_model_tables
+
+TARGET = "CLM_TOT_CHRG_AMT"
+# fractional, so the sums round: updated tables must still match a rebuild exactly
+FRACTIONAL_TARGET = "CHRG_PER_DAY"
+COLUMNS = ["CLM_ID", "PRNCPAL_DGNS_CD", TARGET, FRACTIONAL_TARGET, "CLM_FROM_DT"] + secondary_diagnosis_cols
+SPEC = ModelSpec("bench", TARGET, None, None, "bench_predictions", "bench_principal_tmean", "bench_secondary_tmean")
+FRACTIONAL_SPEC = ModelSpec("bench-fractional", FRACTIONAL_TARGET, None, None, "bench_fractional_predictions",
+                            "bench_fractional_principal_tmean", "bench_fractional_secondary_tmean")
+
+
+def _tables(conn, spec):
+    return [pd.read_sql_query(f'SELECT * FROM "{t}";', conn) for t in (spec.principal_tmean_table, spec.secondary_tmean_table)]
+
+
+def _rebuild(conn, spec):
+    set_watermark(conn, tmean_watermark_name(spec), "claims_dedup", 0, None)
+    update_model_tables(conn, spec)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--claims", type=int, default=1_000_000)
+    p.add_argument("--batches", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    args = p.parse_args(argv)
+
+    df = make_claims(args.claims + sum(args.batches))
+    df[FRACTIONAL_TARGET] = df[TARGET] / (df["CLM_NUM_DAYS"] + 1)
+    df = df[COLUMNS]
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "bench.db"))
+        df.iloc[:args.claims].to_sql("claims_dedup", conn, index=False)
+        conn.execute("CREATE UNIQUE INDEX idx_claims_dedup_clm_id ON claims_dedup (CLM_ID);")
+        conn.commit()
+        update_model_tables(conn, SPEC)
+        update_model_tables(conn, FRACTIONAL_SPEC)
+
+        print(f"{'claims':>10} {'batch':>8} {'update s':>9} {'rebuild s':>10} {'speedup':>8}  identical  fractional")
+        start = args.claims
+        for batch in args.batches:
+            df.iloc[start:start + batch].to_sql("claims_dedup", conn, index=False, if_exists="append")
+            conn.commit()
+            start += batch
+
+            t0 = time.perf_counter()
+            update_model_tables(conn, SPEC)
+            t_update = time.perf_counter() - t0
+            updated = _tables(conn, SPEC)
+
+            t0 = time.perf_counter()
+            _rebuild(conn, SPEC)
+            t_rebuild = time.perf_counter() - t0
+            identical = all(a.equals(b) for a, b in zip(updated, _tables(conn, SPEC)))
+
+            update_model_tables(conn, FRACTIONAL_SPEC)
+            updated = _tables(conn, FRACTIONAL_SPEC)
+            _rebuild(conn, FRACTIONAL_SPEC)
+            fractional = all(a.equals(b) for a, b in zip(updated, _tables(conn, FRACTIONAL_SPEC)))
+            print(f"{start:>10} {batch:>8} {t_update:>9.2f} {t_rebuild:>10.2f} {t_rebuild / t_update:>7.1f}x  "
+                  f"{identical!s:>9}  {fractional!s:>10}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Local load generator for server/service.py.
+
+    python server/service.py --db fraud.db &
+    python benchmarks/load_generator.py --url http://127.0.0.1:8080 --concurrency 32 --requests 5000
+
+Each worker thread posts small batches of synthetic claims and records client-side
+latency; the service's own /metrics snapshot is printed at the end.
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.request
+
+import numpy as np
+
+from _synthetic import make_claims
+
+
+def _post(url, payload):
+    req = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"),
+                                 headers={"Content-Type": "application/json"}, method="POST")
+    with urllib.request.urlopen(req) as resp:
+        return json.loads(resp.read())
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--url", default="http://127.0.0.1:8080")
+    p.add_argument("--concurrency", type=int, default=32)
+    p.add_argument("--requests", type=int, default=2_000, help="Total requests across all workers")
+    p.add_argument("--claims-per-request", type=int, default=1)
+    args = p.parse_args(argv)
+
+    df = make_claims(max(args.requests * args.claims_per_request, 1))
+    df = df.drop(columns=["CLM_NUM_DAYS"]).astype(object).where(df.notna(), None)
+    records = df.to_dict(orient="records")
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    counter = iter(range(args.requests))
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            start = i * args.claims_per_request
+            payload = {"claims": records[start:start + args.claims_per_request]}
+            t0 = time.perf_counter()
+            try:
+                _post(f"{args.url}/score", payload)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    lat_ms = np.array(latencies) * 1000.0
+    print(f"requests ok={len(latencies)} errors={len(errors)} in {elapsed:.2f}s")
+    if len(lat_ms):
+        print(f"client latency ms: p50={np.percentile(lat_ms, 50):.2f} p99={np.percentile(lat_ms, 99):.2f}")
+        print(f"throughput: {len(latencies) / elapsed:.1f} req/s, {len(latencies) * args.claims_per_request / elapsed:.1f} claims/s")
+    if errors:
+        print(f"first error: {errors[0]}")
+
+    with urllib.request.urlopen(f"{args.url}/metrics") as resp:
+        print("service metrics:", json.dumps(json.loads(resp.read())["service"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
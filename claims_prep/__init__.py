@@ -12,14 +12,20 @@ from .cleaning import (
     clean_column_names,
     infer_and_parse_dates,
     downcast_numeric,
+    categorize_columns,
+    optimize_memory,
     detect_amount_column,
     detect_id_columns,
 )
-from .features import create_fraud_features, deidentify_ids
+from .features import create_fraud_features, deidentify_ids, deidentify_id_chunks, IdHasher
+from .feature_stream import stream_fraud_features, write_fraud_features_csv
 from .examples import summarize_claims, example_filters
 from .db import create_sqlite_db_from_dir, read_table, list_db_tables, csv_to_table
 from .demo import demo_create_and_preview
 from .db import create_sqlite_databases_for_data_root
+from .schema import SchemaPlan, infer_schema_plan
+from .columnar import create_parquet_dataset_from_dir, read_parquet_table, sqlite_table_to_parquet
+from .excel import import_excel_to_sqlite
 
 __all__ = [
     "load_csv",
@@ -28,10 +34,16 @@ __all__ = [
     "clean_column_names",
     "infer_and_parse_dates",
     "downcast_numeric",
+    "categorize_columns",
+    "optimize_memory",
     "detect_amount_column",
     "detect_id_columns",
     "create_fraud_features",
     "deidentify_ids",
+    "deidentify_id_chunks",
+    "IdHasher",
+    "stream_fraud_features",
+    "write_fraud_features_csv",
     "summarize_claims",
     "example_filters",
     "create_sqlite_db_from_dir",
@@ -40,4 +52,10 @@ __all__ = [
     "csv_to_table",
     "demo_create_and_preview",
     "create_sqlite_databases_for_data_root",
+    "SchemaPlan",
+    "infer_schema_plan",
+    "create_parquet_dataset_from_dir",
+    "read_parquet_table",
+    "sqlite_table_to_parquet",
+    "import_excel_to_sqlite",
 ]
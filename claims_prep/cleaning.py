@@ -1,28 +1,74 @@
 import re
 import logging
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
 import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+
+DATE_COLUMN_PATTERN = r"date|dt|time"
+_DATE_COLUMN = re.compile(DATE_COLUMN_PATTERN)
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+_UNDERSCORES = re.compile(r"_+")
+
+
+@lru_cache(maxsize=4096)
+def _clean_name(name: str) -> str:
+    name = name.strip().lower()
+    name = _PUNCTUATION.sub("", name)
+    name = _WHITESPACE.sub("_", name)
+    return _UNDERSCORES.sub("_", name)
+
+
+def clean_name(name: str) -> str:
+    """Normalize one column name the way `clean_column_names` does (memoized)."""
+    return _clean_name(str(name))
 
 
 def clean_column_names(df: pd.DataFrame) -> pd.DataFrame:
     """Normalize column names: strip, lowercase, remove punctuation, collapse whitespace to underscores."""
-    def _clean(name: str) -> str:
-        name = str(name).strip().lower()
-        name = re.sub(r"[^\w\s]", "", name)
-        name = re.sub(r"\s+", "_", name)
-        name = re.sub(r"_+", "_", name)
-        return name
-    df = df.rename(columns=_clean)
+    df = df.rename(columns=clean_name)
     logging.info("Cleaned column names")
     return df
 
 
-def infer_and_parse_dates(df: pd.DataFrame) -> pd.DataFrame:
-    """Find columns that look like dates and attempt to parse them in place."""
-    date_cols = [c for c in df.columns if re.search(r"date|dt|time", c)]
+def _date_format(s: pd.Series) -> Optional[str]:
+    """Single strptime format that parses every non-null sampled value, or None."""
+    values = s.dropna().astype(str)
+    if values.empty:
+        return None
+    fmt = guess_datetime_format(values.iloc[0])
+    if fmt is None:
+        return None
+    parsed = pd.to_datetime(values, format=fmt, errors="coerce")
+    return fmt if parsed.notna().all() else None
+
+
+def _parse_dates(s: pd.Series, fmt: Optional[str] = None) -> pd.Series:
+    """
+    `pd.to_datetime(s, format=fmt, errors="coerce")`, parsing each distinct value once.
+
+    Claim date columns repeat a few thousand days over millions of rows, so the column
+    is factorized and only its unique values go through strptime. Without `fmt` pandas
+    guesses the format from the first value.
+    """
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
+    codes, uniques = pd.factorize(s)
+    parsed = pd.to_datetime(uniques, format=fmt, errors="coerce")
+    return pd.Series(parsed.array.take(codes, allow_fill=True), index=s.index, name=s.name)
+
+
+def infer_and_parse_dates(df: pd.DataFrame, sample_rows: int = 10_000) -> pd.DataFrame:
+    """Find columns that look like dates and parse them in place, with the format detected from the first `sample_rows` values."""
+    date_cols = [c for c in df.columns if _DATE_COLUMN.search(c)]
     parsed = []
     for c in date_cols:
         try:
-            df[c] = pd.to_datetime(df[c], errors="coerce", infer_datetime_format=True)
+            df[c] = _parse_dates(df[c], _date_format(df[c].head(sample_rows)))
             parsed.append(c)
         except Exception:
             logging.debug("Could not parse column as date: %s", c)
@@ -42,6 +88,172 @@ def downcast_numeric(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+def categorize_columns(df: pd.DataFrame, columns: Optional[List[str]] = None, max_unique_ratio: float = 0.5) -> pd.DataFrame:
+    """
+    Store repetitive string columns (diagnosis/procedure codes, patient and provider IDs)
+    as pandas `category`: small integer codes plus one copy of each distinct value, so
+    groupbys and joins on them work on integers.
+
+    By default every string column is considered. A column is only converted when its
+    distinct values are at most `max_unique_ratio` of its rows; near-unique columns such
+    as claim IDs would only grow.
+    """
+    if columns is None:
+        columns = [c for c in df.columns if pd.api.types.is_object_dtype(df[c]) or pd.api.types.is_string_dtype(df[c])]
+    converted = []
+    for c in columns:
+        if isinstance(df[c].dtype, pd.CategoricalDtype):
+            continue
+        if df[c].nunique() <= max_unique_ratio * len(df):
+            df[c] = df[c].astype("category")
+            converted.append(c)
+    logging.info("Stored columns as category: %s", converted)
+    return df
+
+
+_YES_NO = {"y": True, "n": False, "yes": True, "no": False}
+_NULLABLE_INTS = ["Int8", "Int16", "Int32", "Int64"]
+MEMORY_REPORT_COLUMNS = ["dtype_before", "dtype_after", "conversion", "bytes_before", "bytes_after"]
+
+
+def _yes_no_map(uniques) -> Optional[dict]:
+    """Value -> bool for a column whose values are all Y/N (or yes/no), else None."""
+    mapping = {}
+    for u in uniques:
+        flag = _YES_NO.get(u.strip().lower()) if isinstance(u, str) else None
+        if flag is None:
+            return None
+        mapping[u] = flag
+    return mapping
+
+
+def _narrowest_int(lo, hi, nullable: bool) -> Optional[str]:
+    """The narrowest (nullable) int dtype holding `lo`..`hi`, or None when none does."""
+    for dtype in _NULLABLE_INTS:
+        info = np.iinfo(dtype.lower())
+        if info.min <= lo and hi <= info.max:
+            return dtype if nullable else dtype.lower()
+    return None
+
+
+def _memory_conversion(s: pd.Series, max_category_ratio: float = 0.5, arrow_strings: bool = False) -> Optional[str]:
+    """The conversion `optimize_memory` picks for a column, or None to leave it as is."""
+    if (isinstance(s.dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(s)
+            or pd.api.types.is_datetime64_any_dtype(s) or pd.api.types.is_timedelta64_dtype(s)):
+        return None
+    if pd.api.types.is_numeric_dtype(s):
+        non_null = s.dropna()
+        if len(non_null) and non_null.isin([0, 1]).all():
+            return "bool"
+        if pd.api.types.is_integer_dtype(s):
+            return "int"
+        if len(non_null) and (non_null == non_null.round()).all() and non_null.abs().max() < 2**63:
+            return "int"
+        return "float"
+    if pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s):
+        uniques = s.unique()
+        uniques = uniques[~pd.isna(uniques)]
+        if 0 < len(uniques) <= 4 and _yes_no_map(uniques) is not None:
+            return "bool"
+        if len(uniques) <= max_category_ratio * len(s):
+            return "category"
+        return "string" if arrow_strings else None
+    return None
+
+
+def _convert_for_memory(s: pd.Series, conversion: str, dtype: Optional[str] = None) -> Optional[pd.Series]:
+    """`s` converted (to `dtype` for a pinned int/bool width), or None when the conversion doesn't fit its values."""
+    non_null = s.dropna()
+    has_missing = len(non_null) < len(s)
+    if dtype is not None and has_missing and dtype in ("bool", *(d.lower() for d in _NULLABLE_INTS)):
+        return None
+    if conversion == "bool":
+        if pd.api.types.is_numeric_dtype(s):
+            if not non_null.isin([0, 1]).all():
+                return None
+            return s.astype(dtype or ("boolean" if has_missing else bool))
+        mapping = _yes_no_map(pd.unique(non_null))
+        if mapping is None:
+            return None
+        return s.map(mapping).astype(dtype or ("boolean" if has_missing else bool))
+    if conversion == "int":
+        if not pd.api.types.is_integer_dtype(s):
+            if not pd.api.types.is_numeric_dtype(s) or not (non_null == non_null.round()).all():
+                return None
+        lo, hi = (non_null.min(), non_null.max()) if len(non_null) else (0, 0)
+        if dtype is not None:
+            info = np.iinfo(dtype.lower())
+            return s.astype(dtype) if info.min <= lo and hi <= info.max else None
+        if has_missing or not isinstance(s.dtype, np.dtype):
+            # nullable, in the narrowest width that holds the values
+            dtype = _narrowest_int(lo, hi, nullable=True)
+            return s.astype(dtype) if dtype else None
+        return pd.to_numeric(s.astype(np.int64), downcast="integer")
+    if conversion == "float":
+        return pd.to_numeric(s, downcast="float") if pd.api.types.is_numeric_dtype(s) else None
+    if conversion == "category":
+        return s.astype("category")
+    if conversion == "string":
+        return s.astype("string[pyarrow]")
+    return None
+
+
+def optimize_memory(df: pd.DataFrame, max_category_ratio: float = 0.5, arrow_strings: bool = False,
+                    conversions: Optional[Dict[str, Optional[str]]] = None,
+                    dtypes: Optional[Dict[str, str]] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Shrink `df` column by column, in place, and report what each column saved.
+
+    - 0/1 numeric columns and Y/N (yes/no) text columns become bool, or nullable
+      "boolean" when values are missing
+    - whole-number columns become the narrowest int, or nullable Int8/Int16/Int32/Int64
+      when values are missing (instead of float64)
+    - other floats are downcast as `downcast_numeric` does
+    - text columns with at most `max_category_ratio` distinct values per row become
+      category; with `arrow_strings` the remaining text columns become pyarrow-backed
+      "string[pyarrow]" (needs pyarrow)
+
+    Returns `(df, report)`: the report is indexed by column with MEMORY_REPORT_COLUMNS
+    (dtypes, the conversion applied and deep memory in bytes before and after).
+    Pass a previous report's `conversion` column as `conversions` to apply the same
+    decisions to later chunks of a file; a column whose values don't fit its pinned
+    conversion (a 2 in a 0/1 column) is decided afresh. Each chunk's int and bool
+    widths still follow its own values (Int8 in one chunk, Int32 in the next) unless
+    `dtypes` pins them: column -> dtype for its "int" or "bool" conversion, e.g. from a
+    first pass over the whole file.
+    """
+    if arrow_strings:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise ImportError("Arrow-backed strings need pyarrow: pip install pyarrow") from e
+
+    rows = []
+    for c in df.columns:
+        s = df[c]
+        if conversions is not None and c in conversions:
+            conversion = conversions[c] if isinstance(conversions[c], str) else None
+            dtype = dtypes.get(c) if dtypes is not None and conversion in ("int", "bool") else None
+            converted = _convert_for_memory(s, conversion, dtype) if conversion else None
+            if conversion and converted is None:
+                logging.warning("Column %s no longer fits conversion %s; deciding again", c, conversion)
+                conversion = _memory_conversion(s, max_category_ratio, arrow_strings)
+                converted = _convert_for_memory(s, conversion) if conversion else None
+        else:
+            conversion = _memory_conversion(s, max_category_ratio, arrow_strings)
+            converted = _convert_for_memory(s, conversion) if conversion else None
+        if converted is None:
+            converted, conversion = s, None
+        df[c] = converted
+        rows.append((c, str(s.dtype), str(converted.dtype), conversion,
+                     s.memory_usage(deep=True, index=False), converted.memory_usage(deep=True, index=False)))
+
+    report = pd.DataFrame(rows, columns=["column"] + MEMORY_REPORT_COLUMNS).set_index("column")
+    logging.info("Optimized memory: %.1f MiB -> %.1f MiB",
+                 report["bytes_before"].sum() / 2**20, report["bytes_after"].sum() / 2**20)
+    return df, report
+
+
 def detect_amount_column(df: pd.DataFrame):
     """Return a best-guess column name for monetary/amount columns, or None."""
     candidates = [c for c in df.columns if re.search(r"amount|charge|cost|paid|total", c)]
@@ -4,16 +4,40 @@ import argparse
 import logging
 
 from .io import load_csv, save_csv, preview_df
-from .cleaning import clean_column_names, infer_and_parse_dates, downcast_numeric, detect_amount_column, detect_id_columns
-from .features import create_fraud_features, deidentify_ids
+from .cleaning import (clean_column_names, infer_and_parse_dates, downcast_numeric, optimize_memory,
+                       detect_amount_column, detect_id_columns)
+from .features import IdHasher, create_fraud_features, deidentify_ids
+from .feature_stream import write_fraud_features_csv
+from .schema import infer_schema_plan
 from .examples import summarize_claims, example_filters
-from .db import create_sqlite_db_from_dir, list_db_tables, read_table, create_sqlite_databases_for_data_root
+from .db import _read_chunks, create_sqlite_db_from_dir, list_db_tables, read_table, create_sqlite_databases_for_data_root
+from .columnar import create_parquet_dataset_from_dir
 
 
 def _configure_logging(level: int = logging.INFO):
     logging.basicConfig(level=level, format="%(levelname)s: %(message)s")
 
 
+def _stream_features(args: argparse.Namespace) -> None:
+    """The --compute-features path for inputs larger than memory: cleaned and feature CSVs written chunk by chunk.
+
+    With --optimize-memory every chunk gets the same dtypes, as when ingesting into sqlite.
+    """
+    plan = infer_schema_plan(args.input)
+    hasher = IdHasher(args.id_salt) if args.hash_ids else None
+
+    def chunks():
+        for chunk in _read_chunks(args.input, args.chunk_size, plan, optimize_dtypes=args.optimize_memory,
+                                  arrow_strings=args.arrow_strings, nrows=args.nrows):
+            if hasher is not None:
+                patient_cols, provider_cols = detect_id_columns(chunk)
+                ids_to_hash = patient_cols + [c for c in provider_cols if c not in patient_cols]
+                chunk = deidentify_ids(chunk, ids_to_hash, hasher=hasher)
+            yield chunk
+
+    write_fraud_features_csv(chunks, args.features_output, cleaned_path=args.output)
+
+
 def main(argv: list = None) -> None:
     _configure_logging()
     p = argparse.ArgumentParser(description="Prepare healthcare claims CSV for downstream modeling (no ML model fitting).")
@@ -24,12 +48,19 @@ def main(argv: list = None) -> None:
     p.add_argument("--id-salt", type=str, default="", help="Optional salt for deterministic hashing")
     p.add_argument("--compute-features", action="store_true", help="Create features useful for modeling (no model fitting)")
     p.add_argument("--features-output", type=Path, default=Path("claims_with_features.csv"), help="Where to save CSV with engineered features")
+    p.add_argument("--chunk-size", type=int, default=None, help="With --compute-features: stream the input in chunks of this many rows instead of loading it whole (the input is read more than once); skips the preview and summaries")
     p.add_argument("--create-db", action="store_true", help="Create a sqlite DB from CSVs in a data dir and exit")
     p.add_argument("--data-dir", type=Path, default=Path("data"), help="Directory containing CSV files to ingest into sqlite")
     p.add_argument("--db-path", type=Path, default=None, help="Path for sqlite DB to create/use. If omitted when creating a single dataset DB, the path will be derived under --databases-dir")
     p.add_argument("--no-preprocess", action="store_true", help="Skip cleaning/typing while ingesting CSVs into sqlite")
     p.add_argument("--all-datasets", action="store_true", help="When used with --create-db: create one sqlite DB per dataset subdirectory under --data-dir and write them to --databases-dir")
     p.add_argument("--databases-dir", type=Path, default=Path("databases"), help="Directory to write per-dataset sqlite files when using --all-datasets")
+    p.add_argument("--bulk-load", action="store_true", help="With --create-db: load each CSV in one transaction with journaling and syncing relaxed until the DB is finalized")
+    p.add_argument("--index-columns", nargs="+", default=[], help="With --create-db: columns to index (on every table that has them) after loading")
+    p.add_argument("--storage", choices=["sqlite", "parquet"], default="sqlite", help="With --create-db: write sqlite DBs, or a directory of Parquet files (one per CSV) per dataset; parquet needs pyarrow")
+    p.add_argument("--optimize-memory", action="store_true", help="Shrink dtypes beyond numeric downcasting (0/1 and Y/N flags to bool, repetitive text to category, nullable ints) and log a per-column memory report; with --create-db or a chunked --compute-features applied to every chunk, with a per-file total logged instead. Flags are then written as True/False (CSV) or 0/1 (sqlite)")
+    p.add_argument("--arrow-strings", action="store_true", help="With --optimize-memory on an input CSV: keep the remaining text columns as pyarrow-backed strings (needs pyarrow)")
+    p.add_argument("--workers", type=int, default=1, help="With --create-db: build dataset DBs in this many processes (--all-datasets) or read CSVs ahead in this many threads")
 
     args = p.parse_args(argv)
 
@@ -41,17 +72,28 @@ def main(argv: list = None) -> None:
     if args.create_db:
         try:
             if args.all_datasets:
-                created = create_sqlite_databases_for_data_root(args.data_dir, args.databases_dir, preprocess=not args.no_preprocess)
+                created = create_sqlite_databases_for_data_root(args.data_dir, args.databases_dir, preprocess=not args.no_preprocess,
+                                                                workers=args.workers, bulk_load=args.bulk_load,
+                                                                index_columns=args.index_columns, storage=args.storage,
+                                                                optimize_dtypes=args.optimize_memory)
                 logging.info("Created databases: %s", created)
             else:
                 # Derive a sensible default db-path when none was provided: use databases/<dataset_name>.db
                 if args.db_path is None:
                     dataset_name = Path(args.data_dir).name
-                    db_path = args.databases_dir / f"{dataset_name}.db"
+                    suffix = ".db" if args.storage == "sqlite" else ".parquet"
+                    db_path = args.databases_dir / f"{dataset_name}{suffix}"
                 else:
                     db_path = args.db_path
 
-                create_sqlite_db_from_dir(args.data_dir, db_path, preprocess=not args.no_preprocess)
+                if args.storage == "parquet":
+                    create_parquet_dataset_from_dir(args.data_dir, db_path, preprocess=not args.no_preprocess,
+                                                    workers=args.workers)
+                    logging.info("Created Parquet dataset at %s", db_path)
+                    return
+                create_sqlite_db_from_dir(args.data_dir, db_path, preprocess=not args.no_preprocess, workers=args.workers,
+                                          bulk_load=args.bulk_load, index_columns=args.index_columns,
+                                          optimize_dtypes=args.optimize_memory)
                 logging.info("Created sqlite DB at %s", db_path)
                 try:
                     tables = list_db_tables(db_path)
@@ -62,10 +104,18 @@ def main(argv: list = None) -> None:
             logging.error("Failed to create sqlite DB: %s", e)
         return
 
+    if args.compute_features and args.chunk_size:
+        _stream_features(args)
+        return
+
     df = load_csv(args.input, nrows=args.nrows, low_memory=False)
     df = clean_column_names(df)
     df = infer_and_parse_dates(df)
-    df = downcast_numeric(df)
+    if args.optimize_memory:
+        df, report = optimize_memory(df, arrow_strings=args.arrow_strings)
+        logging.info("Memory by column:\n%s", report.to_string())
+    else:
+        df = downcast_numeric(df)
 
     # Optional de-identification: hash id columns (patient/provider)
     if args.hash_ids:
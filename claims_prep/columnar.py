@@ -0,0 +1,147 @@
+"""Optional Parquet storage backend.
+
+SQLite round-trips every value through Python (`to_sql` / `read_sql_query`), and a read
+pulls whole rows even when a model needs a handful of columns out of a wide claims table.
+Parquet stores columns separately, so reads are column-pruned, row groups whose min/max
+statistics can't match a filter are skipped (predicate pushdown), and numeric columns
+come back without a per-value Python conversion.
+
+`pyarrow` is only imported when one of these functions runs; install it to use them.
+"""
+from pathlib import Path
+import logging
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from .schema import SchemaPlan, resolve_schema_plans, save_widened_schema_plans
+
+# (column, op, value) with op one of =, ==, !=, <, <=, >, >=, in, not in -- the
+# pyarrow.parquet filter form, also translated to SQL by claims_prep.db.read_table
+Filter = Tuple[str, str, object]
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("The Parquet backend needs pyarrow: pip install pyarrow") from e
+    return pa, pq
+
+
+def is_parquet_path(path: Path) -> bool:
+    """True for a `.parquet` file or a directory of Parquet parts."""
+    path = Path(path)
+    return path.suffix == ".parquet" or (path.is_dir() and any(path.glob("*.parquet")))
+
+
+def write_parquet(chunks: Iterable[pd.DataFrame], path: Path, compression: str = "zstd",
+                  row_group_size: int = 64_000) -> int:
+    """Write DataFrame chunks to one Parquet file in row groups of at most `row_group_size` rows.
+
+    Filters skip whole row groups, so smaller groups make selective reads cheaper. All
+    chunks must share the first chunk's schema (which a `SchemaPlan` guarantees).
+    Returns the number of rows written.
+    """
+    pa, pq = _require_pyarrow()
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    writer = None
+    n_rows = 0
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(str(path), table.schema, compression=compression)
+            else:
+                table = table.cast(writer.schema)
+            writer.write_table(table, row_group_size=row_group_size)
+            n_rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return n_rows
+
+
+def create_parquet_dataset_from_dir(data_dir: Path, out_dir: Path, csv_glob: str = "*.csv", chunk_size: int = 100_000,
+                                    preprocess: bool = True, workers: int = 1) -> None:
+    """Parquet counterpart of `create_sqlite_db_from_dir`: one `<out_dir>/<csv stem>.parquet` per CSV.
+
+    Chunks are cleaned and typed by the same per-file `SchemaPlan`s, persisted to
+    `<out_dir>.schema.json`.
+    """
+    # imported here: claims_prep.db imports this module for read_table
+    from .db import _prefetch_chunks, _read_chunks
+
+    _require_pyarrow()
+    data_dir = Path(data_dir)
+    out_dir = Path(out_dir)
+    files = sorted(data_dir.glob(csv_glob))
+    if not files:
+        logging.warning("No CSV files found in %s matching %s", data_dir, csv_glob)
+        return
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    plans: Dict[str, SchemaPlan] = resolve_schema_plans(files, out_dir) if preprocess else {}
+    if workers > 1:
+        file_chunks = _prefetch_chunks(files, chunk_size, plans, workers)
+    else:
+        file_chunks = ((f, _read_chunks(f, chunk_size, plans.get(f.name))) for f in files)
+
+    try:
+        for f, chunks in file_chunks:
+            path = out_dir / f"{f.stem}.parquet"
+            logging.info("Writing %s -> %s (chunksize=%d)", f, path, chunk_size)
+            plan = plans.get(f.name)
+            while True:
+                planned = dict(plan.dtypes) if plan is not None else None
+                try:
+                    n_rows = write_parquet(chunks, path)
+                    break
+                except (TypeError, ValueError):
+                    # pyarrow errors subclass these; a column widened mid-file no longer fits
+                    # the row groups already written, so write the file again with the widened plan
+                    if plan is None or plan.dtypes == planned:
+                        raise
+                    # read the rest of the file first: it frees a prefetching reader and
+                    # widens every other column that needs it before the one rewrite
+                    for _ in chunks:
+                        pass
+                    logging.warning("Schema of %s widened while writing; rewriting %s", f, path)
+                    chunks = _read_chunks(f, chunk_size, plan)
+            logging.info("Finished writing %s (%d rows)", path, n_rows)
+    finally:
+        file_chunks.close()
+    # columns widened while reading are planned that way from the start next time
+    save_widened_schema_plans(plans, out_dir)
+
+
+def sqlite_table_to_parquet(db_path: Path, table: str, path: Path, columns: Optional[Sequence[str]] = None,
+                            chunk_size: int = 500_000) -> int:
+    """Export a sqlite table (optionally only `columns`) to a Parquet file, streamed in chunks."""
+    from .db import _connect, _select_sql
+
+    conn = _connect(db_path)
+    try:
+        sql, params = _select_sql(table, columns)
+        chunks = pd.read_sql_query(sql, conn, params=params, chunksize=chunk_size)
+        return write_parquet(chunks, path)
+    finally:
+        conn.close()
+
+
+def read_parquet_table(path: Path, columns: Optional[Sequence[str]] = None, filters: Optional[List[Filter]] = None,
+                       arrow_dtypes: bool = False) -> pd.DataFrame:
+    """Read a Parquet file or directory, loading only `columns` and the row groups `filters` can match.
+
+    The file is memory-mapped. With `arrow_dtypes=True` the frame keeps pyarrow-backed
+    columns, which wraps the Arrow buffers instead of copying them into numpy.
+    """
+    pa, pq = _require_pyarrow()
+    table = pq.read_table(str(path), columns=list(columns) if columns is not None else None,
+                          filters=filters or None, memory_map=True)
+    if arrow_dtypes:
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+    # release each Arrow column as soon as it has been converted
+    return table.to_pandas(split_blocks=True, self_destruct=True)
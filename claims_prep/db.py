@@ -1,12 +1,20 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 import logging
+import os
+import queue
 import sqlite3
-from typing import Iterable, List, Optional
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 
-from .cleaning import clean_column_names, infer_and_parse_dates, downcast_numeric
+from .cleaning import (clean_column_names, infer_and_parse_dates, downcast_numeric, optimize_memory,
+                       _memory_conversion, _narrowest_int)
+from .columnar import Filter, create_parquet_dataset_from_dir, is_parquet_path, read_parquet_table
 from .io import load_csv
+from .schema import SchemaPlan, resolve_schema_plans, save_widened_schema_plans
 
 
 def _connect(db_path: Path) -> sqlite3.Connection:
@@ -15,21 +23,242 @@ def _connect(db_path: Path) -> sqlite3.Connection:
     return conn
 
 
+_DONE = object()
+
+
+def _pinned_dtypes(csv_path: Path, chunk_size: int, plan: SchemaPlan,
+                   conversions: Dict[str, Optional[str]], nrows: Optional[int] = None) -> Dict[str, str]:
+    """One dtype per int/bool column for the whole file, from a first pass over just those columns.
+
+    Picked per chunk, a column's width follows that chunk's values (Int8, then Int32), so
+    the range and missing values of every column converted to int or bool are collected
+    over the file first and the narrowest dtype holding all of them is used for every chunk.
+    """
+    raw_names = {name: raw for raw, name in plan.columns.items()}
+    columns = [c for c, conversion in conversions.items() if conversion in ("int", "bool") and c in raw_names]
+    if not columns:
+        return {}
+    usecols = [raw_names[c] for c in columns]
+    text = {raw: "object" for raw in usecols if plan.dtypes.get(raw) == "object"}
+    lo, hi, missing = {}, {}, dict.fromkeys(columns, False)
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_size, nrows=nrows, usecols=usecols, dtype=text):
+        for c in columns:
+            s = chunk[raw_names[c]]
+            missing[c] = missing[c] or bool(s.isna().any())
+            if conversions[c] == "int":
+                values = pd.to_numeric(s, errors="coerce").dropna()
+                if len(values):
+                    lo[c] = min(lo.get(c, values.min()), values.min())
+                    hi[c] = max(hi.get(c, values.max()), values.max())
+
+    dtypes = {}
+    for c in columns:
+        if conversions[c] == "bool":
+            dtypes[c] = "boolean" if missing[c] else "bool"
+        else:
+            dtype = _narrowest_int(lo.get(c, 0), hi.get(c, 0), nullable=missing[c])
+            if dtype is not None:
+                dtypes[c] = dtype
+    return dtypes
+
+
+def _read_chunks(csv_path: Path, chunk_size: int, plan: Optional[SchemaPlan] = None,
+                 optimize_dtypes: bool = False, arrow_strings: bool = False,
+                 nrows: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """Stream a CSV (its first `nrows` rows, if given) in chunks, typed and cleaned by `plan` when one is given.
+
+    With `optimize_dtypes` each planned chunk is also shrunk by `optimize_memory` (with
+    `arrow_strings`), using the conversions decided on the file's first chunk and int/bool
+    widths fixed by `_pinned_dtypes`, and the file's total saving is logged.
+    """
+    if plan is None:
+        yield from pd.read_csv(csv_path, chunksize=chunk_size, nrows=nrows)
+        return
+    conversions = None
+    dtypes = None
+    totals = None
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_size, nrows=nrows, **plan.read_csv_kwargs()):
+        chunk = plan.apply(chunk)
+        if optimize_dtypes:
+            if conversions is None:
+                conversions = {c: _memory_conversion(chunk[c], arrow_strings=arrow_strings) for c in chunk.columns}
+                dtypes = _pinned_dtypes(csv_path, chunk_size, plan, conversions, nrows)
+            chunk, report = optimize_memory(chunk, arrow_strings=arrow_strings, conversions=conversions, dtypes=dtypes)
+            sizes = report[["bytes_before", "bytes_after"]]
+            totals = sizes if totals is None else totals.add(sizes, fill_value=0)
+        yield chunk
+    if totals is not None:
+        logging.info("Optimized dtypes of %s: %.1f MiB -> %.1f MiB", csv_path.name,
+                     totals["bytes_before"].sum() / 2**20, totals["bytes_after"].sum() / 2**20)
+
+
+def _prefetch_chunks(files: List[Path], chunk_size: int, plans: Dict[str, SchemaPlan], workers: int,
+                     max_pending: int = 2, optimize_dtypes: bool = False) -> Iterator[Tuple[Path, Iterator[pd.DataFrame]]]:
+    """Yield `(path, chunks)` in file order while up to `workers` files are parsed ahead.
+
+    Each file is read and cleaned by a worker thread into a bounded queue of at most
+    `max_pending` chunks, so memory stays around `workers * max_pending` chunks. The
+    caller consumes files strictly in order, which keeps the written DB deterministic.
+    """
+    stop = threading.Event()
+
+    def _put(q: queue.Queue, item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(csv_path: Path, q: queue.Queue) -> None:
+        try:
+            for chunk in _read_chunks(csv_path, chunk_size, plans.get(csv_path.name), optimize_dtypes):
+                if not _put(q, chunk):
+                    return
+            _put(q, _DONE)
+        except BaseException as e:  # surfaced to the writer below
+            _put(q, e)
+
+    def _drain(q: queue.Queue) -> Iterator[pd.DataFrame]:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="csv-reader")
+    try:
+        queues = []
+        for f in files:
+            q: queue.Queue = queue.Queue(maxsize=max_pending)
+            executor.submit(_produce, f, q)
+            queues.append(q)
+        for f, q in zip(files, queues):
+            yield f, _drain(q)
+    finally:
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _begin_bulk_load(conn: sqlite3.Connection, journal_mode: str) -> None:
+    """Trade crash safety for write speed until `_finish_bulk_load` runs."""
+    conn.execute(f"PRAGMA journal_mode={journal_mode};")
+    conn.execute("PRAGMA synchronous=OFF;")
+    conn.execute("PRAGMA temp_store=MEMORY;")
+    conn.execute("PRAGMA cache_size=-262144;")  # 256 MiB
+
+
+def _finish_bulk_load(conn: sqlite3.Connection) -> None:
+    """Restore durable settings and flush everything the bulk load wrote."""
+    conn.commit()
+    conn.execute("PRAGMA synchronous=FULL;")
+    conn.execute("PRAGMA journal_mode=DELETE;")  # checkpoints and removes a WAL file if there is one
+
+
+def _fsync_path(path: Path) -> None:
+    fd = os.open(str(path), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    except OSError:
+        # directories can't be fsynced on every platform (e.g. Windows)
+        pass
+    finally:
+        os.close(fd)
+
+
+def _sqlite_rows(df: pd.DataFrame) -> Iterator[tuple]:
+    """Rows of `df` as tuples of values sqlite3 can bind, stored the way `to_sql` stores them."""
+    columns = []
+    for _, s in df.items():
+        if pd.api.types.is_datetime64_any_dtype(s):
+            s = s.dt.strftime("%Y-%m-%d %H:%M:%S").astype(object).where(s.notna(), None)
+        elif not (isinstance(s.dtype, np.dtype) and s.dtype.kind in "biuf"):
+            # object, string and nullable extension dtypes: missing -> NULL
+            s = s.astype(object).where(s.notna(), None)
+        # tolist() turns numpy scalars into Python ones; SQLite stores float NaN as NULL
+        columns.append(s.tolist())
+    return zip(*columns)
+
+
+def _bulk_insert_file(conn: sqlite3.Connection, table: str, chunks: Iterable[pd.DataFrame], if_exists: str) -> int:
+    """Write every chunk of one file with prepared `executemany` inserts inside a single transaction.
+
+    `if_exists` is handled like `DataFrame.to_sql`'s: 'replace', 'append' or 'fail'.
+    """
+    n_rows = 0
+    insert_sql = None
+    conn.execute("BEGIN;")
+    try:
+        for chunk in chunks:
+            if insert_sql is None:
+                if if_exists == "replace":
+                    conn.execute(f'DROP TABLE IF EXISTS "{table}";')
+                exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?;", (table,)).fetchone()
+                if exists and if_exists == "fail":
+                    raise ValueError(f"Table '{table}' already exists.")
+                if not exists:
+                    # same column types pandas.to_sql would pick
+                    conn.execute(pd.io.sql.get_schema(chunk, table, con=conn))
+                placeholders = ", ".join("?" * chunk.shape[1])
+                columns = ", ".join(f'"{c}"' for c in chunk.columns)
+                insert_sql = f'INSERT INTO "{table}" ({columns}) VALUES ({placeholders});'
+            conn.executemany(insert_sql, _sqlite_rows(chunk))
+            n_rows += len(chunk)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return n_rows
+
+
+def _create_indexes(conn: sqlite3.Connection, tables: Iterable[str], index_columns: Iterable[str]) -> None:
+    """Index `index_columns` on each of `tables` that has them; run once the data is loaded."""
+    index_columns = list(index_columns)
+    if not index_columns:
+        return
+    for table in tables:
+        present = {r[1] for r in conn.execute(f'PRAGMA table_info("{table}");')}
+        for col in index_columns:
+            if col in present:
+                logging.info("Creating index on %s(%s)", table, col)
+                conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_{table}_{col}" ON "{table}" ("{col}");')
+    conn.commit()
+
+
 def create_sqlite_db_from_dir(data_dir: Path, db_path: Path, csv_glob: str = "*.csv", chunk_size: int = 100_000,
-                              preprocess: bool = True, if_exists: str = "replace") -> None:
+                              preprocess: bool = True, if_exists: str = "replace", workers: int = 1,
+                              bulk_load: bool = False, index_columns: Iterable[str] = (),
+                              optimize_dtypes: bool = False) -> None:
     """Create or update a sqlite database by ingesting all CSV files in `data_dir`.
 
     Each CSV becomes a table named after the CSV filename (stem). Files are read in
-    streaming chunks to avoid large memory usage. When `preprocess` is True the
-    helpers from `claims_prep.cleaning` are applied to each chunk before writing.
+    streaming chunks to avoid large memory usage. When `preprocess` is True every
+    chunk is cleaned and typed by the file's `SchemaPlan` before writing.
 
     Parameters
     - data_dir: Path containing CSV files
     - db_path: Path to sqlite file to create/modify
     - csv_glob: glob pattern for CSV files
     - chunk_size: rows per chunk for streaming read
-    - preprocess: whether to run clean_column_names, infer_and_parse_dates, downcast_numeric
-    - if_exists: behavior for existing tables: 'replace' or 'append'
+    - preprocess: whether to clean column names and type columns. Dtypes and date formats
+      are inferred once per file from a sample (see `claims_prep.schema`), persisted to
+      `<db_path>.schema.json`, and applied unchanged to every chunk
+    - if_exists: behavior for existing tables: 'replace', 'append' or 'fail'
+    - workers: when > 1, read and clean up to this many files ahead in worker threads
+      while this thread stays the single writer; tables and row order are identical
+      to a serial run
+    - bulk_load: write each file in one transaction with prepared `executemany` inserts
+      and journaling/syncing relaxed for the build. A new DB is built in a side file with
+      the journal off and moved into place once it is synced; an existing DB is loaded in
+      WAL mode. Either way the DB is back to durable settings when this returns
+    - index_columns: columns to index on every table that has them, created after all
+      files are loaded
+    - optimize_dtypes: with `preprocess`, also shrink every chunk with `optimize_memory`
+      (0/1 and Y/N flags as bool, low-cardinality text as category, narrow and nullable
+      ints). Flags are then stored as 0/1 integers, so Y/N text columns change in the DB
     """
     data_dir = Path(data_dir)
     db_path = Path(db_path)
@@ -40,25 +269,59 @@ def create_sqlite_db_from_dir(data_dir: Path, db_path: Path, csv_glob: str = "*.
 
     # Ensure parent exists for db
     db_path.parent.mkdir(parents=True, exist_ok=True)
-    conn = _connect(db_path)
 
+    # a brand-new DB can be built with no journal at all, since a failed build is just
+    # thrown away; an existing one keeps a WAL so other tables survive a crash
+    build_path = db_path
+    if bulk_load and not db_path.exists():
+        build_path = db_path.with_name(db_path.name + ".building")
+        build_path.unlink(missing_ok=True)
+    conn = _connect(build_path)
+    if bulk_load:
+        _begin_bulk_load(conn, "OFF" if build_path != db_path else "WAL")
+
+    # dtypes and date formats are fixed once per file (and reused from <db>.schema.json)
+    plans = resolve_schema_plans(files, db_path) if preprocess else {}
+    if workers > 1:
+        file_chunks = _prefetch_chunks(files, chunk_size, plans, workers, optimize_dtypes=optimize_dtypes)
+    else:
+        file_chunks = ((f, _read_chunks(f, chunk_size, plans.get(f.name), optimize_dtypes)) for f in files)
+
+    completed = False
     try:
-        for f in files:
+        for f, chunks in file_chunks:
             table = f.stem
             logging.info("Ingesting %s -> table %s (chunksize=%d)", f, table, chunk_size)
+            if bulk_load:
+                n_rows = _bulk_insert_file(conn, table, chunks, if_exists)
+                logging.info("Finished ingesting %s -> %s (%d rows)", f, table, n_rows)
+                continue
             first_chunk = True
-            for chunk in pd.read_csv(f, chunksize=chunk_size):
-                if preprocess:
-                    chunk = clean_column_names(chunk)
-                    chunk = infer_and_parse_dates(chunk)
-                    chunk = downcast_numeric(chunk)
-                # pandas.to_sql with a sqlite3.Connection works; use replace on first chunk if requested
-                mode = "replace" if first_chunk and if_exists == "replace" else "append"
+            for chunk in chunks:
+                # pandas.to_sql with a sqlite3.Connection works; if_exists applies to the first chunk
+                mode = if_exists if first_chunk else "append"
                 chunk.to_sql(table, conn, if_exists=mode, index=False)
                 first_chunk = False
             logging.info("Finished ingesting %s -> %s", f, table)
+
+        _create_indexes(conn, [f.stem for f in files], index_columns)
+        if bulk_load:
+            _finish_bulk_load(conn)
+        completed = True
     finally:
+        file_chunks.close()
         conn.close()
+        if build_path != db_path and not completed:
+            build_path.unlink(missing_ok=True)
+    # columns widened while reading are planned that way from the start next time
+    save_widened_schema_plans(plans, db_path)
+
+    if bulk_load:
+        # synchronous was off during the build: flush the file before it becomes the DB
+        _fsync_path(build_path)
+        if build_path != db_path:
+            os.replace(build_path, db_path)
+            _fsync_path(db_path.parent)
 
 
 def list_db_tables(db_path: Path) -> List[str]:
@@ -72,16 +335,59 @@ def list_db_tables(db_path: Path) -> List[str]:
         conn.close()
 
 
-def read_table(db_path: Path, table: str, sql: Optional[str] = None) -> pd.DataFrame:
+_SQL_FILTER_OPS = {"=": "=", "==": "=", "!=": "!=", "<": "<", "<=": "<=", ">": ">", ">=": ">=",
+                   "in": "IN", "not in": "NOT IN"}
+
+
+def _select_sql(table: str, columns: Optional[Iterable[str]] = None,
+                filters: Optional[List[Filter]] = None) -> Tuple[str, list]:
+    """SELECT for `table` restricted to `columns` and the (column, op, value) `filters`, plus its params."""
+    cols = ", ".join(f'"{c}"' for c in columns) if columns else "*"
+    where: List[str] = []
+    params: list = []
+    for col, op, value in filters or []:
+        sql_op = _SQL_FILTER_OPS.get(op.lower())
+        if sql_op is None:
+            raise ValueError(f"Unsupported filter operator: {op}")
+        if sql_op in ("IN", "NOT IN"):
+            values = list(value)
+            where.append(f'"{col}" {sql_op} ({", ".join("?" * len(values))})')
+            params.extend(values)
+        else:
+            where.append(f'"{col}" {sql_op} ?')
+            params.append(value)
+    sql = f'SELECT {cols} FROM "{table}"'
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql, params
+
+
+def read_table(db_path: Path, table: str, sql: Optional[str] = None, columns: Optional[Iterable[str]] = None,
+               filters: Optional[List[Filter]] = None) -> pd.DataFrame:
     """Read an entire table (or an arbitrary SQL query) from sqlite into a pandas DataFrame.
 
-    If `sql` is provided it is run instead of a simple SELECT * FROM table.
+    If `sql` is provided it is run instead of a simple SELECT * FROM table. `columns`
+    limits the read to those columns and `filters` is a list of (column, op, value)
+    conditions that must all hold, e.g. [("clm_id", ">", 1000)].
+
+    `db_path` may also be a Parquet file or a directory written by
+    `create_parquet_dataset_from_dir` (read as `<dir>/<table>.parquet`); columns and
+    filters are then pushed down into the Parquet reader and `sql` is not supported.
     """
+    if is_parquet_path(db_path):
+        if sql is not None:
+            raise ValueError("SQL queries need a sqlite DB; pass columns/filters to read Parquet")
+        path = Path(db_path)
+        if path.is_dir() and (path / f"{table}.parquet").exists():
+            path = path / f"{table}.parquet"
+        return read_parquet_table(path, columns=columns, filters=filters)
+
+    params: list = []
+    if sql is None:
+        sql, params = _select_sql(table, columns, filters)
     conn = _connect(db_path)
     try:
-        if sql is None:
-            sql = f"SELECT * FROM {table}"
-        df = pd.read_sql_query(sql, conn)
+        df = pd.read_sql_query(sql, conn, params=params)
     finally:
         conn.close()
     return df
@@ -105,20 +411,31 @@ def csv_to_table(csv_path: Path, db_path: Path, table: Optional[str] = None, pre
 
 
 def create_sqlite_databases_for_data_root(data_root: Path, databases_dir: Path, csv_glob: str = "*.csv",
-                                         chunk_size: int = 100_000, preprocess: bool = True, if_exists: str = "replace") -> List[Path]:
+                                         chunk_size: int = 100_000, preprocess: bool = True, if_exists: str = "replace",
+                                         workers: int = 1, bulk_load: bool = False,
+                                         index_columns: Iterable[str] = (), storage: str = "sqlite",
+                                         optimize_dtypes: bool = False) -> List[Path]:
     """Scan a root data directory for dataset subdirectories and create one sqlite DB
     per dataset in `databases_dir`.
 
     Each child directory of `data_root` that contains CSV files will produce a DB
-    named `<databases_dir>/<dataset_name>.db`.
+    named `<databases_dir>/<dataset_name>.db`. With `workers` > 1 the independent
+    dataset DBs are built in a process pool of that size (a single dataset instead
+    gets `workers` reader threads). `if_exists`, `bulk_load`, `index_columns` and
+    `optimize_dtypes` are passed to `create_sqlite_db_from_dir` for every dataset.
 
-    Returns a list of created DB paths.
+    With `storage="parquet"` each dataset becomes a `<databases_dir>/<dataset_name>.parquet`
+    directory of per-CSV Parquet files instead (see `create_parquet_dataset_from_dir`).
+
+    Returns a list of created DB paths, in dataset name order.
     """
+    if storage not in ("sqlite", "parquet"):
+        raise ValueError(f"Unknown storage backend: {storage}")
     data_root = Path(data_root)
     databases_dir = Path(databases_dir)
     databases_dir.mkdir(parents=True, exist_ok=True)
 
-    created: List[Path] = []
+    datasets: List[Tuple[str, Path, Path]] = []
     for child in sorted(data_root.iterdir()):
         if not child.is_dir():
             continue
@@ -126,12 +443,38 @@ def create_sqlite_databases_for_data_root(data_root: Path, databases_dir: Path,
         if not files:
             logging.info("Skipping %s: no CSV files found", child)
             continue
-        db_path = databases_dir / f"{child.name}.db"
-        logging.info("Creating DB for dataset %s -> %s", child.name, db_path)
-        try:
-            create_sqlite_db_from_dir(child, db_path, csv_glob=csv_glob, chunk_size=chunk_size, preprocess=preprocess, if_exists=if_exists)
-            created.append(db_path)
-        except Exception:
-            logging.exception("Failed to create DB for dataset %s", child.name)
+        suffix = ".db" if storage == "sqlite" else ".parquet"
+        datasets.append((child.name, child, databases_dir / f"{child.name}{suffix}"))
+
+    if storage == "sqlite":
+        build = create_sqlite_db_from_dir
+        options = dict(if_exists=if_exists, bulk_load=bulk_load, index_columns=list(index_columns),
+                       optimize_dtypes=optimize_dtypes)
+    else:
+        build = create_parquet_dataset_from_dir
+        options = {}
+    created: List[Path] = []
+    if workers > 1 and len(datasets) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(datasets))) as pool:
+            futures = []
+            for name, child, db_path in datasets:
+                logging.info("Creating DB for dataset %s -> %s", name, db_path)
+                futures.append(pool.submit(build, child, db_path, csv_glob=csv_glob, chunk_size=chunk_size,
+                                           preprocess=preprocess, **options))
+            for (name, _, db_path), future in zip(datasets, futures):
+                try:
+                    future.result()
+                    created.append(db_path)
+                except Exception:
+                    logging.exception("Failed to create DB for dataset %s", name)
+    else:
+        for name, child, db_path in datasets:
+            logging.info("Creating DB for dataset %s -> %s", name, db_path)
+            try:
+                build(child, db_path, csv_glob=csv_glob, chunk_size=chunk_size, preprocess=preprocess,
+                      workers=workers, **options)
+                created.append(db_path)
+            except Exception:
+                logging.exception("Failed to create DB for dataset %s", name)
     logging.info("Created %d databases under %s", len(created), databases_dir)
     return created
@@ -0,0 +1,229 @@
+"""Stream an Excel workbook into SQLite without holding it in memory.
+
+`pd.read_excel` + `to_sql` materializes the whole sheet (and its object columns) before
+writing a row. Here the first worksheet is read row by row in openpyxl's read-only mode
+and inserted in batches, with a result that matches the pandas path: the same column
+names, the declared types pandas would pick for the whole sheet, and the same stored values.
+
+An imported table is also saved as a SQLite snapshot keyed by the workbook's sha256, so
+importing an unchanged workbook again copies the snapshot instead of parsing the file.
+
+    import_excel_to_sqlite("claim_definitions.xlsx", "claims.db", "raw_claim_definitions")
+
+Needs openpyxl (as `pd.read_excel` does for .xlsx files).
+"""
+import datetime
+import hashlib
+from pathlib import Path
+import logging
+import re
+import sqlite3
+import time
+from typing import Dict, Iterator, List, Optional, Union
+
+import pandas as pd
+
+PROGRESS_SECONDS = 10.0
+# bumped whenever the imported table can come out differently, so older snapshots aren't reused
+SNAPSHOT_VERSION = 2
+
+
+def _excel_column_names(header: tuple) -> List[str]:
+    """Column names as `pd.read_excel` + the old cleanup produced them: blanks become
+    'Unnamed: i', repeats get a '.n' suffix, spaces become underscores."""
+    names = []
+    seen: Dict[str, int] = {}
+    for i, value in enumerate(header):
+        name = f"Unnamed: {i}" if value is None else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name.replace(" ", "_").strip())
+    return names
+
+
+def _sqlite_value(value):
+    # store datetimes the way DataFrame.to_sql does
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+def _stream_excel_rows(excel_file_path: Union[str, Path]) -> Iterator[tuple]:
+    """Yield the header and then each non-empty row of the first worksheet."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(excel_file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        # read-only sheets trust the stored dimensions, which some writers get wrong
+        sheet.reset_dimensions()
+        for row in sheet.iter_rows(values_only=True):
+            if any(value is not None for value in row):
+                yield row
+    finally:
+        workbook.close()
+
+
+def _file_sha256(path: Union[str, Path], block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _excel_cache_path(excel_file_path: Union[str, Path], cache_dir: Union[str, Path]) -> Path:
+    digest = _file_sha256(excel_file_path)
+    return Path(cache_dir) / f"{Path(excel_file_path).stem}-{digest[:16]}-v{SNAPSHOT_VERSION}.sqlite"
+
+
+def _copy_table(conn: sqlite3.Connection, source_schema: str, source_table: str,
+                target_schema: str, target_table: str) -> None:
+    """Replace `target_schema`.`target_table` with a copy of the source table, keeping its
+    column declarations (schemas are 'main' or an attached name)."""
+    create_sql = conn.execute(
+        f"SELECT sql FROM {source_schema}.sqlite_master WHERE type = 'table' AND name = ?;", (source_table,)
+    ).fetchone()[0]
+    create_sql = re.sub(r'^CREATE TABLE\s+("[^"]*"|\S+)', f'CREATE TABLE {target_schema}."{target_table}"', create_sql)
+    conn.execute(f'DROP TABLE IF EXISTS {target_schema}."{target_table}";')
+    conn.execute(create_sql)
+    conn.execute(f'INSERT INTO {target_schema}."{target_table}" SELECT * FROM {source_schema}."{source_table}";')
+
+
+class _ColumnKinds:
+    """The Python types seen in each column across the whole sheet, with one value of each.
+
+    A frame of those values has the dtypes pandas would give the full sheet (ints with a
+    gap become float64, ints mixed with text object, ...), so its `get_schema` declares
+    the same types as `read_excel` + `to_sql`, whichever batch a value first shows up in.
+    """
+
+    def __init__(self, n_columns: int):
+        self.examples: List[Dict[type, object]] = [{} for _ in range(n_columns)]
+
+    def add(self, batch: List[tuple]) -> None:
+        for examples, values in zip(self.examples, zip(*batch)):
+            new = set(map(type, values)).difference(examples)
+            for kind in new:
+                examples[kind] = next(v for v in values if type(v) is kind)
+
+    def schema(self, columns: List[str], table_name: str, conn: sqlite3.Connection) -> str:
+        # a column with no values at all reads as float64 NaN, as in read_excel
+        samples = [list(examples.values()) if set(examples) - {type(None)} else [float("nan")]
+                   for examples in self.examples]
+        n = max(len(values) for values in samples)
+        # pad with a value already in the column, which adds no new type
+        frame = pd.DataFrame({c: values + values[:1] * (n - len(values)) for c, values in zip(columns, samples)})
+        return pd.io.sql.get_schema(frame, table_name, con=conn)
+
+
+def _stream_excel_to_table(conn: sqlite3.Connection, excel_file_path: Union[str, Path], table_name: str,
+                           batch_rows: int) -> List[str]:
+    """Stream the first worksheet into `table_name`, committing every `batch_rows` rows.
+
+    Rows are staged in an untyped table (SQLite stores each value as given) while the
+    types seen in every row are collected; the typed table is created from them at the
+    end and replaces the old one in the same transaction. Returns the column names.
+    """
+    rows = _stream_excel_rows(excel_file_path)
+    try:
+        header = next(rows)
+    except StopIteration:
+        raise ValueError(f"{excel_file_path} has no header row")
+    columns = _excel_column_names(header)
+    kinds = _ColumnKinds(len(columns))
+
+    staging_table = f"{table_name}__importing"
+    conn.execute(f'DROP TABLE IF EXISTS "{staging_table}";')
+    quoted = ", ".join(f'"{c}"' for c in columns)
+    conn.execute(f'CREATE TABLE "{staging_table}" ({quoted});')
+    placeholders = ", ".join("?" * len(columns))
+    insert_sql = f'INSERT INTO "{staging_table}" VALUES ({placeholders});'
+
+    def write(batch):
+        kinds.add(batch)
+        conn.executemany(insert_sql, ([_sqlite_value(v) for v in row] for row in batch))
+        conn.commit()
+
+    batch = []
+    n_rows = 0
+    last_progress = time.monotonic()
+    for row in rows:
+        # short rows (trailing empty cells) are padded to the header width
+        batch.append(row[:len(columns)] + (None,) * (len(columns) - len(row)))
+        if len(batch) < batch_rows:
+            continue
+        write(batch)
+        n_rows += len(batch)
+        batch = []
+        if time.monotonic() - last_progress >= PROGRESS_SECONDS:
+            logging.info("  - %d rows imported", n_rows)
+            last_progress = time.monotonic()
+    if batch:
+        write(batch)
+
+    with conn:
+        conn.execute("BEGIN;")
+        conn.execute(f'DROP TABLE IF EXISTS "{table_name}";')
+        conn.execute(kinds.schema(columns, table_name, conn))
+        conn.execute(f'INSERT INTO "{table_name}" SELECT * FROM "{staging_table}";')
+        conn.execute(f'DROP TABLE "{staging_table}";')
+    return columns
+
+
+def import_excel_to_sqlite(excel_file_path: Union[str, Path], sqlite_db_path: Union[str, Path],
+                           table_name: Optional[str] = None, batch_rows: int = 50_000,
+                           cache_dir: Union[str, Path, bool, None] = None) -> int:
+    """Import the first worksheet of an Excel file into a SQLite table with automatic column discovery.
+
+    - table_name: defaults to the file stem with spaces and dashes as underscores
+    - batch_rows: rows per insert batch / commit
+    - cache_dir: where workbook snapshots are kept; defaults to an `excel_cache` directory
+      next to the database. False disables the cache
+
+    Returns the number of rows in the table.
+    """
+    if table_name is None:
+        table_name = Path(excel_file_path).stem.replace(" ", "_").replace("-", "_")
+    if cache_dir is None:
+        cache_dir = Path(sqlite_db_path).resolve().parent / "excel_cache"
+    cache_path = _excel_cache_path(excel_file_path, cache_dir) if cache_dir is not False else None
+
+    logging.info("Connecting to SQLite database: %s", sqlite_db_path)
+    conn = sqlite3.connect(sqlite_db_path)
+    try:
+        if cache_path is not None and cache_path.exists():
+            logging.info("Workbook unchanged since last import; copying snapshot %s to table: %s",
+                         cache_path.name, table_name)
+            conn.execute("ATTACH DATABASE ? AS snapshot;", (str(cache_path),))
+            _copy_table(conn, "snapshot", "data", "main", table_name)
+            conn.commit()
+            conn.execute("DETACH DATABASE snapshot;")
+        else:
+            logging.info("Reading Excel file %s into table: %s", excel_file_path, table_name)
+            _stream_excel_to_table(conn, excel_file_path, table_name, batch_rows)
+
+            if cache_path is not None:
+                cache_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+                tmp_path.unlink(missing_ok=True)
+                conn.execute("ATTACH DATABASE ? AS snapshot;", (str(tmp_path),))
+                _copy_table(conn, "main", table_name, "snapshot", "data")
+                conn.commit()
+                conn.execute("DETACH DATABASE snapshot;")
+                tmp_path.replace(cache_path)
+                logging.info("Saved snapshot %s", cache_path)
+
+        columns = conn.execute(f'PRAGMA table_info("{table_name}");').fetchall()
+        logging.info("Discovered columns (%d total):\n%s", len(columns),
+                     "\n".join(f"  - {name} ({col_type})" for _, name, col_type, *_ in columns))
+        row_count = conn.execute(f'SELECT COUNT(*) FROM "{table_name}";').fetchone()[0]
+        logging.info("Imported %d rows to table: %s", row_count, table_name)
+        return row_count
+    finally:
+        conn.close()
@@ -0,0 +1,292 @@
+"""Two-pass streaming `create_fraud_features` for claims files larger than memory.
+
+`create_fraud_features` needs the whole frame in memory, and its copies, merges and sorts
+take several times that. Here the input is read twice instead:
+
+- pass one keeps only per-key state: the overall amount (count, mean, M2), per-patient
+  (count, sum, mean, M2) merged chunk by chunk with Chan's parallel Welford update,
+  per-provider (count, sum), and the distinct (patient, code) pairs of each code column;
+- pass two reads the chunks again and emits each one with the same feature columns the
+  in-memory function adds.
+
+`days_since_prev_claim` depends on every claim of a patient, so pass one also keeps one
+patient id and one date per row (about 16 bytes a row, not the row) to find each claim's
+predecessor. Means and standard deviations can differ from pandas' in the last bits;
+everything else matches exactly.
+
+    plan = infer_schema_plan(csv_path)
+    chunks = lambda: (plan.apply(c) for c in pd.read_csv(csv_path, chunksize=100_000, **plan.read_csv_kwargs()))
+    for enriched in stream_fraud_features(chunks):
+        ...
+"""
+from pathlib import Path
+import logging
+from typing import Callable, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .cleaning import detect_amount_column, detect_id_columns
+from .features import _is_text_column, _previous_claim_dates
+
+_CODE_COLUMN_MARKERS = ("dx", "diagnosis", "cpt", "procedure", "hcpcs")
+
+
+class _KeyIndex:
+    """Ids for the distinct non-null keys of a column, in first-seen order across chunks."""
+
+    def __init__(self):
+        self.index = pd.Index([])
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def ids(self, values: pd.Series) -> np.ndarray:
+        """Ids of `values`, adding unseen keys; -1 for missing values."""
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # each chunk has its own categories; key on the values themselves
+            values = values.astype(values.cat.categories.dtype)
+        uniques = pd.Index(values.dropna().unique())
+        new = uniques[self.index.get_indexer(uniques) < 0]
+        if len(new):
+            self.index = self.index.append(new)
+        return self.index.get_indexer(values)
+
+
+class _GroupMoments:
+    """Per-key count, sum, mean and M2, merged chunk by chunk (Chan et al.)."""
+
+    def __init__(self):
+        self.count = np.zeros(0)
+        self.total = np.zeros(0)
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+
+    def add(self, ids: np.ndarray, values: np.ndarray, n_keys: int) -> None:
+        grow = n_keys - len(self.count)
+        if grow > 0:
+            self.count, self.total, self.mean, self.m2 = (
+                np.concatenate([a, np.zeros(grow)]) for a in (self.count, self.total, self.mean, self.m2))
+        present = ids >= 0
+        ids, values = ids[present], values[present]
+        count_b = np.bincount(ids, minlength=n_keys).astype(np.float64)
+        total_b = np.bincount(ids, weights=values, minlength=n_keys)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_b = np.where(count_b > 0, total_b / count_b, 0.0)
+        m2_b = np.bincount(ids, weights=(values - mean_b[ids]) ** 2, minlength=n_keys)
+
+        count = self.count + count_b
+        with np.errstate(invalid="ignore", divide="ignore"):
+            delta = mean_b - self.mean
+            self.mean = np.where(count > 0, self.mean + delta * count_b / count, 0.0)
+            self.m2 = self.m2 + m2_b + np.where(count > 0, delta ** 2 * self.count * count_b / count, 0.0)
+        self.count = count
+        self.total = self.total + total_b
+
+    def std(self) -> np.ndarray:
+        """Sample standard deviation (ddof=1); NaN for keys with fewer than two values."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > 1, np.sqrt(self.m2 / (self.count - 1)), np.nan)
+
+
+class _Pairs:
+    """Distinct (patient id, code id) pairs of one code column."""
+
+    def __init__(self):
+        self.codes = _KeyIndex()
+        self.pairs = np.zeros(0, dtype=np.int64)
+
+    def add(self, patient_ids: np.ndarray, codes: pd.Series) -> None:
+        code_ids = self.codes.ids(codes)
+        present = (patient_ids >= 0) & (code_ids >= 0)
+        chunk_pairs = np.unique((patient_ids[present].astype(np.int64) << 32) | code_ids[present])
+        self.pairs = np.union1d(self.pairs, chunk_pairs)
+
+    def per_patient(self, n_patients: int) -> np.ndarray:
+        return np.bincount(self.pairs >> 32, minlength=n_patients)
+
+
+def _is_code_column(name: str) -> bool:
+    return any(marker in name for marker in _CODE_COLUMN_MARKERS)
+
+
+def _date_ns(dates: pd.Series) -> np.ndarray:
+    return dates.astype("datetime64[ns]").to_numpy().view(np.int64)
+
+
+class _FeatureStats:
+    """Everything pass one learns about the input."""
+
+    def __init__(self, first: pd.DataFrame, amount_col: Optional[str], date_col: Optional[str]):
+        self.amount_col = amount_col or detect_amount_column(first)
+        if date_col is None:
+            date_cols = [c for c in first.columns if pd.api.types.is_datetime64_any_dtype(first[c])]
+            date_col = date_cols[0] if date_cols else None
+        self.date_col = date_col
+        patient_cols, provider_cols = detect_id_columns(first)
+        self.patient_col = patient_cols[0] if patient_cols else None
+        self.provider_col = provider_cols[0] if provider_cols else None
+        self.code_cols = [c for c in first.columns if _is_code_column(c)]
+        # a chunk where a code column is all missing reads as float; the column counts as
+        # text (as in the concatenated frame) once any chunk has text in it
+        self.text_code_cols = set()
+
+        self.amount = _GroupMoments()
+        self.patients, self.providers = _KeyIndex(), _KeyIndex()
+        self.patient_amounts, self.provider_amounts = _GroupMoments(), _GroupMoments()
+        self.code_pairs = {c: _Pairs() for c in self.code_cols}
+        self.row_patients: List[np.ndarray] = []
+        self.row_dates: List[np.ndarray] = []
+
+    def add(self, chunk: pd.DataFrame) -> None:
+        self.text_code_cols.update(c for c in self.code_cols if _is_text_column(chunk[c]))
+        amount = None
+        if self.amount_col:
+            amount = pd.to_numeric(chunk[self.amount_col], errors="coerce").fillna(0.0).to_numpy(dtype=np.float64)
+            self.amount.add(np.zeros(len(chunk), dtype=np.int64), amount, 1)
+
+        if self.patient_col:
+            patient_ids = self.patients.ids(chunk[self.patient_col])
+            if amount is not None:
+                self.patient_amounts.add(patient_ids, amount, len(self.patients))
+                if self.date_col:
+                    self.row_patients.append(patient_ids.astype(np.int32 if len(self.patients) < 2**31 else np.int64))
+                    self.row_dates.append(_date_ns(pd.to_datetime(chunk[self.date_col], errors="coerce")))
+            for c in self.code_cols:
+                self.code_pairs[c].add(patient_ids, chunk[c])
+
+        if self.provider_col and amount is not None:
+            provider_ids = self.providers.ids(chunk[self.provider_col])
+            self.provider_amounts.add(provider_ids, amount, len(self.providers))
+
+    def finish(self) -> None:
+        self.code_cols = [c for c in self.code_cols if c in self.text_code_cols]
+        self.code_pairs = {c: self.code_pairs[c] for c in self.code_cols}
+        self.previous_dates = None
+        if self.row_dates:
+            patient_ids = np.concatenate(self.row_patients).astype(np.int64)
+            self.row_patients = []
+            dates = np.concatenate(self.row_dates)
+            self.row_dates = []
+            self.previous_dates = _previous_claim_dates(patient_ids, dates)
+
+
+def _key_values(values: np.ndarray, ids: np.ndarray, dtype: np.dtype) -> np.ndarray:
+    """Per-row aggregate like a left merge: NaN for rows whose key is missing (which turns
+    integer aggregates into floats, as the merge does)."""
+    present = ids >= 0
+    if present.all():
+        return values[ids].astype(dtype)
+    out = np.full(len(ids), np.nan, dtype=np.float32 if dtype == np.float32 else np.float64)
+    out[present] = values[ids[present]]
+    return out
+
+
+def _enrich(chunk: pd.DataFrame, stats: _FeatureStats, row_offset: int) -> pd.DataFrame:
+    """Add the `create_fraud_features` columns to one chunk, in the same order."""
+    if stats.amount_col:
+        chunk["amount"] = pd.to_numeric(chunk[stats.amount_col], errors="coerce").fillna(0.0)
+        chunk["amount_log1p"] = np.log1p(chunk["amount"].clip(lower=0))
+        chunk["amount_z"] = (chunk["amount"] - stats.amount.mean[0]) / (stats.amount.std()[0] + 1e-9)
+
+    if stats.date_col:
+        chunk["_claim_dt"] = pd.to_datetime(chunk[stats.date_col], errors="coerce")
+        chunk["claim_dayofweek"] = chunk["_claim_dt"].dt.dayofweek.fillna(-1).astype(int)
+        chunk["claim_hour"] = chunk["_claim_dt"].dt.hour.fillna(-1).astype(int)
+    else:
+        chunk["_claim_dt"] = pd.NaT
+
+    patient_ids = stats.patients.index.get_indexer(chunk[stats.patient_col]) if stats.patient_col else None
+    if stats.amount_col:
+        # groupby keeps the amount dtype for sums, and float32 for float32 means and stds
+        total_dtype = chunk["amount"].dtype
+        mean_dtype = np.float32 if total_dtype == np.float32 else np.float64
+    if stats.patient_col and stats.amount_col:
+        moments = stats.patient_amounts
+        chunk["patient_claim_count"] = _key_values(moments.count, patient_ids, np.int64)
+        chunk["patient_total_amount"] = _key_values(moments.total, patient_ids, total_dtype)
+        chunk["patient_mean_amount"] = _key_values(moments.total / np.maximum(moments.count, 1), patient_ids, mean_dtype)
+        chunk["patient_std_amount"] = _key_values(moments.std(), patient_ids, mean_dtype)
+        if stats.date_col:
+            previous = stats.previous_dates[row_offset:row_offset + len(chunk)]
+            chunk["prev_dt"] = pd.Series(previous.view("datetime64[ns]"), index=chunk.index).astype(chunk["_claim_dt"].dtype)
+            chunk["days_since_prev_claim"] = (chunk["_claim_dt"] - chunk["prev_dt"]).dt.days.fillna(-1)
+
+    if stats.provider_col and stats.amount_col:
+        provider_ids = stats.providers.index.get_indexer(chunk[stats.provider_col])
+        moments = stats.provider_amounts
+        chunk["provider_claim_count"] = _key_values(moments.count, provider_ids, np.int64)
+        chunk["provider_total_amount"] = _key_values(moments.total, provider_ids, total_dtype)
+        chunk["provider_mean_amount"] = _key_values(moments.total / np.maximum(moments.count, 1), provider_ids, mean_dtype)
+
+    if stats.code_cols and stats.patient_col:
+        unique_codes = sum(pairs.per_patient(len(stats.patients)) for pairs in stats.code_pairs.values())
+        chunk["patient_unique_codes"] = _key_values(unique_codes, patient_ids, np.int64)
+
+    for f in ("amount", "amount_log1p", "amount_z", "patient_claim_count", "patient_total_amount",
+              "patient_mean_amount", "patient_std_amount", "provider_claim_count", "provider_total_amount",
+              "provider_mean_amount", "days_since_prev_claim", "patient_unique_codes"):
+        if f in chunk.columns:
+            chunk[f] = pd.to_numeric(chunk[f], errors="coerce").fillna(0.0)
+    return chunk
+
+
+def stream_fraud_features(chunks: Callable[[], Iterable[pd.DataFrame]], amount_col: Optional[str] = None,
+                          date_col: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """
+    `create_fraud_features` over a claims stream, in two passes.
+
+    `chunks` is called once per pass and must yield the same chunks (same columns and
+    dtypes, same rows in the same order) both times, e.g. a fresh `pd.read_csv(...,
+    chunksize=...)`. Columns are detected from the first chunk. Yields each chunk with the
+    feature columns added; concatenated they equal `create_fraud_features` on the
+    concatenated input.
+    """
+    stats = None
+    n_rows = 0
+    for chunk in chunks():
+        if stats is None:
+            stats = _FeatureStats(chunk, amount_col, date_col)
+        stats.add(chunk)
+        n_rows += len(chunk)
+    if stats is None:
+        return
+    stats.finish()
+    logging.info("Collected feature statistics over %d rows: %d patients, %d providers",
+                 n_rows, len(stats.patients), len(stats.providers))
+
+    row_offset = 0
+    for chunk in chunks():
+        enriched = _enrich(chunk, stats, row_offset)
+        row_offset += len(chunk)
+        yield enriched
+
+
+def write_fraud_features_csv(chunks: Callable[[], Iterable[pd.DataFrame]], out_path: Path,
+                             cleaned_path: Optional[Path] = None, amount_col: Optional[str] = None,
+                             date_col: Optional[str] = None) -> int:
+    """
+    Stream `stream_fraud_features` to a CSV, and optionally the input columns alone to
+    `cleaned_path`. Returns the number of rows written.
+    """
+    for p in (out_path, cleaned_path):
+        if p is not None:
+            Path(p).parent.mkdir(parents=True, exist_ok=True)
+
+    input_cols: List[str] = []
+
+    def tracked() -> Iterator[pd.DataFrame]:
+        for chunk in chunks():
+            if not input_cols:
+                input_cols.extend(chunk.columns)
+            yield chunk
+
+    n_rows = 0
+    for enriched in stream_fraud_features(tracked, amount_col, date_col):
+        first = n_rows == 0
+        enriched.to_csv(out_path, mode="w" if first else "a", header=first, index=False)
+        if cleaned_path is not None:
+            enriched[input_cols].to_csv(cleaned_path, mode="w" if first else "a", header=first, index=False)
+        n_rows += len(enriched)
+    logging.info("Saved %d feature-engineered rows to %s", n_rows, out_path)
+    return n_rows
@@ -1,41 +1,128 @@
 import hashlib
 import logging
-from typing import List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional
 
 import numpy as np
 import pandas as pd
 
 from .cleaning import detect_id_columns, detect_amount_column
 
+_NAT = np.iinfo(np.int64).min
 
-def deidentify_ids(df: pd.DataFrame, id_cols: List[str], salt: str = "") -> pd.DataFrame:
+
+class IdHasher:
+    """
+    Salted blake2b digests of ID values, computing each distinct value's hash once.
+
+    A column is factorized, only its unique values are converted and hashed, and the
+    digests are gathered back by code, so the output is byte-identical to hashing every
+    row. Digests are memoized across calls, so an ID that repeats across the chunks of a
+    streamed file is hashed once; the memo is in memory only and is cleared once it holds
+    more than `max_memo` values (a raw ID -> hash table kept on disk would itself be PHI).
+    """
+
+    def __init__(self, salt: str = "", max_memo: int = 1_000_000):
+        self.salt = salt
+        self.max_memo = max_memo
+        self._memo: Dict[str, str] = {}
+
+    def _hash_strings(self, strings: pd.Series) -> np.ndarray:
+        codes, uniques = pd.factorize(strings)
+        memo, salt, blake2b = self._memo, self.salt, hashlib.blake2b
+        digests = []
+        for value in uniques.tolist():
+            digest = memo.get(value)
+            if digest is None:
+                digest = memo[value] = blake2b((value + salt).encode("utf-8"), digest_size=10).hexdigest()
+            digests.append(digest)
+        if len(memo) > self.max_memo:
+            memo.clear()
+        return np.array(digests, dtype=object)[codes]
+
+    def hash_series(self, s: pd.Series) -> pd.Series:
+        """Hashes of `s` as str(value) + salt, with missing values hashed as their str() or ""."""
+        codes, uniques = pd.factorize(s)
+        # the same string conversion deidentify_ids applies row by row, on the distinct values only
+        digests = self._hash_strings(pd.Series(uniques).astype(str).fillna(""))
+        hashed = np.empty(len(s), dtype=object)
+        present = codes >= 0
+        hashed[present] = digests[codes[present]]
+        if not present.all():
+            hashed[~present] = self._hash_strings(s[~present].astype(str).fillna(""))
+        return pd.Series(hashed, index=s.index)
+
+
+def deidentify_ids(df: pd.DataFrame, id_cols: List[str], salt: str = "",
+                   hasher: Optional[IdHasher] = None) -> pd.DataFrame:
     """
     Replace sensitive ID columns with deterministic hashes.
     This keeps linkability without exposing raw identifiers.
     By default the raw column is dropped and a suffix "_hash" is added.
+    Pass one `hasher` for every chunk of a file so repeated IDs are hashed once
+    (its salt is used instead of `salt`).
     """
     if not id_cols:
         return df
+    hasher = hasher or IdHasher(salt)
     for c in id_cols:
         new_col = f"{c}_hash"
         logging.info("Hashing id column %s -> %s", c, new_col)
-        df[new_col] = df[c].astype(str).fillna("").apply(
-            lambda x: hashlib.blake2b((x + salt).encode("utf-8"), digest_size=10).hexdigest()
-        )
+        df[new_col] = hasher.hash_series(df[c])
         # Drop raw column to avoid saving PHI
         if c != new_col:
             df = df.drop(columns=[c])
     return df
 
 
-def create_fraud_features(df: pd.DataFrame, amount_col: Optional[str] = None, date_col: Optional[str] = None) -> pd.DataFrame:
+def deidentify_id_chunks(chunks: Iterable[pd.DataFrame], id_cols: List[str], salt: str = "") -> Iterator[pd.DataFrame]:
+    """
+    `deidentify_ids` over a stream of chunks (e.g. `pd.read_csv(..., chunksize=...)`),
+    sharing one IdHasher so IDs seen in earlier chunks aren't hashed again.
+    """
+    hasher = IdHasher(salt)
+    for chunk in chunks:
+        yield deidentify_ids(chunk, id_cols, hasher=hasher)
+
+
+def _is_text_column(s: pd.Series) -> bool:
+    """String columns, including ones stored as category (`categorize_columns`)."""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return pd.api.types.is_string_dtype(s.cat.categories)
+    return pd.api.types.is_string_dtype(s)
+
+
+def _previous_claim_dates(patient_ids: np.ndarray, dates: np.ndarray) -> np.ndarray:
+    """For each row, the date (int64 ns) of the patient's claim before it when sorted by date.
+
+    Ordered like `sort_values([patient, date])`: dates ascending with NaT last, ties in
+    row order. `patient_ids` are integer codes with -1 for a missing patient; those rows
+    get NaT. One stable argsort permutation, so the frame itself is never reordered.
+    """
+    sort_dates = np.where(dates == _NAT, np.iinfo(np.int64).max, dates)
+    order = np.lexsort((sort_dates, patient_ids))
+    sorted_patients = patient_ids[order]
+    previous_sorted = np.full(len(order), _NAT, dtype=np.int64)
+    if len(order) > 1:
+        same = sorted_patients[1:] == sorted_patients[:-1]
+        previous_sorted[1:] = np.where(same, dates[order][:-1], _NAT)
+    previous_sorted[sorted_patients < 0] = _NAT
+    previous = np.empty_like(previous_sorted)
+    previous[order] = previous_sorted
+    return previous
+
+
+def create_fraud_features(df: pd.DataFrame, amount_col: Optional[str] = None, date_col: Optional[str] = None,
+                          inplace: bool = False) -> pd.DataFrame:
     """
     Create lightweight features useful for downstream fraud/anomaly detection training.
 
-    This function delegates internal steps to private helpers; it returns an enriched copy
-    of the input DataFrame and does not fit any model.
+    Returns the input with the feature columns added and does not fit any model. By
+    default the input is left untouched (the result shares its existing columns rather
+    than copying them); with `inplace=True` the columns are added to `df` itself, which
+    is also returned. Rows keep their order.
     """
-    df = df.copy()
+    if not inplace:
+        df = df.copy(deep=False)
 
     # amount-based features
     amount_col = amount_col or detect_amount_column(df)
@@ -61,35 +148,36 @@ def create_fraud_features(df: pd.DataFrame, amount_col: Optional[str] = None, da
     patient_col = patient_cols[0] if patient_cols else None
     provider_col = provider_cols[0] if provider_cols else None
 
-    # per-patient aggregations
+    # per-patient aggregations, broadcast back to the rows (NaN where the patient is missing)
     if patient_col and "amount" in df.columns:
-        agg = df.groupby(patient_col)["amount"].agg(
-            patient_claim_count="count",
-            patient_total_amount="sum",
-            patient_mean_amount="mean",
-            patient_std_amount="std",
-        )
-        df = df.merge(agg, how="left", left_on=patient_col, right_index=True)
+        by_patient = df.groupby(patient_col, sort=False, observed=True)["amount"]
+        df["patient_claim_count"] = by_patient.transform("count")
+        df["patient_total_amount"] = by_patient.transform("sum")
+        df["patient_mean_amount"] = by_patient.transform("mean")
+        df["patient_std_amount"] = by_patient.transform("std")
         if date_col:
-            df = df.sort_values([patient_col, "_claim_dt"])
-            df["prev_dt"] = df.groupby(patient_col)["_claim_dt"].shift(1)
-            df["days_since_prev_claim"] = (df["_claim_dt"] - df["prev_dt"]).dt.days.fillna(-1)
-            df = df.sort_index()
+            claim_dt = df["_claim_dt"]
+            previous = _previous_claim_dates(pd.factorize(df[patient_col])[0].astype(np.int64),
+                                             claim_dt.astype("datetime64[ns]").to_numpy().view(np.int64))
+            df["prev_dt"] = pd.Series(previous.view("datetime64[ns]"), index=df.index).astype(claim_dt.dtype)
+            df["days_since_prev_claim"] = (claim_dt - df["prev_dt"]).dt.days.fillna(-1)
 
     # per-provider aggregations
     if provider_col and "amount" in df.columns:
-        agg_p = df.groupby(provider_col)["amount"].agg(
-            provider_claim_count="count",
-            provider_total_amount="sum",
-            provider_mean_amount="mean",
-        )
-        df = df.merge(agg_p, how="left", left_on=provider_col, right_index=True)
+        by_provider = df.groupby(provider_col, sort=False, observed=True)["amount"]
+        df["provider_claim_count"] = by_provider.transform("count")
+        df["provider_total_amount"] = by_provider.transform("sum")
+        df["provider_mean_amount"] = by_provider.transform("mean")
 
     # count unique diagnosis/procedure codes if such columns exist
-    code_cols = [c for c in df.columns if pd.api.types.is_string_dtype(df[c]) and any(substr in c for substr in ("dx", "diagnosis", "cpt", "procedure", "hcpcs"))]
+    code_cols = [c for c in df.columns if _is_text_column(df[c]) and any(substr in c for substr in ("dx", "diagnosis", "cpt", "procedure", "hcpcs"))]
     if code_cols and patient_col:
-        uniq_codes = df.groupby(patient_col)[code_cols].nunique().sum(axis=1).rename("patient_unique_codes")
-        df = df.merge(uniq_codes, how="left", left_on=patient_col, right_index=True)
+        uniq_codes = df.groupby(patient_col, sort=False, observed=True)[code_cols].transform("nunique")
+        # column by column rather than a row-wise sum; NaN stays NaN for rows without a patient
+        patient_unique_codes = uniq_codes[code_cols[0]]
+        for c in code_cols[1:]:
+            patient_unique_codes = patient_unique_codes + uniq_codes[c]
+        df["patient_unique_codes"] = patient_unique_codes
 
     # fill NaNs and ensure numeric feature columns exist
     numeric_features = [
@@ -0,0 +1,196 @@
+"""Per-file ingestion schema: infer column dtypes and date formats once, reuse for every chunk.
+
+Cleaning each chunk on its own (`clean_column_names`, `infer_and_parse_dates`,
+`downcast_numeric`) repeats the regex and dtype inference for every chunk and can give
+chunks different dtypes, so the table schema depends on whichever chunk came first. A
+`SchemaPlan` is inferred from a sample of the file instead and then applied unchanged:
+
+    plan = infer_schema_plan(csv_path)
+    for chunk in pd.read_csv(csv_path, chunksize=100_000, **plan.read_csv_kwargs()):
+        chunk = plan.apply(chunk)
+
+Plans for a DB are persisted next to it (`<db>.schema.json`) so reruns skip inference
+while the CSV's header, size and modification time are unchanged. A chunk whose values
+don't fit a planned numeric dtype (1.5 in a column sampled as Int64) widens that column
+to float64, or to text, for the rest of the file rather than aborting the ingest; the
+widened plan is written back once the ingest is done, so reruns start from it.
+"""
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+import json
+import logging
+import re
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from .cleaning import DATE_COLUMN_PATTERN, _date_format, _parse_dates, clean_name
+
+# bumped whenever inference changes, so persisted plans are inferred again
+SCHEMA_PLAN_VERSION = 2
+
+
+@dataclass
+class SchemaPlan:
+    """Fixed cleaning/typing decisions for one CSV.
+
+    - columns: raw header name -> cleaned column name
+    - dtypes: raw header name -> planned dtype (text columns are read as text, the others
+      cast after reading)
+    - date_formats: raw header name -> strptime format the column is parsed with
+    - source: [size, mtime_ns] of the CSV the plan was inferred from
+    """
+    columns: Dict[str, str]
+    dtypes: Dict[str, str]
+    date_formats: Dict[str, str] = field(default_factory=dict)
+    version: int = SCHEMA_PLAN_VERSION
+    source: List[int] = field(default_factory=list)
+
+    def read_csv_kwargs(self) -> dict:
+        # text columns are read as text; numeric ones are cast in `apply`, where a value
+        # the sample didn't show (1.5 in an Int64 column) can widen the column instead of
+        # failing inside the reader
+        return {"dtype": {col: dtype for col, dtype in self.dtypes.items() if dtype == "object"}}
+
+    def apply(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        """Cast to the planned dtypes, parse planned date columns and rename to the cleaned names; no inference."""
+        for col, dtype in self.dtypes.items():
+            if col not in chunk.columns:
+                continue
+            if dtype != "object":
+                chunk[col] = self._cast(chunk[col], col, dtype)
+            elif not (pd.api.types.is_object_dtype(chunk[col]) or pd.api.types.is_string_dtype(chunk[col])):
+                # widened to text after the reader was set up: store what later chunks read as text too
+                chunk[col] = _as_text(chunk[col])
+        for col, fmt in self.date_formats.items():
+            chunk[col] = _parse_dates(chunk[col], fmt)
+        return chunk.rename(columns=self.columns)
+
+    def _cast(self, s: pd.Series, col: str, dtype: str) -> pd.Series:
+        """`s` as `dtype`, or widened to float64 (else object) for the rest of the file when it doesn't fit."""
+        try:
+            return s.astype(dtype)
+        except (TypeError, ValueError):
+            pass
+        try:
+            widened, s = "float64", pd.to_numeric(s).astype("float64")
+        except (TypeError, ValueError):
+            widened, s = "object", _as_text(s)
+        logging.warning("Column %s has values the sample didn't show; widening it from %s to %s", col, dtype, widened)
+        self.dtypes[col] = widened
+        return s
+
+    def matches(self, header: List[str], source: List[int]) -> bool:
+        return (self.version == SCHEMA_PLAN_VERSION and list(self.columns) == list(header)
+                and list(self.source) == list(source))
+
+
+def _source_fingerprint(csv_path: Path) -> List[int]:
+    stat = Path(csv_path).stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _as_text(s: pd.Series) -> pd.Series:
+    """Values as strings the way read_csv(dtype=object) gives them; missing stays missing."""
+    if pd.api.types.is_float_dtype(s) and (s.dropna() == s.dropna().round()).all():
+        s = s.astype("Int64")
+    return s.astype(str).astype(object).where(s.notna(), None)
+
+
+def _plan_dtype(s: pd.Series) -> str:
+    """Chunk-stable dtype for a sampled column.
+
+    Integers become nullable "Int64" so a later chunk with a gap can't turn the column
+    into floats. Floats become float32 only when every sampled value survives the round
+    trip through float32 unchanged (the check `pd.to_numeric(downcast="float")` makes),
+    so amounts such as 127755.38 keep float64. Everything else, including columns empty
+    in the sample, stays object.
+    """
+    if pd.api.types.is_bool_dtype(s):
+        return "boolean"
+    if pd.api.types.is_integer_dtype(s):
+        return "Int64"
+    if pd.api.types.is_float_dtype(s) and s.notna().any():
+        values = s.dropna().to_numpy(dtype=np.float64)
+        return "float32" if np.array_equal(values.astype(np.float32).astype(np.float64), values) else "float64"
+    return "object"
+
+
+def infer_schema_plan(csv_path: Path, sample_rows: int = 10_000) -> SchemaPlan:
+    """Infer a `SchemaPlan` from the first `sample_rows` rows of `csv_path`."""
+    sample = pd.read_csv(csv_path, nrows=sample_rows, low_memory=False)
+    columns = {raw: clean_name(raw) for raw in sample.columns}
+
+    dtypes: Dict[str, str] = {}
+    date_formats: Dict[str, str] = {}
+    for raw, name in columns.items():
+        if re.search(DATE_COLUMN_PATTERN, name):
+            fmt = _date_format(sample[raw])
+            if fmt is not None:
+                # read as text so e.g. 20150101 isn't parsed as an integer first
+                dtypes[raw] = "object"
+                date_formats[raw] = fmt
+                continue
+            logging.info("Column %s looks like a date but has no single format in the sample; keeping it as data", raw)
+        dtypes[raw] = _plan_dtype(sample[raw])
+
+    logging.info("Inferred schema for %s from %d rows: %d columns, %d dates",
+                 csv_path, len(sample), len(columns), len(date_formats))
+    return SchemaPlan(columns=columns, dtypes=dtypes, date_formats=date_formats,
+                      source=_source_fingerprint(csv_path))
+
+
+def schema_plan_path(db_path: Path) -> Path:
+    db_path = Path(db_path)
+    return db_path.with_name(db_path.name + ".schema.json")
+
+
+def load_schema_plans(path: Path) -> Dict[str, SchemaPlan]:
+    """Read persisted plans keyed by CSV file name; a missing file gives no plans."""
+    path = Path(path)
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    return {name: SchemaPlan(**plan) for name, plan in raw.items()}
+
+
+def save_schema_plans(path: Path, plans: Dict[str, SchemaPlan]) -> None:
+    path = Path(path)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({name: asdict(plan) for name, plan in sorted(plans.items())}, f, indent=2)
+
+
+def resolve_schema_plans(files: List[Path], db_path: Path, sample_rows: int = 10_000) -> Dict[str, SchemaPlan]:
+    """Plans for `files`, reusing those persisted for `db_path` while the CSV is unchanged
+    (same header, size and modification time).
+
+    Newly inferred plans are written back next to the DB. Delete `<db>.schema.json` to
+    force re-inference.
+    """
+    plan_path = schema_plan_path(db_path)
+    plans = load_schema_plans(plan_path)
+    changed = False
+    for f in files:
+        header = list(pd.read_csv(f, nrows=0).columns)
+        plan = plans.get(f.name)
+        if plan is not None and plan.matches(header, _source_fingerprint(f)):
+            logging.info("Reusing schema plan for %s from %s", f.name, plan_path)
+            continue
+        plans[f.name] = infer_schema_plan(f, sample_rows=sample_rows)
+        changed = True
+    if changed:
+        save_schema_plans(plan_path, plans)
+    return {f.name: plans[f.name] for f in files}
+
+
+def save_widened_schema_plans(plans: Dict[str, SchemaPlan], db_path: Path) -> None:
+    """Write back the plans among `plans` that ingesting widened, keeping the other persisted plans."""
+    plan_path = schema_plan_path(db_path)
+    saved = load_schema_plans(plan_path)
+    widened = {name: plan for name, plan in plans.items() if name in saved and saved[name].dtypes != plan.dtypes}
+    if widened:
+        saved.update(widened)
+        save_schema_plans(plan_path, saved)
+        logging.info("Saved widened schema plans for %s to %s", ", ".join(sorted(widened)), plan_path)
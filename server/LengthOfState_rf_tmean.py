@@ -1,220 +1,72 @@
 import pandas as pd
 import sqlite3
-import joblib
 from pathlib import Path
-from scoring import calculate_score
-
-secondary_diagnosis_cols = [f'ICD_DGNS_CD{i}' for i in range(1, 26)]
-secondary_diagnosis_tmean_cols = [f'ICD_DGNS_CD{i}_TMEAN' for i in range(1, 26)]
-
-def init_claims_length_table(conn):
-    df_inpatient_claims = pd.read_sql_query("SELECT * FROM cms_claims GROUP BY cms_claims.CLM_ID;", conn)
-
-    # create a new table with the claim ID and the number of days between CLM_FROM_DT and CLM_THRU_DT
-    df_inpatient_subset = df_inpatient_claims[['CLM_ID']].copy()
-
-    df_inpatient_subset['CLM_NUM_DAYS'] = (
-        pd.to_datetime(df_inpatient_claims['CLM_THRU_DT']) - pd.to_datetime(df_inpatient_claims['CLM_FROM_DT'])
-    ).dt.days
-
-    # Write the dataframe to a new SQLite table
-    df_inpatient_subset.to_sql('inpatient_claims_length', conn, if_exists='replace', index=False)
-
-def init_prncpal_dgns_cd_tmean_table(conn):
-    df_inpatient_claims = pd.read_sql_query("""
-        SELECT cms_claims.*, inpatient_claims_length.CLM_NUM_DAYS
-        FROM cms_claims
-        JOIN inpatient_claims_length ON cms_claims.CLM_ID = inpatient_claims_length.CLM_ID
-        GROUP BY cms_claims.CLM_ID;
-    """, conn)
-
-    df_inpatient_subset = df_inpatient_claims[['CLM_ID', 'PRNCPAL_DGNS_CD', 'CLM_NUM_DAYS']].copy()
-
-    principal_code_tmean = df_inpatient_subset.groupby('PRNCPAL_DGNS_CD')['CLM_NUM_DAYS'].mean().reset_index()
-    principal_code_tmean.rename(columns={'CLM_NUM_DAYS': 'PRNCPAL_DGNS_CD_TMEAN'}, inplace=True)
-
-    # Write the dataframe to a new SQLite table
-    principal_code_tmean.to_sql('inpatient_prncpal_dgns_cd_tmean', conn, if_exists='replace', index=False)
-
-def init_secondary_dgns_cd_tmean_table(conn):
-    df_inpatient_claims = pd.read_sql_query("""
-        SELECT cms_claims.*, inpatient_claims_length.CLM_NUM_DAYS
-        FROM cms_claims
-        JOIN inpatient_claims_length ON cms_claims.CLM_ID = inpatient_claims_length.CLM_ID
-        GROUP BY cms_claims.CLM_ID;
-    """, conn)
-
-    df_inpatient_subset = df_inpatient_claims[secondary_diagnosis_cols + ['CLM_ID', 'CLM_NUM_DAYS']].copy()
-
-    # Get all unique codes across all 25 columns
-    all_secondary_codes = pd.unique(df_inpatient_subset[secondary_diagnosis_cols].values.ravel())
-
-    secondary_code_tmean = {}
-    for code in all_secondary_codes:
-        if pd.isna(code) or code == 'None':
-            continue
-        mask = (df_inpatient_subset[secondary_diagnosis_cols] == code).any(axis=1)
-        secondary_code_tmean[code] = df_inpatient_subset.loc[mask, 'CLM_NUM_DAYS'].mean()
+from claims_access import read_claims
+from pipeline import ModelSpec, init_model_tables, load_tmean_tables, predict, score_models
+from tmean import tmean_lookups
+
+def claim_num_days(df_claims):
+    """
+    Number of days between CLM_FROM_DT and CLM_THRU_DT.
+    """
+    return (pd.to_datetime(df_claims['CLM_THRU_DT']) - pd.to_datetime(df_claims['CLM_FROM_DT'])).dt.days
+
+length_of_stay_model = ModelSpec(
+    name='iso_diff-length-of-stay',
+    target_col='CLM_NUM_DAYS',
+    target=claim_num_days,
+    source_cols=['CLM_FROM_DT', 'CLM_THRU_DT'],
+    # floored like .dt.days (CAST alone truncates towards zero)
+    target_sql='CAST(julianday(c."CLM_THRU_DT") - julianday(c."CLM_FROM_DT") + 1000000 AS INTEGER) - 1000000',
+    rf_model_path=Path(__file__).parent / "models/rf-length-of-stay.pkl",
+    iso_model_path=Path(__file__).parent / "models/iso_diff-length-of-stay.pkl",
+    predictions_table='inpatient_length_of_stay_predictions',
+    principal_tmean_table='inpatient_prncpal_dgns_cd_tmean',
+    secondary_tmean_table='inpatient_secondary_dgns_cd_tmean',
+)
+model_name = length_of_stay_model.name
+rf_model_path = length_of_stay_model.rf_model_path
+iso_model_path = length_of_stay_model.iso_model_path
 
-    secondary_code_tmean_df = pd.DataFrame(list(secondary_code_tmean.items()), columns=['SECONDARY_DGNS_CD', 'SECONDARY_DGNS_TMEAN'])
+def init_claims_length_table(conn, chunk_rows=250_000):
+    conn.execute('DROP TABLE IF EXISTS inpatient_claims_length;')
+    chunks = read_claims(conn, ['CLM_ID', 'CLM_FROM_DT', 'CLM_THRU_DT'], chunk_rows=chunk_rows)
+    for df_inpatient_claims in chunks:
+        # create a new table with the claim ID and the number of days between CLM_FROM_DT and CLM_THRU_DT
+        df_inpatient_subset = df_inpatient_claims[['CLM_ID']].copy()
 
-    # # Write the dataframe to a new SQLite table
-    secondary_code_tmean_df.to_sql('inpatient_secondary_dgns_cd_tmean', conn, if_exists='replace', index=False)
+        df_inpatient_subset['CLM_NUM_DAYS'] = claim_num_days(df_inpatient_claims)
 
-def init_prediction_table(conn):
-    # Create an empty table to store predictions
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS "inpatient_length_of_stay_predictions" (
-"CLM_ID" INTEGER,
-  "PRNCPAL_DGNS_CD" TEXT,
-  "CLM_NUM_DAYS" INTEGER,
-  "ICD_DGNS_CD1" TEXT,
-  "ICD_DGNS_CD2" TEXT,
-  "ICD_DGNS_CD3" TEXT,
-  "ICD_DGNS_CD4" TEXT,
-  "ICD_DGNS_CD5" TEXT,
-  "ICD_DGNS_CD6" TEXT,
-  "ICD_DGNS_CD7" TEXT,
-  "ICD_DGNS_CD8" TEXT,
-  "ICD_DGNS_CD9" TEXT,
-  "ICD_DGNS_CD10" TEXT,
-  "ICD_DGNS_CD11" TEXT,
-  "ICD_DGNS_CD12" TEXT,
-  "ICD_DGNS_CD13" TEXT,
-  "ICD_DGNS_CD14" TEXT,
-  "ICD_DGNS_CD15" TEXT,
-  "ICD_DGNS_CD16" TEXT,
-  "ICD_DGNS_CD17" TEXT,
-  "ICD_DGNS_CD18" TEXT,
-  "ICD_DGNS_CD19" TEXT,
-  "ICD_DGNS_CD20" TEXT,
-  "ICD_DGNS_CD21" TEXT,
-  "ICD_DGNS_CD22" TEXT,
-  "ICD_DGNS_CD23" TEXT,
-  "ICD_DGNS_CD24" TEXT,
-  "ICD_DGNS_CD25" TEXT,
-  "PRNCPAL_DGNS_CD_TMEAN" REAL,
-  "ICD_DGNS_CD1_TMEAN" REAL,
-  "ICD_DGNS_CD2_TMEAN" REAL,
-  "ICD_DGNS_CD3_TMEAN" REAL,
-  "ICD_DGNS_CD4_TMEAN" REAL,
-  "ICD_DGNS_CD5_TMEAN" REAL,
-  "ICD_DGNS_CD6_TMEAN" REAL,
-  "ICD_DGNS_CD7_TMEAN" REAL,
-  "ICD_DGNS_CD8_TMEAN" REAL,
-  "ICD_DGNS_CD9_TMEAN" REAL,
-  "ICD_DGNS_CD10_TMEAN" REAL,
-  "ICD_DGNS_CD11_TMEAN" REAL,
-  "ICD_DGNS_CD12_TMEAN" REAL,
-  "ICD_DGNS_CD13_TMEAN" REAL,
-  "ICD_DGNS_CD14_TMEAN" REAL,
-  "ICD_DGNS_CD15_TMEAN" REAL,
-  "ICD_DGNS_CD16_TMEAN" REAL,
-  "ICD_DGNS_CD17_TMEAN" REAL,
-  "ICD_DGNS_CD18_TMEAN" REAL,
-  "ICD_DGNS_CD19_TMEAN" REAL,
-  "ICD_DGNS_CD20_TMEAN" REAL,
-  "ICD_DGNS_CD21_TMEAN" REAL,
-  "ICD_DGNS_CD22_TMEAN" REAL,
-  "ICD_DGNS_CD23_TMEAN" REAL,
-  "ICD_DGNS_CD24_TMEAN" REAL,
-  "ICD_DGNS_CD25_TMEAN" REAL,
-  "CLM_NUM_DAYS_RF_PRED" REAL,
-  "CLM_NUM_DAYS_IFOREST_DIFF_SCORE" REAL
-)
-    """)
+        # Write each chunk to the new SQLite table
+        df_inpatient_subset.to_sql('inpatient_claims_length', conn, if_exists='append', index=False)
     conn.commit()
 
 def init_lengthOfStay_db_tables(sqlite_db_path):
     # Connect to the local SQLite database
     conn = sqlite3.connect(sqlite_db_path)
 
+    # claims_dedup was just materialized by server.init_database
     init_claims_length_table(conn)
-    init_prncpal_dgns_cd_tmean_table(conn)
-    init_secondary_dgns_cd_tmean_table(conn)
-    init_prediction_table(conn)
+    init_model_tables(conn, length_of_stay_model)
 
     conn.close()
 
-def score_length_of_stay(sqlite_db_path, fraud_threshold):
-    # Refactor this into different functions, this is a mess
-    conn = sqlite3.connect(sqlite_db_path)
-
-    # get the data we need
-    df_inpatient_claims = pd.read_sql_query("""
-        SELECT cms_claims.*, inpatient_claims_length.CLM_NUM_DAYS
-        FROM cms_claims
-        JOIN inpatient_claims_length ON cms_claims.CLM_ID = inpatient_claims_length.CLM_ID
-        WHERE cms_claims.CLM_ID NOT IN (
-            SELECT CLM_ID FROM inpatient_length_of_stay_predictions
-        )
-        GROUP BY cms_claims.CLM_ID;
-    """, conn)
+def load_length_of_stay_tmean_tables(conn):
+    return load_tmean_tables(conn, length_of_stay_model)
 
-    if df_inpatient_claims.empty:
-        print("No claims to score.")
-        conn.close()
-        return
+def predict_length_of_stay(df_inpatient_claims, df_principal_tmean, df_secondary_tmean):
+    """
+    Run the RF and the residual isolation forest over claims already in memory.
 
-    df_principal_tmean = pd.read_sql_query("SELECT * FROM inpatient_prncpal_dgns_cd_tmean;", conn)
-    df_secondary_tmean = pd.read_sql_query("SELECT * FROM inpatient_secondary_dgns_cd_tmean;", conn)
+    Args:
+        df_inpatient_claims (DataFrame): one row per claim, with CLM_NUM_DAYS
+        df_principal_tmean, df_secondary_tmean (DataFrame): tmean tables
 
-    print(f"Scoring {len(df_inpatient_claims)} claims.")
+    Returns:
+        DataFrame: the scoring frame with CLM_NUM_DAYS_RF_PRED and
+        CLM_NUM_DAYS_IFOREST_DIFF_SCORE added
+    """
+    return predict(length_of_stay_model, df_inpatient_claims, tmean_lookups(df_principal_tmean, df_secondary_tmean))
 
-    # build the df we need for scoring (this entire section could be SQL)
-    df_inpatient_claims_subset = df_inpatient_claims[['CLM_ID', 'PRNCPAL_DGNS_CD', 'CLM_NUM_DAYS'] + secondary_diagnosis_cols].copy()
-
-    # Merge principal diagnosis tmean
-    df_inpatient_claims_subset = df_inpatient_claims_subset.merge(df_principal_tmean, how='left', left_on='PRNCPAL_DGNS_CD', right_on='PRNCPAL_DGNS_CD')
-
-    # Merge secondary diagnosis tmean for each ICD_DGNS_CD[1:25]
-    for col in secondary_diagnosis_cols:
-        df_inpatient_claims_subset = df_inpatient_claims_subset.merge(
-            df_secondary_tmean,
-            how='left',
-            left_on=col,
-            right_on='SECONDARY_DGNS_CD',
-            suffixes=('', '_dup')
-        ).rename(columns={'SECONDARY_DGNS_TMEAN': f'{col}_TMEAN'})
-
-    # I don't understand why this is needed yet. The merge above is confusing
-    # I wouuld fix this, but hackathon /excuses
-    df_inpatient_claims_subset.drop(columns=['SECONDARY_DGNS_CD', 'SECONDARY_DGNS_CD_dup'], inplace=True)
-    
-    # run the random forest length of stay prediction model
-    root_dir = Path(__file__).parent
-    rf_length_of_stay = joblib.load(root_dir / "models/rf-length-of-stay.pkl")
-
-    X_test = df_inpatient_claims_subset[secondary_diagnosis_tmean_cols + ['PRNCPAL_DGNS_CD_TMEAN']]
-
-    y_test_pred = rf_length_of_stay.predict(X_test)
-    df_inpatient_claims_subset.loc[df_inpatient_claims_subset.index, 'CLM_NUM_DAYS_RF_PRED'] = y_test_pred
-
-    # run the isolation forest to get the anomaly score
-    iso_diff = joblib.load(root_dir / "models/iso_diff-length-of-stay.pkl")
-
-    diff_days_inpatient = df_inpatient_claims_subset['CLM_NUM_DAYS'] - df_inpatient_claims_subset['CLM_NUM_DAYS_RF_PRED']
-
-    diff_reshape = diff_days_inpatient.values.reshape(-1, 1)
-
-    decision_scores = iso_diff.decision_function(diff_reshape)
-
-    df_inpatient_claims_subset['CLM_NUM_DAYS_IFOREST_DIFF_SCORE'] = decision_scores
-
-    # Save the results back to a new table in the database
-    df_inpatient_claims_subset.to_sql('inpatient_length_of_stay_predictions', conn, if_exists='append', index=False)
-
-    # Write any anomaly scores lower than the threshold to a fraud table
-    df_fraud_length_of_stay = df_inpatient_claims_subset[df_inpatient_claims_subset['CLM_NUM_DAYS_IFOREST_DIFF_SCORE'] < fraud_threshold].copy()
-
-    df_fraud_length_of_stay['model_name'] = 'iso_diff-length-of-stay'
-    df_fraud_length_of_stay_to_write = df_fraud_length_of_stay[['CLM_ID', 'model_name', 'CLM_NUM_DAYS_IFOREST_DIFF_SCORE']].copy()
-    df_fraud_length_of_stay_to_write['score'] = df_fraud_length_of_stay_to_write['CLM_NUM_DAYS_IFOREST_DIFF_SCORE'].apply(calculate_score)
-    df_fraud_length_of_stay_to_write.drop(columns=['CLM_NUM_DAYS_IFOREST_DIFF_SCORE'], inplace=True)
-
-    print(f"Found {len(df_fraud_length_of_stay_to_write)} claims with scores below the threshold {fraud_threshold}.")
-
-    df_fraud_length_of_stay_to_write.to_sql('fraud', conn, if_exists='append', index=False)
-
-    conn.close()
+def score_length_of_stay(sqlite_db_path, fraud_threshold, claims_parquet_dir=None):
+    score_models(sqlite_db_path, [length_of_stay_model], fraud_threshold, claims_parquet_dir)
@@ -0,0 +1,188 @@
+from pathlib import Path
+
+import pandas as pd
+
+from incremental import ensure_clm_id_index, get_watermark, set_watermark
+from tmean import secondary_diagnosis_cols
+
+# every claims column any model stage reads, with the type it is stored as
+claims_dedup_types = {
+    'CLM_ID': 'INTEGER',
+    'PRNCPAL_DGNS_CD': 'TEXT',
+    'CLM_TOT_CHRG_AMT': 'REAL',
+    'CLM_FROM_DT': 'TEXT',
+    'CLM_THRU_DT': 'TEXT',
+    **{col: 'TEXT' for col in secondary_diagnosis_cols},
+}
+claims_dedup_cols = list(claims_dedup_types)
+
+def _quoted(columns, alias=None):
+    prefix = f'{alias}.' if alias else ''
+    return ', '.join(f'{prefix}"{c}"' for c in columns)
+
+def materialize_claims_dedup(conn, source_table='cms_claims'):
+    """
+    (Re)build claims_dedup: one typed row per CLM_ID holding only the columns
+    the models use, in order of each claim's first line in `source_table`.
+    """
+    columns = ',\n            '.join(f'"{c}" {t}' for c, t in claims_dedup_types.items())
+    conn.execute("DROP TABLE IF EXISTS claims_dedup;")
+    conn.execute(f"""
+        CREATE TABLE claims_dedup (
+            {columns}
+        );
+    """)
+    ensure_clm_id_index(conn, 'claims_dedup', unique=True)
+    # the watermarks described the old table; start over
+    set_watermark(conn, 'claims_dedup', source_table, 0, None)
+    set_watermark(conn, 'claims_dedup_parquet', 'claims_dedup', 0, None)
+    return refresh_claims_dedup(conn, source_table)
+
+def refresh_claims_dedup(conn, source_table='cms_claims'):
+    """
+    Append claims whose lines arrived in `source_table` since the last refresh.
+
+    Claims already present are left alone (INSERT OR IGNORE on the unique
+    CLM_ID), so the work is proportional to the new lines only.
+
+    Returns:
+        int: number of claims added
+    """
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'claims_dedup';").fetchone()
+    if exists is None:
+        return materialize_claims_dedup(conn, source_table)
+
+    last_rowid, _ = get_watermark(conn, 'claims_dedup', source_table)
+    high_rowid = conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM "{source_table}";').fetchone()[0]
+
+    # MIN(rowid) makes SQLite take the bare columns from each claim's first line
+    cursor = conn.execute(f"""
+        INSERT OR IGNORE INTO claims_dedup ({_quoted(claims_dedup_cols)})
+        SELECT {_quoted(claims_dedup_cols)}
+        FROM (
+            SELECT MIN(rowid) AS first_rowid, {_quoted(claims_dedup_cols)}
+            FROM "{source_table}"
+            WHERE rowid > ? AND rowid <= ?
+            GROUP BY CLM_ID
+        )
+        ORDER BY first_rowid;
+    """, (last_rowid, high_rowid))
+    added = cursor.rowcount
+    conn.commit()
+
+    set_watermark(conn, 'claims_dedup', source_table, high_rowid, None)
+    if added:
+        print(f"Added {added} claims to claims_dedup.")
+    return added
+
+def read_claims(conn, columns, order_by='CLM_ID', chunk_rows=None):
+    """
+    Read only `columns` of the deduplicated claims.
+
+    Args:
+        columns (list[str]): subset of claims_dedup_cols
+        order_by (str, optional): ordering column; CLM_ID matches the order
+            the old `SELECT * ... GROUP BY CLM_ID` reads produced
+        chunk_rows (int, optional): stream the claims as an iterator of
+            DataFrames of this many rows instead of reading them all; the
+            CLM_ID order comes from its unique index, so nothing is sorted
+            in memory
+    """
+    order = f' ORDER BY "{order_by}"' if order_by else ''
+    return pd.read_sql_query(f"SELECT {_quoted(columns)} FROM claims_dedup{order};", conn, chunksize=chunk_rows)
+
+def claim_columns_sql(columns, alias='c'):
+    """
+    Column list for read_claims_since(columns=...).
+    """
+    return _quoted(columns, alias)
+
+def _require_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Reading claims from Parquet needs pyarrow: pip install pyarrow") from e
+    return pa, pq
+
+def export_claims_parquet(conn, parquet_dir, chunk_rows=250_000, row_group_rows=64_000):
+    """
+    Append claims_dedup rows not yet exported to a directory of Parquet parts.
+
+    Each part covers a rowid range and carries the claims_dedup rowid as
+    `_rowid`, written in rowid order, so row-group statistics let a
+    `_rowid > watermark` filter skip everything already scored. Parts are
+    never rewritten; the export position is kept as the 'claims_dedup_parquet'
+    watermark.
+
+    Returns:
+        int: number of claims exported
+    """
+    pa, pq = _require_pyarrow()
+    parquet_dir = Path(parquet_dir)
+    parquet_dir.mkdir(parents=True, exist_ok=True)
+
+    last_rowid, _ = get_watermark(conn, 'claims_dedup_parquet', 'claims_dedup')
+    if last_rowid == 0:
+        # claims_dedup was rebuilt (or never exported): drop parts of the old table
+        for part in parquet_dir.glob('part-*.parquet'):
+            part.unlink()
+    high_rowid = conn.execute('SELECT COALESCE(MAX(rowid), 0) FROM claims_dedup;').fetchone()[0]
+    if high_rowid <= last_rowid:
+        return 0
+
+    chunks = pd.read_sql_query(f"""
+        SELECT rowid AS _rowid, {_quoted(claims_dedup_cols)}
+        FROM claims_dedup
+        WHERE rowid > ? AND rowid <= ?
+        ORDER BY rowid;
+    """, conn, params=(last_rowid, high_rowid), chunksize=chunk_rows)
+
+    path = parquet_dir / f'part-{last_rowid + 1:012d}-{high_rowid:012d}.parquet'
+    # dot-prefixed files are skipped by the Parquet dataset reader until renamed
+    tmp_path = parquet_dir / f'.{path.name}.tmp'
+    writer = None
+    exported = 0
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(str(tmp_path), table.schema, compression='zstd')
+            writer.write_table(table.cast(writer.schema), row_group_size=row_group_rows)
+            exported += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    # only complete parts are visible to readers
+    tmp_path.replace(path)
+
+    set_watermark(conn, 'claims_dedup_parquet', 'claims_dedup', high_rowid, None)
+    print(f"Exported {exported} claims to {path}.")
+    return exported
+
+def read_claims_since(conn, last_rowid, columns, high_rowid=None, chunk_rows=None):
+    """
+    claims_dedup rows with rowid in (last_rowid, high_rowid], only `columns`
+    plus the rowid as `_rowid`, ordered by CLM_ID; an iterator of DataFrames
+    of `chunk_rows` rows if that is given.
+    """
+    if high_rowid is None:
+        high_rowid = conn.execute('SELECT COALESCE(MAX(rowid), 0) FROM claims_dedup;').fetchone()[0]
+    return pd.read_sql_query(f"""
+        SELECT c.rowid AS _rowid, {claim_columns_sql(columns)}
+        FROM claims_dedup AS c
+        WHERE c.rowid > ? AND c.rowid <= ?
+        ORDER BY c.CLM_ID;
+    """, conn, params=(last_rowid, high_rowid), chunksize=chunk_rows)
+
+def read_claims_parquet_since(parquet_dir, last_rowid, columns):
+    """
+    Parquet counterpart of read_claims_since: only `columns` (plus `_rowid`)
+    are read, and `_rowid > last_rowid` is pushed down into the scan.
+    """
+    _, pq = _require_pyarrow()
+    table = pq.read_table(str(parquet_dir), columns=['_rowid'] + list(columns),
+                          filters=[('_rowid', '>', last_rowid)], memory_map=True)
+    df_claims = table.to_pandas(split_blocks=True, self_destruct=True)
+    # same row order as the SQLite read
+    return df_claims.sort_values('CLM_ID', kind='stable').reset_index(drop=True)
@@ -0,0 +1,132 @@
+# Persistent integer vocabulary for diagnosis codes and other code/ID columns.
+#
+# code_dictionary gives every (kind, code) a dense integer id, assigned in the
+# order codes are first added and never changed afterwards. A CodeDictionary is
+# one kind's vocabulary in memory, as a pandas Index whose positions are the ids,
+# so a column converted with categorize() is a Categorical whose integer codes
+# *are* the dictionary ids: the 26 diagnosis columns of a scoring batch then take
+# 1-4 bytes a cell instead of a Python string each, melting and grouping them
+# hashes small integers, and a tmean lookup resolves the vocabulary once and then
+# only gathers by id (tmean.ClaimCodes, tmean.TmeanLookup).
+#
+# Ids are dense per kind, and new codes are numbered after the highest id this
+# process has loaded, so only one process should add codes at a time (as with
+# the scoring watermarks).
+
+import numpy as np
+import pandas as pd
+
+# principal and secondary diagnosis codes share one vocabulary
+ICD_CODES = 'icd'
+
+def init_code_dictionary(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS code_dictionary (
+            kind TEXT NOT NULL,
+            code TEXT NOT NULL,
+            code_id INTEGER NOT NULL,
+            PRIMARY KEY (kind, code),
+            UNIQUE (kind, code_id)
+        ) WITHOUT ROWID;
+    """)
+    conn.commit()
+
+class CodeDictionary:
+    """
+    One kind's code -> id vocabulary.
+
+    Args:
+        kind (str): the vocabulary's name in code_dictionary
+        codes (list[str], optional): codes in id order
+    """
+
+    def __init__(self, kind, codes=()):
+        self.kind = kind
+        self._set_categories(pd.Index(list(codes), dtype=object))
+
+    @classmethod
+    def load(cls, conn, kind=ICD_CODES):
+        """
+        The vocabulary as stored in code_dictionary (empty if there is none yet).
+        """
+        init_code_dictionary(conn)
+        rows = conn.execute("SELECT code FROM code_dictionary WHERE kind = ? ORDER BY code_id;", (kind,)).fetchall()
+        return cls(kind, [code for code, in rows])
+
+    def _set_categories(self, categories):
+        # a new Index (and dtype) only when codes are added, so lookups cached
+        # against the old one stay valid until then
+        self.categories = categories
+        self.dtype = pd.CategoricalDtype(categories)
+
+    def __len__(self):
+        return len(self.categories)
+
+    def ids(self, values):
+        """
+        Dictionary ids of `values`; -1 for missing values and unknown codes.
+
+        Returns:
+            ndarray: int32 ids, one per value
+        """
+        values = np.asarray(values, dtype=object)
+        codes, uniques = pd.factorize(values.ravel())
+        return self._gather_ids(codes, uniques).reshape(values.shape)
+
+    def _gather_ids(self, codes, uniques):
+        # only the distinct values are looked up; code -1 (missing) picks the trailing -1
+        return np.append(self.categories.get_indexer(uniques), -1).astype(np.int32)[codes]
+
+    def add(self, conn, values):
+        """
+        Give the codes among `values` that have no id yet the next free ids,
+        and store them.
+
+        Returns:
+            int: number of codes added
+        """
+        codes = pd.unique(np.asarray(values, dtype=object).ravel())
+        codes = codes[~pd.isna(codes)]
+        new = pd.Index(codes[self.categories.get_indexer(codes) < 0], dtype=object)
+        if len(new) == 0:
+            return 0
+
+        start = len(self.categories)
+        init_code_dictionary(conn)
+        with conn:
+            conn.executemany(
+                "INSERT INTO code_dictionary (kind, code, code_id) VALUES (?, ?, ?);",
+                ((self.kind, str(code), start + i) for i, code in enumerate(new)),
+            )
+        self._set_categories(self.categories.append(new))
+        return len(new)
+
+    def categorical(self, values):
+        """
+        `values` as a Categorical over the whole vocabulary; unknown codes
+        become missing.
+        """
+        return pd.Categorical.from_codes(self.ids(values), dtype=self.dtype)
+
+    def categorize(self, df, columns, conn=None):
+        """
+        Convert `columns` of `df` in place to Categoricals sharing this
+        vocabulary, adding (and storing) any new codes first if `conn` is given.
+
+        Returns:
+            DataFrame: df
+        """
+        matrix = df[columns].to_numpy(dtype=object)
+        codes, uniques = pd.factorize(matrix.ravel())
+        if conn is not None:
+            self.add(conn, uniques)
+        ids = self._gather_ids(codes, uniques).reshape(matrix.shape)
+        for i, col in enumerate(columns):
+            df[col] = pd.Series(pd.Categorical.from_codes(ids[:, i], dtype=self.dtype), index=df.index)
+        return df
+
+    def decode(self, ids):
+        """
+        Codes for dictionary ids; None for -1.
+        """
+        return np.append(np.asarray(self.categories, dtype=object), None)[np.asarray(ids)]
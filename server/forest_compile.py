@@ -0,0 +1,439 @@
+# Array-based inference for the fraud models' forests.
+#
+# sklearn's RandomForestRegressor.predict validates its input, dispatches one
+# joblib task per tree and allocates a prediction array per tree, which
+# dominates the cost of scoring a handful of claims. compile_forest flattens a
+# fitted forest into a few packed node arrays that CompiledForest.predict
+# walks directly, with the same float32 features, float64 thresholds,
+# missing-value routing and tree-by-tree summation as sklearn, so predictions
+# are bit-identical.
+#
+# With numba installed the walk is a compiled loop; without it, a NumPy
+# engine walks a block of rows through every tree at once.
+#
+# The residual isolation forests see a single feature, so their
+# decision_function is a step function of it: constant between consecutive
+# split thresholds of all trees. compile_iso_lookup evaluates it once per step
+# and IsoScoreLookup scores with one np.searchsorted.
+#
+# Export the models once to skip unpickling them at startup:
+#
+#     python forest_compile.py models/rf-total-charge.pkl models/iso_diff-total-charge.pkl
+
+import argparse
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from model_registry import file_digest, load_model
+
+_numba_kernel = None
+
+def _compiled_kernel():
+    """
+    The numba traversal loop, compiled on first use; None without numba.
+    """
+    global _numba_kernel
+    if _numba_kernel is None:
+        try:
+            import numba
+        except ImportError:
+            _numba_kernel = False
+            return None
+
+        @numba.njit(nogil=True, cache=True)
+        def kernel(X, feature, threshold, left, right, missing_left, value, roots, out):
+            # tree by tree, like sklearn: one tree's nodes stay in cache for
+            # every row, and each row's sum is added up in the same order
+            out[:] = 0.0
+            for tree in range(roots.shape[0]):
+                root = roots[tree]
+                for i in range(X.shape[0]):
+                    node = root
+                    while left[node] != node:
+                        x = X[i, feature[node]]
+                        if np.isnan(x):
+                            go_left = missing_left[node]
+                        else:
+                            go_left = x <= threshold[node]
+                        node = left[node] if go_left else right[node]
+                    out[i] += value[node]
+            out /= roots.shape[0]
+
+        _numba_kernel = kernel
+    return _numba_kernel or None
+
+class CompiledForest:
+    """
+    A fitted RandomForestRegressor as packed node arrays.
+
+    The nodes of all trees are concatenated: `feature`, `threshold`, `left`,
+    `right`, `missing_left` and `value` are indexed by a global node id and
+    `roots` holds the id of each tree's root. Leaves are their own left and
+    right child, so a walk ends at the first node that points to itself.
+    """
+
+    def __init__(self, feature, threshold, left, right, missing_left, value, roots, max_depth,
+                 feature_names=None, source_sha256=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing_left = missing_left
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.feature_names = list(feature_names) if feature_names is not None else None
+        self.source_sha256 = source_sha256
+        self._numpy_nodes = None
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def _features(self, X):
+        if isinstance(X, pd.DataFrame) and self.feature_names is not None:
+            X = X[self.feature_names]
+        # sklearn casts to float32 before walking the trees; thresholds stay float64
+        return np.ascontiguousarray(X, dtype=np.float32)
+
+    def predict(self, X, engine=None):
+        """
+        Mean of the trees' leaf values for every row of X.
+
+        Args:
+            X (DataFrame | ndarray): features, in the order the forest was fit on
+            engine (str, optional): 'numba' or 'numpy'; by default numba when
+                it is installed
+
+        Returns:
+            ndarray: float64 predictions
+        """
+        X = self._features(X)
+        kernel = _compiled_kernel() if engine in (None, 'numba') else None
+        if kernel is None:
+            if engine == 'numba':
+                raise ImportError("The numba engine needs numba: pip install numba")
+            return self._predict_numpy(X)
+
+        predictions = np.empty(len(X), dtype=np.float64)
+        kernel(X, self.feature, self.threshold, self.left, self.right, self.missing_left,
+               self.value, self.roots, predictions)
+        return predictions
+
+    def _predict_numpy(self, X, block_rows=4096):
+        n_rows, n_cols = X.shape
+        n_trees = self.n_trees
+        # Missing values are routed without a separate isnan test: each row is
+        # laid out twice, first with NaN as -inf (always goes left) and then
+        # as is (NaN <= threshold is false, so it goes right, also past the
+        # inf thresholds sklearn uses to split off missing values), and each
+        # node reads the copy its missing_go_to_left picks.
+        if self._numpy_nodes is None or self._numpy_nodes[0] != n_cols:
+            # children[2 * node + go_left]
+            self._numpy_nodes = (n_cols, self.feature + np.where(self.missing_left, 0, n_cols),
+                                 np.stack([self.right, self.left], axis=1).ravel())
+        _, feature, children = self._numpy_nodes
+
+        predictions = np.empty(n_rows, dtype=np.float64)
+        for start in range(0, n_rows, block_rows):
+            block = X[start:start + block_rows]
+            n_block = len(block)
+            rows = np.concatenate([np.where(np.isnan(block), -np.inf, block), block], axis=1).astype(np.float32).ravel()
+
+            # one entry per (row, tree) still walking; finished ones drop out
+            position = np.arange(n_block * n_trees, dtype=np.intp)
+            row_offset = np.repeat(np.arange(n_block, dtype=np.intp) * (2 * n_cols), n_trees)
+            nodes = np.tile(self.roots, n_block)
+            leaves = nodes.copy()
+            for _ in range(self.max_depth):
+                x = np.take(rows, row_offset + np.take(feature, nodes))
+                go_left = x <= np.take(self.threshold, nodes)
+                next_nodes = np.take(children, 2 * nodes + go_left)
+                leaves[position] = next_nodes
+                # leaves point to themselves
+                walking = next_nodes != nodes
+                position, row_offset, nodes = position[walking], row_offset[walking], next_nodes[walking]
+                if not len(nodes):
+                    break
+
+            leaf_values = np.take(self.value, leaves).reshape(n_block, n_trees)
+            # accumulate tree by tree, in the order sklearn adds them up
+            total = leaf_values[:, 0].copy()
+            for tree in range(1, n_trees):
+                total += leaf_values[:, tree]
+            predictions[start:start + n_block] = total / n_trees
+        return predictions
+
+    def save(self, path):
+        np.savez(
+            path, feature=self.feature, threshold=self.threshold, left=self.left, right=self.right,
+            missing_left=self.missing_left, value=self.value, roots=self.roots,
+            max_depth=np.array(self.max_depth),
+            feature_names=np.array(self.feature_names if self.feature_names is not None else [], dtype=str),
+            source_sha256=np.array(self.source_sha256 or ''),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            feature_names = arrays['feature_names'].tolist() or None
+            return cls(
+                arrays['feature'], arrays['threshold'], arrays['left'], arrays['right'],
+                arrays['missing_left'], arrays['value'], arrays['roots'], arrays['max_depth'],
+                feature_names=feature_names, source_sha256=str(arrays['source_sha256']) or None,
+            )
+
+def compile_forest(rf, source_sha256=None):
+    """
+    Flatten a fitted single-output RandomForestRegressor into a CompiledForest.
+
+    Args:
+        rf (RandomForestRegressor): fitted forest
+        source_sha256 (str, optional): hash of the artifact it was loaded from
+    """
+    if getattr(rf, 'n_outputs_', 1) != 1:
+        raise ValueError("compile_forest only supports single-output regressors")
+
+    features, thresholds, lefts, rights, missing_lefts, values, roots = [], [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in rf.estimators_:
+        tree = estimator.tree_
+        n_nodes = tree.node_count
+        node_ids = np.arange(offset, offset + n_nodes, dtype=np.intp)
+        is_leaf = tree.children_left == -1
+
+        features.append(np.where(is_leaf, 0, tree.feature).astype(np.intp))
+        thresholds.append(tree.threshold.astype(np.float64))
+        lefts.append(np.where(is_leaf, node_ids, tree.children_left + offset))
+        rights.append(np.where(is_leaf, node_ids, tree.children_right + offset))
+        # trees fit before sklearn supported missing values send NaN right
+        missing = getattr(tree, 'missing_go_to_left', None)
+        missing_lefts.append(np.zeros(n_nodes, dtype=bool) if missing is None else (missing != 0) & ~is_leaf)
+        values.append(tree.value[:, 0, 0].astype(np.float64))
+        roots.append(offset)
+
+        offset += n_nodes
+        max_depth = max(max_depth, tree.max_depth)
+
+    feature_names = getattr(rf, 'feature_names_in_', None)
+    return CompiledForest(
+        np.concatenate(features), np.concatenate(thresholds), np.concatenate(lefts), np.concatenate(rights),
+        np.concatenate(missing_lefts), np.concatenate(values), np.array(roots, dtype=np.intp), max_depth,
+        feature_names=feature_names, source_sha256=source_sha256,
+    )
+
+class IsoScoreLookup:
+    """
+    decision_function of a 1-feature IsolationForest as a step function.
+
+    `breakpoints` are the sorted split thresholds of all trees and
+    `scores[k]` is the score of every x with breakpoints[k-1] < x <=
+    breakpoints[k] (k = 0 and k = len(breakpoints) are the open ends).
+    """
+
+    def __init__(self, breakpoints, scores, nan_score, source_sha256=None):
+        self.breakpoints = breakpoints
+        self.scores = scores
+        self.nan_score = float(nan_score)
+        self.source_sha256 = source_sha256
+
+    def decision_function(self, x):
+        """
+        Args:
+            x (ndarray): the residual, shape (n,) or (n, 1)
+
+        Returns:
+            ndarray: float64 scores, equal to the model's decision_function
+        """
+        # the trees compare float32 values against float64 thresholds
+        x = np.asarray(x, dtype=np.float32).reshape(-1).astype(np.float64)
+        scores = self.scores[np.searchsorted(self.breakpoints, x, side='left')]
+        missing = np.isnan(x)
+        if missing.any():
+            scores[missing] = self.nan_score
+        return scores
+
+    def save(self, path):
+        np.savez(path, breakpoints=self.breakpoints, scores=self.scores, nan_score=np.array(self.nan_score),
+                 source_sha256=np.array(self.source_sha256 or ''))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            return cls(arrays['breakpoints'], arrays['scores'], arrays['nan_score'],
+                       source_sha256=str(arrays['source_sha256']) or None)
+
+def _step_representatives(breakpoints):
+    """
+    One float32 value inside each step (t[k-1], t[k]]: the largest float32
+    <= t[k], and for the last step the smallest float32 > t[-1]. A step no
+    float32 falls into gets NaN; no input can reach it.
+    """
+    inner = breakpoints.astype(np.float32)
+    too_big = inner.astype(np.float64) > breakpoints
+    inner[too_big] = np.nextafter(inner[too_big], np.float32(-np.inf))
+    last = np.float32(breakpoints[-1])
+    if last <= breakpoints[-1]:
+        last = np.nextafter(last, np.float32(np.inf))
+
+    representatives = np.append(inner, last)
+    lower = np.concatenate([[-np.inf], breakpoints])
+    reachable = representatives.astype(np.float64) > lower
+    return np.where(reachable, representatives, np.float32(np.nan)), reachable
+
+def verify_iso_lookup(iso, lookup, n_random=100_000, seed=0):
+    """
+    Check the lookup against iso.decision_function on every breakpoint, the
+    float32 values on either side of it, a spread of random residuals, the
+    infinities and NaN.
+
+    Raises:
+        ValueError: on the first mismatch
+
+    Returns:
+        int: number of values checked
+    """
+    t = lookup.breakpoints.astype(np.float32)
+    rng = np.random.default_rng(seed)
+    span = max(float(np.abs(lookup.breakpoints).max()) if len(t) else 1.0, 1.0)
+    x = np.concatenate([
+        t, np.nextafter(t, np.float32(-np.inf)), np.nextafter(t, np.float32(np.inf)),
+        rng.uniform(-2 * span, 2 * span, n_random).astype(np.float32),
+        np.array([-np.inf, np.inf, np.nan, 0.0], dtype=np.float32),
+    ])
+    expected = iso.decision_function(x.reshape(-1, 1))
+    actual = lookup.decision_function(x)
+    mismatch = np.flatnonzero(expected != actual)
+    if len(mismatch):
+        i = mismatch[0]
+        raise ValueError(f"iso lookup differs from decision_function at {x[i]!r}: {actual[i]!r} != {expected[i]!r}")
+    return len(x)
+
+def compile_iso_lookup(iso, source_sha256=None, verify=True):
+    """
+    Tabulate a fitted 1-feature IsolationForest's decision_function.
+
+    Args:
+        iso (IsolationForest): fitted on a single column
+        source_sha256 (str, optional): hash of the artifact it was loaded from
+        verify (bool, optional): run verify_iso_lookup before returning
+    """
+    if iso.n_features_in_ != 1:
+        raise ValueError("compile_iso_lookup only supports isolation forests fitted on one feature")
+
+    thresholds = [e.tree_.threshold[e.tree_.children_left != -1] for e in iso.estimators_]
+    breakpoints = np.unique(np.concatenate(thresholds).astype(np.float64))
+
+    representatives, reachable = _step_representatives(breakpoints)
+    scores = np.full(len(representatives), np.nan)
+    scores[reachable] = iso.decision_function(representatives[reachable].reshape(-1, 1))
+    nan_score = iso.decision_function(np.array([[np.nan]], dtype=np.float32))[0]
+
+    lookup = IsoScoreLookup(breakpoints, scores, nan_score, source_sha256=source_sha256)
+    if verify:
+        verify_iso_lookup(iso, lookup)
+    return lookup
+
+def compiled_forest_path(rf_model_path):
+    """
+    Where export_model writes the compiled form of an RF artifact.
+    """
+    rf_model_path = Path(rf_model_path)
+    return rf_model_path.with_name(f'{rf_model_path.stem}.forest.npz')
+
+def iso_lookup_path(iso_model_path):
+    """
+    Where export_model writes the score lookup of an isolation-forest artifact.
+    """
+    iso_model_path = Path(iso_model_path)
+    return iso_model_path.with_name(f'{iso_model_path.stem}.lookup.npz')
+
+# kind -> (exported path, load exported, compile unpickled model)
+_compilers = {
+    'forest': (compiled_forest_path, CompiledForest.load, compile_forest),
+    'iso': (iso_lookup_path, IsoScoreLookup.load, compile_iso_lookup),
+}
+
+def export_model(model_path):
+    """
+    Compile an RF or 1-feature isolation-forest artifact and save it next
+    to the pickle.
+
+    Returns:
+        Path: the exported file
+    """
+    from sklearn.ensemble import IsolationForest
+
+    sha256 = file_digest(model_path)
+    model = load_model(model_path)
+    exported_path, _, compile_model = _compilers['iso' if isinstance(model, IsolationForest) else 'forest']
+    path = exported_path(model_path)
+    compile_model(model, source_sha256=sha256).save(path)
+    return path
+
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+def _load_or_compile(path, kind):
+    exported_path, load_exported, compile_model = _compilers[kind]
+    sha256 = file_digest(path)
+    exported = exported_path(path)
+    if exported.exists():
+        compiled = load_exported(exported)
+        if compiled.source_sha256 == sha256:
+            print(f"Loaded compiled model {exported.name}")
+            return compiled
+        print(f"{exported.name} was exported from a different {path.name}; compiling it again.")
+    return compile_model(load_model(path), source_sha256=sha256)
+
+def _load_compiled(model_path, kind):
+    """
+    The compiled form of an artifact, cached per process.
+
+    Uses the exported file when it was exported from the current pickle,
+    otherwise compiles the unpickled model. Like the model registry, the
+    cache only stats the pickle until it changes.
+    """
+    path = Path(model_path).resolve()
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _compiled_lock:
+        cached = _compiled.get((path, kind))
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        compiled = _load_or_compile(path, kind)
+        _compiled[(path, kind)] = (key, compiled)
+        return compiled
+
+def load_forest(rf_model_path):
+    return _load_compiled(rf_model_path, 'forest')
+
+def load_iso_lookup(iso_model_path):
+    return _load_compiled(iso_model_path, 'iso')
+
+def predict_rf(rf_model_path, X, numpy_max_rows=2048):
+    """
+    RF predictions for an artifact through its compiled forest.
+
+    The NumPy engine beats sklearn on small batches only, so without numba
+    larger batches go to the sklearn model (same predictions).
+    """
+    if _compiled_kernel() is None and len(X) > numpy_max_rows:
+        return load_model(rf_model_path).predict(X)
+    return load_forest(rf_model_path).predict(X)
+
+def main():
+    p = argparse.ArgumentParser(description="Export RF and residual isolation-forest artifacts in compiled form.")
+    p.add_argument("models", nargs="+", help="rf-*.pkl / iso_diff-*.pkl artifacts")
+    args = p.parse_args()
+    for model_path in args.models:
+        path = export_model(model_path)
+        print(f"Exported {model_path} -> {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+# Every fraud model the server runs, in scoring order. A new model is a
+# ModelSpec in its own module plus an entry here.
+
+from LengthOfState_rf_tmean import length_of_stay_model
+from TotalCost_rf_tmean import total_charge_model
+
+fraud_models = [length_of_stay_model, total_charge_model]
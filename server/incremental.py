@@ -0,0 +1,125 @@
+import pandas as pd
+
+from predictions import delete_predictions, scored_clm_ids
+
+def ensure_clm_id_index(conn, table, unique=False):
+    """
+    Create an index on `table`(CLM_ID) if it doesn't exist yet.
+    """
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    conn.execute(f'CREATE {kind} IF NOT EXISTS "idx_{table}_clm_id" ON "{table}" (CLM_ID);')
+    conn.commit()
+
+def init_watermark_table(conn):
+    """
+    One row per (model, source table): the highest source rowid already
+    handed to that model, and the model version that scored it.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS scoring_watermark (
+            model_name TEXT NOT NULL,
+            source_table TEXT NOT NULL,
+            model_version TEXT,
+            last_rowid INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (model_name, source_table)
+        );
+    """)
+    conn.commit()
+
+def get_watermark(conn, model_name, source_table):
+    """
+    Returns:
+        (int, str | None): last scored rowid and the model version that scored it
+    """
+    init_watermark_table(conn)
+    row = conn.execute(
+        "SELECT last_rowid, model_version FROM scoring_watermark WHERE model_name = ? AND source_table = ?;",
+        (model_name, source_table),
+    ).fetchone()
+    if row is None:
+        return 0, None
+
+    last_rowid, model_version = row
+    max_rowid = conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM "{source_table}";').fetchone()[0]
+    if max_rowid < last_rowid:
+        # the source table was rebuilt (import_excel_to_sqlite replaces it);
+        # the CLM_ID anti-join still keeps already-scored claims out
+        print(f"{source_table} shrank below the {model_name} watermark; rescanning from the start.")
+        return 0, model_version
+    return last_rowid, model_version
+
+def set_watermark(conn, model_name, source_table, last_rowid, model_version, commit=True):
+    """
+    Record the highest rowid handed to a model. With commit=False the write
+    joins the caller's open transaction (and the table must already exist,
+    e.g. from get_watermark), so it lands together with the caller's writes.
+    """
+    if commit:
+        init_watermark_table(conn)
+    conn.execute("""
+        INSERT INTO scoring_watermark (model_name, source_table, model_version, last_rowid, updated_at)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (model_name, source_table) DO UPDATE SET
+            model_version = excluded.model_version,
+            last_rowid = excluded.last_rowid,
+            updated_at = excluded.updated_at;
+    """, (model_name, source_table, model_version, last_rowid))
+    if commit:
+        conn.commit()
+
+def reset_watermark(conn, model_name):
+    """
+    Forget every watermark of a model, e.g. after its predictions table is recreated.
+    """
+    init_watermark_table(conn)
+    conn.execute("DELETE FROM scoring_watermark WHERE model_name = ?;", (model_name,))
+    conn.commit()
+
+def _warn_on_version_change(model_name, scored_version, model_version):
+    if scored_version is not None and scored_version != model_version:
+        print(f"{model_name} model version changed ({scored_version} -> {model_version}); "
+              f"existing predictions are kept. Use rescore_range to rescore them.")
+
+def unscored_claims_mask(conn, df_claims, model_name, model_version, source_table='claims_dedup'):
+    """
+    Which rows of a claims batch read with its `_rowid` still need this model:
+    past the model's watermark and without a stored prediction.
+
+    Lets several models share one read from the lowest of their watermarks.
+    Already-scored claims are found with one CLM_ID range lookup on the
+    predictions primary key.
+
+    Returns:
+        Series[bool]: aligned with df_claims
+    """
+    last_rowid, scored_version = get_watermark(conn, model_name, source_table)
+    _warn_on_version_change(model_name, scored_version, model_version)
+    if df_claims.empty:
+        return pd.Series(False, index=df_claims.index)
+
+    scored = scored_clm_ids(conn, model_name, int(df_claims['CLM_ID'].min()), int(df_claims['CLM_ID'].max()))
+    return (df_claims['_rowid'] > last_rowid) & ~df_claims['CLM_ID'].isin(scored)
+
+def rescore_range(conn, model_name, start_rowid, end_rowid=None, source_table='claims_dedup'):
+    """
+    Drop a model's predictions and fraud rows for claims whose lines fall in
+    [start_rowid, end_rowid] of the source table and move the watermark back,
+    so the next scoring run picks them up with the current model version.
+
+    Returns:
+        int: number of claims invalidated
+    """
+    end_rowid = end_rowid if end_rowid is not None else conn.execute(
+        f'SELECT COALESCE(MAX(rowid), 0) FROM "{source_table}";').fetchone()[0]
+    range_ids = f'SELECT CLM_ID FROM "{source_table}" WHERE rowid BETWEEN ? AND ?'
+
+    n_claims = conn.execute(f"SELECT COUNT(DISTINCT CLM_ID) FROM ({range_ids});", (start_rowid, end_rowid)).fetchone()[0]
+    delete_predictions(conn, model_name, range_ids, (start_rowid, end_rowid))
+    conn.execute(f"DELETE FROM fraud WHERE model_name = ? AND CLM_ID IN ({range_ids});", (model_name, start_rowid, end_rowid))
+    conn.commit()
+
+    last_rowid, model_version = get_watermark(conn, model_name, source_table)
+    set_watermark(conn, model_name, source_table, min(last_rowid, start_rowid - 1), model_version)
+    print(f"Invalidated {n_claims} {model_name} predictions for {source_table} rowids {start_rowid}..{end_rowid}.")
+    return n_claims
@@ -0,0 +1,180 @@
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+
+import joblib
+
+def _rss_bytes():
+    """
+    Resident set size of this process, or None where it can't be read.
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def file_sha256(path, block_size=1 << 20):
+    """
+    Hex sha256 of a file, read in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+_digests = {}
+_digests_lock = threading.Lock()
+
+def file_digest(path):
+    """
+    file_sha256 of `path`, cached per process until the file's mtime or size
+    changes, so the registry, model_version and the compiled-model cache
+    share one hash per artifact.
+    """
+    path = Path(path).resolve()
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _digests_lock:
+        cached = _digests.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    sha256 = file_sha256(path)
+    with _digests_lock:
+        _digests[path] = (key, sha256)
+    return sha256
+
+class ModelRegistry:
+    """
+    In-process cache of joblib model artifacts.
+
+    Each artifact is loaded once per (path, mmap_mode). A later call only
+    stats the file: if mtime and size are unchanged the cached object is
+    returned; if they changed, the file is re-hashed and reloaded only when
+    the contents actually differ.
+
+    Load time and memory footprint are recorded per artifact and exposed
+    through `metrics()`. The footprint is the growth in resident memory
+    across the load, so arrays memory-mapped with `mmap_mode` only count once
+    their pages are touched. The first load in a process also pays for
+    importing sklearn.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def load(self, path, mmap_mode=None):
+        """
+        Return the unpickled artifact at `path`, loading it only if needed.
+
+        Args:
+            path (str | Path): joblib file
+            mmap_mode (str, optional): passed to joblib.load, e.g. 'r' to
+                memory-map large tree arrays instead of copying them into RAM
+        """
+        path = Path(path).resolve()
+        key = (str(path), mmap_mode)
+        stat = os.stat(path)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry['mtime_ns'], entry['file_bytes']) == (stat.st_mtime_ns, stat.st_size):
+                entry['hits'] += 1
+                return entry['model']
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # hash and unpickle under the artifact's own lock only, so other
+        # artifacts (and cache hits) aren't held up by a slow joblib.load
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and (entry['mtime_ns'], entry['file_bytes']) == (stat.st_mtime_ns, stat.st_size):
+                    entry['hits'] += 1
+                    return entry['model']
+
+            sha256 = file_digest(path)
+            if entry is not None and sha256 == entry['sha256']:
+                with self._lock:
+                    entry['mtime_ns'], entry['file_bytes'] = stat.st_mtime_ns, stat.st_size
+                    entry['hits'] += 1
+                return entry['model']
+
+            entry = self._load(path, mmap_mode, stat, sha256, entry)
+            with self._lock:
+                self._entries[key] = entry
+            return entry['model']
+
+    def _load(self, path, mmap_mode, stat, sha256, previous):
+        rss_before = _rss_bytes()
+        t0 = time.perf_counter()
+        model = joblib.load(path, mmap_mode=mmap_mode)
+        load_seconds = time.perf_counter() - t0
+        rss_after = _rss_bytes()
+
+        memory_bytes = None
+        if rss_before is not None and rss_after is not None:
+            memory_bytes = max(rss_after - rss_before, 0)
+
+        print(f"Loaded model {path.name} in {load_seconds:.3f}s")
+        return {
+            'model': model,
+            'mtime_ns': stat.st_mtime_ns,
+            'file_bytes': stat.st_size,
+            'sha256': sha256,
+            'mmap_mode': mmap_mode,
+            'load_seconds': load_seconds,
+            'memory_bytes': memory_bytes,
+            'loads': previous['loads'] + 1 if previous else 1,
+            'hits': previous['hits'] if previous else 0,
+        }
+
+    def metrics(self):
+        """
+        Per-artifact load metrics, keyed by file path.
+
+        Returns:
+            dict: path -> {load_seconds, memory_bytes, file_bytes, sha256,
+            mmap_mode, loads, hits}
+        """
+        with self._lock:
+            return {
+                (path if mmap_mode is None else f"{path}[mmap_mode={mmap_mode}]"):
+                    {k: v for k, v in entry.items() if k not in ('model', 'mtime_ns')}
+                for (path, mmap_mode), entry in self._entries.items()
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+# process-wide registry used by the scoring modules
+registry = ModelRegistry()
+
+def load_model(path, mmap_mode=None):
+    """
+    Load a joblib artifact through the process-wide registry.
+    """
+    return registry.load(path, mmap_mode=mmap_mode)
+
+def model_version(*paths):
+    """
+    Short version string identifying the exact artifacts a model is built from.
+
+    Built from the file hashes only: the artifacts are not unpickled, so
+    scoring through the compiled forests never has to load the pickles.
+    """
+    digest = hashlib.sha256(''.join(file_digest(p) for p in paths).encode('ascii'))
+    return digest.hexdigest()[:12]
+
+def model_metrics():
+    return registry.metrics()
@@ -0,0 +1,148 @@
+# Process-pool scoring for several fraud models at once.
+#
+# After the shared feature build the models are independent, and a model's
+# predictions for one claim don't depend on any other claim. So every
+# (model, row partition) pair is a task: the feature matrices and targets are
+# copied once into shared memory, workers attach to them by name, and each
+# task writes its predictions into a shared output array. Only the spec and a
+# row range cross the process boundary.
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from forest_compile import _compiled_kernel, load_forest, load_iso_lookup
+from model_registry import load_model
+from pipeline import predict_arrays
+
+class SharedArray:
+    """
+    A NumPy array backed by a named shared-memory block.
+
+    The process that creates the block unlinks it on close; other processes
+    attach to it through `handle` without copying.
+    """
+
+    def __init__(self, shm, shape, dtype, owner):
+        self.shm = shm
+        self.array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        self.owner = owner
+
+    @classmethod
+    def empty(cls, shape, dtype=np.float64):
+        dtype = np.dtype(dtype)
+        # a zero-size block can't be created
+        size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+        return cls(shared_memory.SharedMemory(create=True, size=size), shape, dtype, owner=True)
+
+    @classmethod
+    def copy_of(cls, array):
+        shared = cls.empty(array.shape, array.dtype)
+        shared.array[...] = array
+        return shared
+
+    @classmethod
+    def attach(cls, handle):
+        name, shape, dtype = handle
+        return cls(shared_memory.SharedMemory(name=name), shape, dtype, owner=False)
+
+    @property
+    def handle(self):
+        return self.shm.name, self.array.shape, self.array.dtype.str
+
+    def close(self):
+        # the view has to go before the buffer can be released
+        self.array = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+def _preload(specs):
+    """
+    Load what predict_arrays will use for every spec into this process's
+    caches: the compiled forest and isolation-forest lookup, and without numba
+    the sklearn RF too, which predict_rf uses for partition-sized batches.
+    """
+    for spec in specs:
+        load_forest(spec.rf_model_path)
+        load_iso_lookup(spec.iso_model_path)
+        if _compiled_kernel() is None:
+            load_model(spec.rf_model_path)
+
+def _score_partition(spec, X_handle, target_handle, out_handle, start, stop):
+    arrays = [SharedArray.attach(h) for h in (X_handle, target_handle, out_handle)]
+    X, target, out = (a.array for a in arrays)
+    try:
+        pred, diff = predict_arrays(spec, X[start:stop], target[start:stop])
+        out[start:stop, 0] = pred
+        out[start:stop, 1] = diff
+    finally:
+        del X, target, out
+        for a in arrays:
+            a.close()
+    return stop - start
+
+def row_partitions(n_rows, n_parts, min_rows=10_000):
+    """
+    Split range(n_rows) into at most `n_parts` contiguous (start, stop) ranges
+    of at least `min_rows` rows each (one range if n_rows is smaller).
+    """
+    n_parts = max(1, min(n_parts, n_rows // min_rows))
+    bounds = np.linspace(0, n_rows, n_parts + 1).astype(np.int64)
+    return [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+def _pool_context():
+    # forked workers inherit the models _preload put in this process's caches;
+    # under spawn each worker loads them on its first task instead
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+def predict_parallel(batches, workers=None, min_partition_rows=10_000):
+    """
+    predict_arrays for several models' batches on a process pool.
+
+    Each batch is split into about `workers` row partitions, so the models run
+    side by side and each one is spread across every core. A single partition
+    overall is scored in this process.
+
+    Args:
+        batches (list[(ModelSpec, ndarray, ndarray)]): spec, feature matrix
+            (feature_cols) and target per model
+        workers (int, optional): pool size; defaults to the number of CPUs
+        min_partition_rows (int, optional): smallest row range worth a task
+
+    Returns:
+        list[(ndarray, ndarray)]: predictions and diff scores per batch, in
+        the same row order
+    """
+    workers = workers or os.cpu_count() or 1
+    partitions = [row_partitions(len(target), workers, min_partition_rows) for _, _, target in batches]
+    if workers == 1 or sum(len(p) for p in partitions) <= 1:
+        return [predict_arrays(spec, X, target) for spec, X, target in batches]
+
+    shared = []
+    try:
+        tasks = []
+        for (spec, X, target), parts in zip(batches, partitions):
+            X_shared = SharedArray.copy_of(np.ascontiguousarray(X, dtype=np.float64))
+            target_shared = SharedArray.copy_of(np.ascontiguousarray(target, dtype=np.float64))
+            out_shared = SharedArray.empty((len(target), 2))
+            shared += [X_shared, target_shared, out_shared]
+            handles = (X_shared.handle, target_shared.handle, out_shared.handle)
+            tasks += [(spec, *handles, start, stop) for start, stop in parts]
+
+        _preload([spec for spec, _, _ in batches])
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), mp_context=_pool_context()) as pool:
+            futures = [pool.submit(_score_partition, *task) for task in tasks]
+            for future in futures:
+                future.result()
+
+        # each batch's output array is the third block it allocated
+        return [(out.array[:, 0].copy(), out.array[:, 1].copy()) for out in shared[2::3]]
+    finally:
+        for a in shared:
+            a.close()
@@ -0,0 +1,283 @@
+# One scoring engine for every residual-anomaly fraud model.
+#
+# Each model is a ModelSpec: a target (a claims column, or an expression computed
+# from claims columns), an RF that predicts it from the diagnosis-code target
+# means, and an isolation forest over the residual. The engine reads the new
+# claims once, encodes their codes once with the persistent code dictionary
+# (code_dictionary.py), and runs every spec over that batch.
+
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from scoring import calculate_scores
+from sqlite import upsert_fraud_rows
+from predictions import ensure_prediction_view, reset_predictions, write_predictions
+from model_registry import model_version
+from forest_compile import load_iso_lookup, predict_rf
+from claims_access import (
+    refresh_claims_dedup, read_claims_since, export_claims_parquet, read_claims_parquet_since,
+)
+from incremental import get_watermark, set_watermark, reset_watermark, unscored_claims_mask
+from tmean_stats import load_tmean_snapshot, scoring_tmean_snapshot, tmean_watermark_name, update_model_tables
+from code_dictionary import CodeDictionary
+from tmean import (
+    ClaimCodes, tmean_lookups, assemble_coded_features,
+    secondary_diagnosis_cols, secondary_diagnosis_tmean_cols,
+)
+
+class ModelSpec:
+    """
+    Declarative description of one fraud model.
+
+    Args:
+        name (str): model_name written to the fraud table and watermarks
+        target_col (str): column the RF predicts
+        rf_model_path, iso_model_path (Path): joblib artifacts
+        predictions_table (str): name of the view over the spec's stored
+            predictions (see predictions.py)
+        principal_tmean_table, secondary_tmean_table (str): target-mean tables
+        source_cols (list[str]): claims columns the target is computed from
+            (just [target_col] when it is read as is)
+        target (callable, optional): DataFrame of claims -> target Series;
+            None reads target_col directly
+        fraud_threshold (float, optional): diff scores below this are fraud
+        target_sql (str, optional): SQL for the target over a claims_dedup
+            row aliased `c`, used by the predictions view; defaults to the
+            target column itself
+        tmean_window_months (int, optional): build the tmean tables from
+            only the newest this many claim months (see tmean_stats.py)
+        tmean_half_life_months (float, optional): weight claim months by
+            0.5 ** (age / half-life) in the tmean tables
+        tmean_snapshot (int, optional): score with this saved tmean snapshot
+            instead of the live tmean tables
+    """
+
+    def __init__(self, name, target_col, rf_model_path, iso_model_path, predictions_table,
+                 principal_tmean_table, secondary_tmean_table, source_cols=None, target=None,
+                 fraud_threshold=-0.1, target_sql=None, tmean_window_months=None, tmean_half_life_months=None,
+                 tmean_snapshot=None):
+        self.name = name
+        self.target_col = target_col
+        self.rf_model_path = rf_model_path
+        self.iso_model_path = iso_model_path
+        self.predictions_table = predictions_table
+        self.principal_tmean_table = principal_tmean_table
+        self.secondary_tmean_table = secondary_tmean_table
+        self.source_cols = list(source_cols) if source_cols is not None else [target_col]
+        self.target = target
+        self.fraud_threshold = fraud_threshold
+        self.target_sql = target_sql if target_sql is not None else f'c."{target_col}"'
+        self.tmean_window_months = tmean_window_months
+        self.tmean_half_life_months = tmean_half_life_months
+        self.tmean_snapshot = tmean_snapshot
+
+    @property
+    def pred_col(self):
+        return f'{self.target_col}_RF_PRED'
+
+    @property
+    def diff_col(self):
+        return f'{self.target_col}_IFOREST_DIFF_SCORE'
+
+    def version(self):
+        version = model_version(self.rf_model_path, self.iso_model_path)
+        if self.tmean_snapshot is not None:
+            # pinned encodings are part of what scored a claim
+            version = f'{version}+tmean{self.tmean_snapshot}'
+        return version
+
+    def add_target(self, df_claims):
+        """
+        Compute the target column in place if it is an expression.
+        """
+        if self.target is not None:
+            df_claims[self.target_col] = self.target(df_claims)
+        return df_claims
+
+def claims_columns(specs):
+    """
+    Every claims column the specs need, in claims_dedup order.
+    """
+    cols = ['CLM_ID', 'PRNCPAL_DGNS_CD'] + secondary_diagnosis_cols
+    for spec in specs:
+        cols += [c for c in spec.source_cols if c not in cols]
+    return cols
+
+def init_model_tables(conn, spec, chunk_rows=250_000):
+    """
+    Build a spec's target-mean tables from all claims and drop its stored
+    predictions. The watermark is reset, since the predictions are gone.
+
+    Claims are streamed `chunk_rows` at a time into per-code (sum, count)
+    statistics (tmean_stats.py), so memory is bounded by the chunk size and
+    the number of codes rather than by the claims table; later claims are
+    folded in with update_model_tables.
+    """
+    # a fresh build, not an update of whatever stats are there
+    set_watermark(conn, tmean_watermark_name(spec), 'claims_dedup', 0, None)
+    update_model_tables(conn, spec, chunk_rows)
+
+    reset_predictions(conn, spec)
+    reset_watermark(conn, spec.name)
+
+def load_tmean_tables(conn, spec):
+    if spec.tmean_snapshot is not None:
+        return load_tmean_snapshot(conn, spec, spec.tmean_snapshot)
+    df_principal_tmean = pd.read_sql_query(f'SELECT * FROM "{spec.principal_tmean_table}";', conn)
+    df_secondary_tmean = pd.read_sql_query(f'SELECT * FROM "{spec.secondary_tmean_table}";', conn)
+    return df_principal_tmean, df_secondary_tmean
+
+def load_lookups(conn, spec, dictionary=None, tables=None):
+    """
+    The spec's (principal, secondary) TmeanLookup pair.
+
+    Args:
+        dictionary (CodeDictionary, optional): gets (and stores) ids for any
+            codes of the tmean tables it doesn't have yet, so claims encoded
+            with it find every code the tables know
+        tables ((DataFrame, DataFrame), optional): the spec's tmean tables,
+            if already read with load_tmean_tables
+    """
+    df_principal_tmean, df_secondary_tmean = tables if tables is not None else load_tmean_tables(conn, spec)
+    if dictionary is not None:
+        dictionary.add(conn, df_principal_tmean['PRNCPAL_DGNS_CD'])
+        dictionary.add(conn, df_secondary_tmean['SECONDARY_DGNS_CD'])
+    return tmean_lookups(df_principal_tmean, df_secondary_tmean)
+
+feature_cols = secondary_diagnosis_tmean_cols + ['PRNCPAL_DGNS_CD_TMEAN']
+
+def predict_arrays(spec, X, target):
+    """
+    RF prediction and residual isolation-forest score for a feature matrix.
+
+    Args:
+        X (DataFrame | ndarray): feature_cols, one row per claim
+        target (ndarray): the spec's target, row for row
+
+    Returns:
+        (ndarray, ndarray): predictions and diff scores
+    """
+    if not isinstance(X, pd.DataFrame):
+        X = pd.DataFrame(X, columns=feature_cols, copy=False)
+    pred = predict_rf(spec.rf_model_path, X)
+
+    # the residual isolation forest, tabulated over its one feature
+    diff = load_iso_lookup(spec.iso_model_path).decision_function(target - pred)
+    return pred, diff
+
+def predict(spec, df_claims, lookups, codes=None):
+    """
+    Run a spec's RF and residual isolation forest over claims in memory.
+
+    Args:
+        df_claims (DataFrame): one row per claim, with the target column
+        lookups ((TmeanLookup, TmeanLookup)): from load_lookups
+        codes (ClaimCodes, optional): df_claims' codes, if already factorized
+
+    Returns:
+        DataFrame: the scoring frame with spec.pred_col and spec.diff_col added
+    """
+    if codes is None:
+        codes = ClaimCodes(df_claims)
+    df_scored = assemble_coded_features(df_claims, codes, lookups, spec.target_col)
+
+    target = df_scored[spec.target_col].to_numpy(dtype=np.float64)
+    df_scored[spec.pred_col], df_scored[spec.diff_col] = predict_arrays(spec, df_scored[feature_cols], target)
+    return df_scored
+
+def fraud_rows(spec, df_scored, fraud_threshold):
+    """
+    The claims a spec flags, as fraud table rows.
+
+    Returns:
+        DataFrame: CLM_ID, model_name, score for diff scores below the threshold
+    """
+    diff = df_scored[spec.diff_col].to_numpy()
+    flagged = diff < fraud_threshold
+    return pd.DataFrame({
+        'CLM_ID': df_scored['CLM_ID'].to_numpy()[flagged],
+        'model_name': spec.name,
+        'score': calculate_scores(diff[flagged]),
+    })
+
+def score_models(sqlite_db_path, specs, fraud_threshold=None, claims_parquet_dir=None, workers=1):
+    """
+    Score new claims with every spec from one shared read.
+
+    Claims are read once from the lowest watermark among the specs, their
+    code columns are turned into code dictionary Categoricals once (new codes
+    are added to the dictionary), and each spec then scores only the rows
+    past its own watermark that it has no prediction for.
+
+    Args:
+        specs (list[ModelSpec]): models to run
+        fraud_threshold (float, optional): overrides each spec's threshold
+        claims_parquet_dir (str | Path, optional): read claims from the
+            Parquet export in this directory instead of SQLite
+        workers (int, optional): processes to spread the models and their
+            rows over (see parallel_scoring); 1 scores in this process
+    """
+    conn = sqlite3.connect(sqlite_db_path)
+    refresh_claims_dedup(conn)
+
+    versions = {spec.name: spec.version() for spec in specs}
+    low_rowid = min(get_watermark(conn, spec.name, 'claims_dedup')[0] for spec in specs)
+    high_rowid = conn.execute('SELECT COALESCE(MAX(rowid), 0) FROM claims_dedup;').fetchone()[0]
+    columns = claims_columns(specs)
+    if claims_parquet_dir is not None:
+        # column-pruned read with the watermark pushed down into the Parquet scan
+        export_claims_parquet(conn, claims_parquet_dir)
+        df_claims = read_claims_parquet_since(claims_parquet_dir, low_rowid, columns)
+    else:
+        df_claims = read_claims_since(conn, low_rowid, columns, high_rowid)
+
+    dictionary = CodeDictionary.load(conn)
+    tables = {spec.name: load_tmean_tables(conn, spec) for spec in specs}
+    lookups = {spec.name: load_lookups(conn, spec, dictionary, tables[spec.name]) for spec in specs}
+    # recorded with each prediction, so the views show the tmean values it was scored with
+    tmean_snapshots = {spec.name: scoring_tmean_snapshot(conn, spec, tables[spec.name]) for spec in specs}
+    dictionary.categorize(df_claims, ['PRNCPAL_DGNS_CD'] + secondary_diagnosis_cols, conn)
+    codes = ClaimCodes(df_claims)
+    batches = []
+    for spec in specs:
+        # an old wide predictions table is migrated with the version that scored it
+        ensure_prediction_view(conn, spec, get_watermark(conn, spec.name, 'claims_dedup')[1])
+        unscored = unscored_claims_mask(conn, df_claims, spec.name, versions[spec.name]).to_numpy()
+        if not unscored.any():
+            print(f"No claims to score for {spec.name}.")
+            set_watermark(conn, spec.name, 'claims_dedup', high_rowid, versions[spec.name])
+            continue
+
+        df_batch = spec.add_target(df_claims.loc[unscored].drop(columns='_rowid').reset_index(drop=True))
+        df_scored = assemble_coded_features(df_batch, codes.take(unscored), lookups[spec.name], spec.target_col)
+        batches.append((spec, df_scored))
+
+    arrays = [(spec, df_scored[feature_cols], df_scored[spec.target_col].to_numpy(dtype=np.float64))
+              for spec, df_scored in batches]
+    if workers > 1:
+        # imported here: parallel_scoring imports this module
+        from parallel_scoring import predict_parallel
+        results = predict_parallel([(spec, X.to_numpy(), target) for spec, X, target in arrays], workers)
+    else:
+        results = [predict_arrays(spec, X, target) for spec, X, target in arrays]
+
+    df_fraud = []
+    for (spec, df_scored), (pred, diff) in zip(batches, results):
+        print(f"Scored {len(df_scored)} claims with {spec.name}.")
+        df_scored[spec.pred_col] = pred
+        df_scored[spec.diff_col] = diff
+        write_predictions(conn, spec, df_scored, versions[spec.name], tmean_snapshots[spec.name])
+
+        threshold = fraud_threshold if fraud_threshold is not None else spec.fraud_threshold
+        df_fraud.append(fraud_rows(spec, df_scored, threshold))
+        print(f"Found {len(df_fraud[-1])} claims with scores below the threshold {threshold}.")
+
+    # every model's flagged claims in one transaction
+    if df_fraud:
+        upsert_fraud_rows(conn, pd.concat(df_fraud, ignore_index=True))
+    for spec, _ in batches:
+        set_watermark(conn, spec.name, 'claims_dedup', high_rowid, versions[spec.name])
+
+    conn.close()
@@ -0,0 +1,240 @@
+# Narrow storage for model predictions.
+#
+# Every model writes one row per claim to the shared `predictions` table:
+# (CLM_ID, model_id, model_version, tmean_snapshot_id, pred, diff_score). The
+# features a batch was scored with (the target and the 26 tmean values) are kept
+# per scored batch as one compressed blob in `prediction_feature_snapshots`, and
+# the raw claim columns stay in claims_dedup only.
+#
+# Each model's old wide predictions table name is now a view over these tables,
+# so queries against e.g. inpatient_total_cost_predictions keep working. The
+# view's tmean columns come from the tmean snapshot the claim was scored with
+# (tmean_stats.py), not the live tmean tables, which incremental updates change.
+
+import io
+
+import numpy as np
+import pandas as pd
+
+from tmean import secondary_diagnosis_cols, secondary_diagnosis_tmean_cols
+
+feature_snapshot_cols = ['PRNCPAL_DGNS_CD_TMEAN'] + secondary_diagnosis_tmean_cols
+
+def init_prediction_tables(conn):
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS prediction_models (
+            model_id INTEGER PRIMARY KEY,
+            model_name TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS predictions (
+            CLM_ID INTEGER NOT NULL,
+            model_id INTEGER NOT NULL REFERENCES prediction_models (model_id),
+            model_version TEXT,
+            pred REAL,
+            diff_score REAL,
+            tmean_snapshot_id INTEGER,
+            PRIMARY KEY (model_id, CLM_ID)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS prediction_feature_snapshots (
+            snapshot_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            model_id INTEGER NOT NULL REFERENCES prediction_models (model_id),
+            model_version TEXT,
+            n_claims INTEGER NOT NULL,
+            first_clm_id INTEGER,
+            last_clm_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            features BLOB NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_prediction_feature_snapshots_model
+            ON prediction_feature_snapshots (model_id, first_clm_id);
+    """)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(predictions);")}
+    if 'tmean_snapshot_id' not in columns:
+        # rows stored before this column existed show no tmean values in the views
+        conn.execute("ALTER TABLE predictions ADD COLUMN tmean_snapshot_id INTEGER;")
+    conn.commit()
+
+def model_id(conn, model_name):
+    """
+    The model's id in prediction_models, added on first use.
+    """
+    init_prediction_tables(conn)
+    conn.execute("INSERT OR IGNORE INTO prediction_models (model_name) VALUES (?);", (model_name,))
+    conn.commit()
+    return conn.execute("SELECT model_id FROM prediction_models WHERE model_name = ?;", (model_name,)).fetchone()[0]
+
+def scored_clm_ids(conn, model_name, low_clm_id, high_clm_id):
+    """
+    CLM_IDs in [low_clm_id, high_clm_id] the model already has a prediction for.
+    """
+    return pd.read_sql_query(
+        "SELECT CLM_ID FROM predictions WHERE model_id = ? AND CLM_ID BETWEEN ? AND ?;", conn,
+        params=(model_id(conn, model_name), low_clm_id, high_clm_id))['CLM_ID']
+
+def delete_predictions(conn, model_name, clm_id_sql=None, params=()):
+    """
+    Drop a model's predictions, all of them or those whose CLM_ID is in the
+    result of `clm_id_sql`. Feature snapshots are history and are kept; a
+    rescored claim's newer snapshot supersedes the old one.
+    """
+    where = '' if clm_id_sql is None else f' AND CLM_ID IN ({clm_id_sql})'
+    conn.execute(f"DELETE FROM predictions WHERE model_id = ?{where};", (model_id(conn, model_name), *params))
+    conn.commit()
+
+def _pack_features(clm_ids, target, features):
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, CLM_ID=clm_ids, target=target, features=features)
+    return buffer.getvalue()
+
+def _unpack_features(blob):
+    with np.load(io.BytesIO(blob)) as arrays:
+        return arrays['CLM_ID'], arrays['target'], arrays['features']
+
+def write_predictions(conn, spec, df_scored, model_version, tmean_snapshot_id=None, snapshot_rows=100_000):
+    """
+    Store a scored batch: one narrow row per claim, plus the features it was
+    scored with as compressed snapshots of up to `snapshot_rows` claims.
+
+    Args:
+        df_scored (DataFrame): the scoring frame with spec.pred_col and
+            spec.diff_col
+        model_version (str): version of the artifacts that scored it
+        tmean_snapshot_id (int, optional): tmean snapshot holding the values
+            it was scored with (tmean_stats.scoring_tmean_snapshot)
+    """
+    mid = model_id(conn, spec.name)
+    clm_ids = df_scored['CLM_ID'].to_numpy(dtype=np.int64)
+    target = df_scored[spec.target_col].to_numpy(dtype=np.float64)
+    features = df_scored[feature_snapshot_cols].to_numpy(dtype=np.float64)
+
+    rows = zip(clm_ids.tolist(), df_scored[spec.pred_col].astype(float).tolist(),
+               df_scored[spec.diff_col].astype(float).tolist())
+    with conn:
+        conn.executemany("""
+            INSERT INTO predictions (CLM_ID, model_id, model_version, tmean_snapshot_id, pred, diff_score)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (model_id, CLM_ID) DO UPDATE SET
+                model_version = excluded.model_version,
+                tmean_snapshot_id = excluded.tmean_snapshot_id,
+                pred = excluded.pred,
+                diff_score = excluded.diff_score;
+        """, ((clm_id, mid, model_version, tmean_snapshot_id, pred, diff) for clm_id, pred, diff in rows))
+
+        for start in range(0, len(clm_ids), snapshot_rows):
+            stop = start + snapshot_rows
+            batch_ids = clm_ids[start:stop]
+            conn.execute("""
+                INSERT INTO prediction_feature_snapshots (model_id, model_version, n_claims, first_clm_id, last_clm_id, features)
+                VALUES (?, ?, ?, ?, ?, ?);
+            """, (mid, model_version, len(batch_ids), int(batch_ids.min()), int(batch_ids.max()),
+                  _pack_features(batch_ids, target[start:stop], features[start:stop])))
+
+def read_feature_snapshots(conn, spec):
+    """
+    The features each of a spec's predictions was made from, newest snapshot
+    per claim.
+
+    Returns:
+        DataFrame: CLM_ID, the target column and the 26 *_TMEAN columns
+    """
+    blobs = conn.execute(
+        "SELECT features FROM prediction_feature_snapshots WHERE model_id = ? ORDER BY snapshot_id;",
+        (model_id(conn, spec.name),)).fetchall()
+    frames = []
+    for (blob,) in blobs:
+        clm_ids, target, features = _unpack_features(blob)
+        frame = pd.DataFrame(features, columns=feature_snapshot_cols)
+        frame.insert(0, 'CLM_ID', clm_ids)
+        frame.insert(1, spec.target_col, target)
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=['CLM_ID', spec.target_col] + feature_snapshot_cols)
+    df = pd.concat(frames, ignore_index=True)
+    return df.drop_duplicates('CLM_ID', keep='last').reset_index(drop=True)
+
+def prediction_view_sql(conn, spec):
+    """
+    CREATE VIEW with the columns of the old wide predictions table: raw
+    codes and the target from claims_dedup, the tmean values of the tmean
+    snapshot each claim was scored with, and the prediction and diff score.
+    """
+    mid = model_id(conn, spec.name)
+    columns = (
+        ['p.CLM_ID AS "CLM_ID"', 'c."PRNCPAL_DGNS_CD"', f'{spec.target_sql} AS "{spec.target_col}"']
+        + [f'c."{col}"' for col in secondary_diagnosis_cols]
+        + ['pt.tmean AS "PRNCPAL_DGNS_CD_TMEAN"']
+        + [f's{i}.tmean AS "{col}"' for i, col in enumerate(secondary_diagnosis_tmean_cols, start=1)]
+        + [f'p.pred AS "{spec.pred_col}"', f'p.diff_score AS "{spec.diff_col}"']
+    )
+    joins = [
+        'LEFT JOIN tmean_snapshot_values AS pt ON pt.snapshot_id = p.tmean_snapshot_id'
+        ' AND pt.kind = \'principal\' AND pt.code = c."PRNCPAL_DGNS_CD"'
+    ] + [
+        f'LEFT JOIN tmean_snapshot_values AS s{i} ON s{i}.snapshot_id = p.tmean_snapshot_id'
+        f' AND s{i}.kind = \'secondary\' AND s{i}.code = c."{col}"'
+        for i, col in enumerate(secondary_diagnosis_cols, start=1)
+    ]
+    select = ',\n    '.join(columns)
+    join = '\n'.join(joins)
+    return f"""CREATE VIEW "{spec.predictions_table}" AS
+SELECT
+    {select}
+FROM predictions AS p
+JOIN claims_dedup AS c ON c.CLM_ID = p.CLM_ID
+{join}
+WHERE p.model_id = {mid};"""
+
+def _migrate_wide_table(conn, spec, model_version, chunk_rows=200_000):
+    """
+    Move the rows of an old wide predictions table into the narrow layout.
+    Wide tables predate incremental tmean updates, so their rows were scored
+    with the current tmean tables and are recorded with a snapshot of them.
+    """
+    # imported here: tmean_stats imports this module
+    from tmean_stats import scoring_tmean_snapshot
+
+    print(f"Moving {spec.predictions_table} to the narrow predictions table.")
+    tmean_snapshot_id = scoring_tmean_snapshot(conn, spec)
+    chunks = pd.read_sql_query(f'SELECT * FROM "{spec.predictions_table}";', conn, chunksize=chunk_rows)
+    for chunk in chunks:
+        write_predictions(conn, spec, chunk, model_version, tmean_snapshot_id)
+    conn.execute(f'DROP TABLE "{spec.predictions_table}";')
+    conn.commit()
+
+def ensure_prediction_view(conn, spec, model_version=None):
+    """
+    Make spec.predictions_table the view over the narrow tables, migrating
+    an old wide table of that name first and replacing a view defined
+    differently. Migrated rows are recorded with `model_version` (the version
+    their watermark carries).
+    """
+    # imported here: tmean_stats imports this module
+    from tmean_stats import init_tmean_snapshot_tables
+
+    init_prediction_tables(conn)
+    init_tmean_snapshot_tables(conn)
+
+    view_sql = prediction_view_sql(conn, spec)
+    row = conn.execute("SELECT type, sql FROM sqlite_master WHERE name = ?;", (spec.predictions_table,)).fetchone()
+    if row is not None and row[0] == 'view':
+        if row[1] == view_sql:
+            return
+        conn.execute(f'DROP VIEW "{spec.predictions_table}";')
+    if row is not None and row[0] == 'table':
+        _migrate_wide_table(conn, spec, model_version)
+    conn.execute(view_sql)
+    conn.commit()
+
+def reset_predictions(conn, spec):
+    """
+    Drop everything a spec has stored and recreate its view, e.g. after its
+    tmean tables are rebuilt.
+    """
+    init_prediction_tables(conn)
+    mid = model_id(conn, spec.name)
+    conn.execute(f'DROP VIEW IF EXISTS "{spec.predictions_table}";')
+    conn.execute(f'DROP TABLE IF EXISTS "{spec.predictions_table}";')
+    conn.execute("DELETE FROM predictions WHERE model_id = ?;", (mid,))
+    conn.execute("DELETE FROM prediction_feature_snapshots WHERE model_id = ?;", (mid,))
+    conn.commit()
+    ensure_prediction_view(conn, spec)
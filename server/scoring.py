@@ -1,3 +1,5 @@
+import numpy as np
+
 def calculate_score(value):
     """
     Converts a number from -1 to 1 into a score.
@@ -24,3 +26,19 @@ def calculate_score(value):
     else:
         return -100 * value  # Linear gradient from -1 to 0
 
+def calculate_scores(values):
+    """
+    calculate_score for an array of values at once.
+
+    Args:
+        values (array-like): numbers between -1 and 1
+
+    Returns:
+        ndarray: float scores, 0 for values >= 0 and -100 * value below
+    """
+    values = np.asarray(values, dtype=np.float64)
+    out_of_range = (values < -1) | (values > 1)
+    if out_of_range.any():
+        raise ValueError(f"Input must be between -1 and 1 (got {values[out_of_range][0]}).")
+
+    return np.where(values >= 0, 0.0, -100 * values)
@@ -1,9 +1,19 @@
 # Base backend server for claims fraud detection
 
+import logging
+import sqlite3
+import sys
 from pathlib import Path
-from sqlite import import_excel_to_sqlite, init_fraud_table
-from LengthOfState_rf_tmean import init_lengthOfStay_db_tables, score_length_of_stay
-from TotalCost_rf_tmean import init_totalCharge_db_tables, score_total_charge
+
+# the Excel importer is shared with the data tools in claims_prep (repository root)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from claims_prep.excel import import_excel_to_sqlite
+from claims_access import materialize_claims_dedup
+from sqlite import init_fraud_table
+from LengthOfState_rf_tmean import init_lengthOfStay_db_tables
+from TotalCost_rf_tmean import init_totalCharge_db_tables
+from fraud_models import fraud_models
+from pipeline import score_models
 
 def init_database(sqlite_db_path):
     """
@@ -30,7 +40,14 @@ def init_database(sqlite_db_path):
 
     init_fraud_table(db_file)
 
+    # one typed row per claim with only the columns the models read
+    conn = sqlite3.connect(db_file)
+    materialize_claims_dedup(conn)
+    conn.close()
+
 def main():
+    # the Excel importer reports through logging
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     init_db = False
     db_file = "fraud.db"
 
@@ -48,11 +65,8 @@ def main():
     else:
         print(f"Model Database tables already initialized. Skipping additional table setup.")
 
-    print("scoring length of stay")
-    score_length_of_stay(db_file, fraud_threshold=-0.1)
-
-    print("scoring total charge")
-    score_total_charge(db_file, fraud_threshold=-0.1)
+    # every model scores the same batch of new claims, read once
+    score_models(db_file, fraud_models, fraud_threshold=-0.1)
 
 if __name__ == "__main__":
     main()
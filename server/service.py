@@ -0,0 +1,324 @@
+# Resident scoring service: keeps tmean tables and models in memory and scores
+# claims posted over HTTP, grouping concurrent requests into micro-batches.
+#
+#   python service.py --db fraud.db --port 8080 --max-batch-size 256 --max-wait-ms 5
+#
+#   POST /score    {"claims": [{...}, ...]}  (or a single claim object); a
+#                  malformed claim gets a 400 naming the claim and field
+#   GET  /metrics  latency p50/p99, throughput, batch sizes, model load metrics
+#   GET  /health
+
+import argparse
+import datetime
+import json
+import math
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from scoring import calculate_scores
+from model_registry import model_metrics
+from fraud_models import fraud_models
+from pipeline import claims_columns, load_lookups, predict
+from tmean import ClaimCodes, secondary_diagnosis_cols
+from code_dictionary import CodeDictionary
+
+claim_cols = claims_columns(fraud_models)
+date_cols = ['CLM_FROM_DT', 'CLM_THRU_DT']
+code_cols = ['PRNCPAL_DGNS_CD'] + secondary_diagnosis_cols
+
+def validate_claims(claims):
+    """
+    Check posted claims before they are queued, so a malformed claim is a 400
+    for its own request instead of an error inside a shared scoring batch.
+
+    Raises:
+        ValueError: naming the first bad claim and field
+    """
+    for i, claim in enumerate(claims):
+        if not isinstance(claim, dict):
+            raise ValueError(f"claim {i}: expected an object")
+        clm_id = claim.get('CLM_ID')
+        if isinstance(clm_id, bool) or not isinstance(clm_id, (int, str)):
+            raise ValueError(f"claim {i}: CLM_ID must be a string or an integer")
+        amount = claim.get('CLM_TOT_CHRG_AMT')
+        if isinstance(amount, bool) or not isinstance(amount, (int, float, str)):
+            raise ValueError(f"claim {i}: CLM_TOT_CHRG_AMT must be a number")
+        try:
+            finite = math.isfinite(float(amount))
+        except ValueError:
+            finite = False
+        if not finite:
+            # json.loads accepts NaN and Infinity, which the models can't score
+            raise ValueError(f"claim {i}: CLM_TOT_CHRG_AMT must be a finite number, got {amount!r}")
+        for col in date_cols:
+            value = claim.get(col)
+            try:
+                # one format, so a batch's dates parse together
+                datetime.datetime.strptime(value, '%Y-%m-%d')
+            except (TypeError, ValueError):
+                raise ValueError(f"claim {i}: {col} must be a YYYY-MM-DD date, got {value!r}")
+        for col in code_cols:
+            value = claim.get(col)
+            if value is not None and not isinstance(value, str):
+                raise ValueError(f"claim {i}: {col} must be a string or null, got {value!r}")
+
+class LatencyStats:
+    """
+    Rolling request latencies and a running claim count for throughput.
+    """
+
+    def __init__(self, window=10_000):
+        self._latencies = deque(maxlen=window)
+        self._batch_sizes = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.started_at = time.monotonic()
+        self.requests = 0
+        self.claims = 0
+        self.batches = 0
+
+    def record_request(self, latency_seconds, n_claims):
+        with self._lock:
+            self._latencies.append(latency_seconds)
+            self.requests += 1
+            self.claims += n_claims
+
+    def record_batch(self, n_claims):
+        with self._lock:
+            self._batch_sizes.append(n_claims)
+            self.batches += 1
+
+    def snapshot(self):
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000.0
+            batch_sizes = np.array(self._batch_sizes)
+            elapsed = time.monotonic() - self.started_at
+            return {
+                'requests': self.requests,
+                'claims': self.claims,
+                'batches': self.batches,
+                'latency_ms_p50': float(np.percentile(latencies, 50)) if len(latencies) else None,
+                'latency_ms_p99': float(np.percentile(latencies, 99)) if len(latencies) else None,
+                'mean_batch_claims': float(batch_sizes.mean()) if len(batch_sizes) else None,
+                'claims_per_second': self.claims / elapsed if elapsed > 0 else 0.0,
+                'uptime_seconds': elapsed,
+            }
+
+class MicroBatcher:
+    """
+    Groups concurrent submissions into one call of `score_fn`.
+
+    A single worker thread blocks for the first pending request, then keeps
+    collecting until the batch holds `max_batch_size` claims or `max_wait_ms`
+    has passed since that first request arrived, so a request never waits
+    more than `max_wait_ms` for company beyond the time spent behind the
+    batch ahead of it.
+    """
+
+    def __init__(self, score_fn, max_batch_size=256, max_wait_ms=5.0, stats=None):
+        self.score_fn = score_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.stats = stats or LatencyStats()
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._worker.start()
+
+    def submit(self, claims):
+        """
+        Queue a list of claim dicts; returns a Future resolving to their results.
+        """
+        future = Future()
+        self._queue.put((claims, future, time.monotonic()))
+        return future
+
+    def score(self, claims, timeout=None):
+        return self.submit(claims).result(timeout=timeout)
+
+    def _run(self):
+        while True:
+            pending = [self._queue.get()]
+            n_claims = len(pending[0][0])
+            deadline = pending[0][2] + self.max_wait
+
+            while n_claims < self.max_batch_size:
+                # requests that queued up during the previous batch are taken
+                # right away; only an empty queue waits out the deadline
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                pending.append(item)
+                n_claims += len(item[0])
+
+            self._score_pending(pending, n_claims)
+
+    def _score_pending(self, pending, n_claims):
+        batch = [claim for claims, _, _ in pending for claim in claims]
+        try:
+            results = self.score_fn(batch)
+        except Exception as e:
+            if len(pending) == 1:
+                pending[0][1].set_exception(e)
+                return
+            # one bad request shouldn't fail the others it was batched with
+            for item in pending:
+                self._score_pending([item], len(item[0]))
+            return
+
+        self.stats.record_batch(n_claims)
+        offset = 0
+        done_at = time.monotonic()
+        for claims, future, submitted_at in pending:
+            future.set_result(results[offset:offset + len(claims)])
+            offset += len(claims)
+            self.stats.record_request(done_at - submitted_at, len(claims))
+
+def _json_value(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, np.generic):
+        return _json_value(value.item())
+    return value
+
+class ScoringService:
+    """
+    The fraud models with their tmean lookups held in memory.
+    """
+
+    def __init__(self, sqlite_db_path, fraud_threshold=-0.1, specs=fraud_models):
+        self.fraud_threshold = fraud_threshold
+        self.specs = specs
+
+        conn = sqlite3.connect(sqlite_db_path)
+        try:
+            self.dictionary = CodeDictionary.load(conn)
+            self.lookups = {spec.name: load_lookups(conn, spec, self.dictionary) for spec in specs}
+        finally:
+            conn.close()
+
+    def warm_up(self, claim):
+        """
+        Score one claim so every model is loaded before the first request.
+        """
+        self.score_batch([claim])
+
+    def score_batch(self, claims):
+        """
+        Score a list of claim dicts with every model.
+
+        Returns:
+            list[dict]: one result per claim, in input order
+        """
+        df_claims = pd.DataFrame.from_records(claims).reindex(columns=claim_cols)
+        df_claims['CLM_TOT_CHRG_AMT'] = pd.to_numeric(df_claims['CLM_TOT_CHRG_AMT'])
+        # codes are mapped to dictionary ids once and shared by every model;
+        # each model's lookup of the whole vocabulary is kept between batches
+        codes = ClaimCodes(df_claims, self.dictionary)
+
+        results = [{'CLM_ID': _json_value(clm_id), 'models': {}} for clm_id in df_claims['CLM_ID']]
+        for spec in self.specs:
+            df_scored = predict(spec, spec.add_target(df_claims), self.lookups[spec.name], codes)
+            preds = df_scored[spec.pred_col].to_numpy()
+            diffs = df_scored[spec.diff_col].to_numpy()
+            scores = calculate_scores(diffs)
+            for result, pred, diff, score in zip(results, preds, diffs, scores):
+                fraud = bool(diff < self.fraud_threshold)
+                result['models'][spec.name] = {
+                    'pred': _json_value(pred),
+                    'diff_score': _json_value(diff),
+                    'fraud': fraud,
+                    'score': _json_value(score) if fraud else None,
+                }
+        return results
+
+class ScoringHTTPServer(ThreadingHTTPServer):
+    # the default listen backlog of 5 resets connections under a load test
+    request_queue_size = 128
+    daemon_threads = True
+
+def make_handler(batcher, request_timeout):
+    class ScoringHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._send_json(200, {'status': 'ok'})
+            elif self.path == '/metrics':
+                self._send_json(200, {'service': batcher.stats.snapshot(), 'models': model_metrics()})
+            else:
+                self._send_json(404, {'error': f'unknown path {self.path}'})
+
+        def do_POST(self):
+            if self.path != '/score':
+                self._send_json(404, {'error': f'unknown path {self.path}'})
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'null')
+                claims = payload.get('claims', [payload]) if isinstance(payload, dict) else payload
+                if not isinstance(claims, list):
+                    raise ValueError("expected a claim object or {\"claims\": [...]}")
+                validate_claims(claims)
+            except ValueError as e:
+                self._send_json(400, {'error': str(e)})
+                return
+
+            if not claims:
+                self._send_json(200, {'results': []})
+                return
+            try:
+                results = batcher.score(claims, timeout=request_timeout)
+            except Exception as e:
+                self._send_json(500, {'error': str(e)})
+                return
+            self._send_json(200, {'results': results})
+
+        def log_message(self, format, *args):
+            # per-request access logging would dominate at load-test rates
+            pass
+
+    return ScoringHandler
+
+def main():
+    p = argparse.ArgumentParser(description="Resident micro-batching scoring service for the fraud models.")
+    p.add_argument("--db", default="fraud.db", help="Initialized fraud DB holding the tmean tables")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8080)
+    p.add_argument("--max-batch-size", type=int, default=256, help="Max claims per model call")
+    p.add_argument("--max-wait-ms", type=float, default=5.0, help="Max time the first request in a batch waits for company")
+    p.add_argument("--fraud-threshold", type=float, default=-0.1)
+    p.add_argument("--request-timeout", type=float, default=30.0)
+    args = p.parse_args()
+
+    service = ScoringService(args.db, fraud_threshold=args.fraud_threshold)
+    service.warm_up({'CLM_ID': 0, 'CLM_TOT_CHRG_AMT': 0, 'CLM_FROM_DT': '2025-01-01', 'CLM_THRU_DT': '2025-01-01'})
+
+    batcher = MicroBatcher(service.score_batch, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+    server = ScoringHTTPServer((args.host, args.port), make_handler(batcher, args.request_timeout))
+    print(f"Scoring service listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,6 @@
-import pandas as pd
 import sqlite3
-from pathlib import Path
 import sys
 
-def import_excel_to_sqlite(excel_file_path, sqlite_db_path, table_name=None):
-    """
-    Import an Excel file to SQLite database with automatic column discovery.
-    
-    Args:
-        excel_file_path (str): Path to the Excel file
-        sqlite_db_path (str): Path to the SQLite database (will be created if doesn't exist)
-        table_name (str, optional): Name of the table. If None, uses the Excel filename
-    """
-    try:
-        # Read the Excel file
-        print(f"Reading Excel file: {excel_file_path}")
-        df = pd.read_excel(excel_file_path)
-        df.columns = [col.replace(' ', '_') for col in df.columns]
-        df.columns = [col.strip() for col in df.columns]
-        
-        # Use filename as table name if not provided
-        if table_name is None:
-            table_name = Path(excel_file_path).stem.replace(' ', '_').replace('-', '_')
-        
-        # Display discovered columns
-        print(f"\nDiscovered columns ({len(df.columns)} total):")
-        for col in df.columns:
-            print(f"  - {col} ({df[col].dtype})")
-        
-        # Connect to SQLite database
-        print(f"\nConnecting to SQLite database: {sqlite_db_path}")
-        conn = sqlite3.connect(sqlite_db_path)
-        
-        # Import DataFrame to SQLite
-        print(f"Importing data to table: {table_name}")
-        df.to_sql(table_name, conn, if_exists='replace', index=False)
-        
-        # Verify import
-        cursor = conn.cursor()
-        cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-        row_count = cursor.fetchone()[0]
-        
-        print(f"\nImport successful!")
-        print(f"  - Rows imported: {row_count}")
-        print(f"  - Table name: {table_name}")
-        
-        # Close connection
-        conn.close()
-        
-    except Exception as e:
-        print(f"Error: {e}")
-        sys.exit(1)
-
 def init_fraud_table(sqlite_db_path):
     """
     Initialize a fraud table to store detected fraudulent claims.
@@ -72,10 +21,73 @@ def init_fraud_table(sqlite_db_path):
         """)
         
         conn.commit()
+        ensure_fraud_index(conn)
         print("Fraud table initialized successfully.")
         
         conn.close()
         
     except Exception as e:
         print(f"Error initializing fraud table: {e}")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
+
+def ensure_fraud_index(conn):
+    """
+    Unique index on fraud (CLM_ID, model_name), so upsert_fraud_rows can
+    replace a claim's row instead of appending another one.
+
+    Tables written before the index existed can hold duplicates from reruns:
+    the latest row per claim and model stays in fraud, and the older ones are
+    moved, not deleted, into fraud_duplicates in the same transaction.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_fraud_clm_id_model';").fetchone()
+    if exists is not None:
+        return
+
+    duplicates = "id NOT IN (SELECT MAX(id) FROM fraud GROUP BY CLM_ID, model_name)"
+    with conn:
+        conn.execute('BEGIN;')
+        n_duplicates = conn.execute(f"SELECT COUNT(*) FROM fraud WHERE {duplicates};").fetchone()[0]
+        if n_duplicates:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS fraud_duplicates (
+                    id INTEGER PRIMARY KEY,
+                    CLM_ID TEXT,
+                    model_name TEXT,
+                    score REAL,
+                    detected_at TIMESTAMP,
+                    moved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+            conn.execute(f"""
+                INSERT INTO fraud_duplicates (id, CLM_ID, model_name, score, detected_at)
+                SELECT id, CLM_ID, model_name, score, detected_at FROM fraud WHERE {duplicates};
+            """)
+            conn.execute(f"DELETE FROM fraud WHERE {duplicates};")
+        conn.execute("CREATE UNIQUE INDEX idx_fraud_clm_id_model ON fraud (CLM_ID, model_name);")
+    if n_duplicates:
+        print(f"Moved {n_duplicates} duplicate fraud rows to fraud_duplicates.")
+
+def upsert_fraud_rows(conn, df_fraud):
+    """
+    Write flagged claims of any number of models in one transaction.
+
+    A claim already flagged by the same model gets its score and
+    detected_at updated, so rescoring never duplicates fraud rows.
+
+    Args:
+        df_fraud (DataFrame): columns CLM_ID, model_name, score
+    """
+    ensure_fraud_index(conn)
+    rows = zip(
+        df_fraud['CLM_ID'].astype(str).tolist(),
+        df_fraud['model_name'].tolist(),
+        df_fraud['score'].astype(float).tolist(),
+    )
+    with conn:
+        conn.executemany("""
+            INSERT INTO fraud (CLM_ID, model_name, score) VALUES (?, ?, ?)
+            ON CONFLICT (CLM_ID, model_name) DO UPDATE SET
+                score = excluded.score,
+                detected_at = CURRENT_TIMESTAMP;
+        """, rows)
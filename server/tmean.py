@@ -0,0 +1,402 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+secondary_diagnosis_cols = [f'ICD_DGNS_CD{i}' for i in range(1, 26)]
+secondary_diagnosis_tmean_cols = [f'ICD_DGNS_CD{i}_TMEAN' for i in range(1, 26)]
+
+def principal_code_tmean(df_claims, target_col, code_col='PRNCPAL_DGNS_CD', tmean_col='PRNCPAL_DGNS_CD_TMEAN'):
+    """
+    Mean of `target_col` per principal diagnosis code.
+
+    Args:
+        df_claims (DataFrame): one row per claim
+        target_col (str): column to average (e.g. CLM_TOT_CHRG_AMT, CLM_NUM_DAYS)
+
+    Returns:
+        DataFrame: columns [code_col, tmean_col]
+    """
+    # observed: a dictionary-encoded column would otherwise get a row per vocabulary code
+    grouped = df_claims.groupby(code_col, observed=True)[target_col]
+    counts = grouped.count()
+    group_ids = grouped.ngroup().to_numpy(dtype=np.float64, na_value=np.nan)
+    values = df_claims[target_col].to_numpy(dtype=np.float64, na_value=np.nan)
+    has_value = ~np.isnan(group_ids) & ~np.isnan(values)
+    # summed like TmeanAccumulator, so the chunked tables come out the same
+    sums, _ = compensated_sums(group_ids[has_value].astype(np.int64), values[has_value], len(counts))
+    with np.errstate(invalid='ignore'):
+        principal_tmean = pd.Series(sums / counts.to_numpy(), index=counts.index, name=tmean_col).reset_index()
+    return principal_tmean
+
+def _code_matrix(df_claims, code_cols):
+    """
+    The code columns as one matrix, and what its entries stand for.
+
+    Returns:
+        (ndarray, ndarray | None): the int category codes and the categories
+        (with None appended, so -1 picks it) if every column is a Categorical
+        of one dtype (code_dictionary.py), else the object strings and None
+    """
+    dtype = df_claims[code_cols[0]].dtype
+    if isinstance(dtype, pd.CategoricalDtype) and all(df_claims[c].dtype == dtype for c in code_cols):
+        matrix = np.column_stack([df_claims[c].cat.codes.to_numpy() for c in code_cols])
+        return matrix, np.append(np.asarray(dtype.categories, dtype=object), None)
+    return df_claims[code_cols].to_numpy(dtype=object), None
+
+def _factorize(values, categories=None, drop_none=False):
+    """
+    pd.factorize of codes, or of category codes standing for `categories`,
+    which hashes small integers instead of strings. Missing codes (and the
+    literal string 'None' if `drop_none`) get id -1.
+    """
+    code_ids, uniques = pd.factorize(values)
+    uniques = np.asarray(uniques, dtype=object) if categories is None else categories[uniques]
+    missing = pd.isna(uniques)
+    if drop_none:
+        missing |= uniques == 'None'
+    missing = np.flatnonzero(missing)
+    if len(missing):
+        code_ids = np.where(np.isin(code_ids, missing), -1, code_ids)
+    return code_ids, uniques
+
+def factorize_codes(codes):
+    """
+    Codes (array or Series) -> (ids in first-appearance order, unique codes),
+    like pd.factorize; dictionary-encoded (Categorical) codes are factorized
+    on their integer codes.
+    """
+    if isinstance(getattr(codes, 'dtype', None), pd.CategoricalDtype):
+        categorical = pd.Categorical(codes, dtype=codes.dtype)
+        return _factorize(categorical.codes, np.append(np.asarray(categorical.categories, dtype=object), None))
+    return _factorize(np.asarray(codes, dtype=object))
+
+def melt_secondary_codes(df_claims, code_cols=secondary_diagnosis_cols):
+    """
+    Flatten the wide ICD_DGNS_CD* matrix into de-duplicated (row, code) pairs.
+
+    Codes are factorized once over the raveled matrix, so code ids follow
+    first-appearance order (the same order as pd.unique). Missing codes and the
+    literal string 'None' are dropped, and a code repeated on the same claim is
+    only kept once. Dictionary-encoded columns give the same pairs from their
+    integer codes.
+
+    Returns:
+        (ndarray, ndarray, ndarray): row positions, code ids, and the unique codes
+    """
+    matrix, categories = _code_matrix(df_claims, code_cols)
+    code_ids, uniques = _factorize(matrix.ravel(), categories, drop_none=True)
+    code_ids = code_ids.reshape(len(df_claims), len(code_cols))
+
+    # sort each claim's codes so repeats sit next to each other
+    code_ids = np.sort(code_ids, axis=1)
+    keep = code_ids >= 0
+    keep[:, 1:] &= code_ids[:, 1:] != code_ids[:, :-1]
+
+    rows, cols = np.nonzero(keep)
+    return rows, code_ids[rows, cols], uniques
+
+def secondary_code_tmean(df_claims, target_col, code_cols=secondary_diagnosis_cols,
+                         code_name='SECONDARY_DGNS_CD', tmean_name='SECONDARY_DGNS_TMEAN'):
+    """
+    Mean of `target_col` over every claim carrying a code in any of `code_cols`.
+
+    Equivalent to looping over each unique code, masking claims where any
+    secondary column equals it and averaging the target, but done as a single
+    melt + groupby. Output rows are in first-appearance order, same as the loop.
+
+    Args:
+        df_claims (DataFrame): one row per claim
+        target_col (str): column to average
+
+    Returns:
+        DataFrame: columns [code_name, tmean_name]
+    """
+    rows, code_ids, uniques = melt_secondary_codes(df_claims, code_cols)
+    target = df_claims[target_col].to_numpy(dtype=np.float64, na_value=np.nan)[rows]
+
+    # code ids are assigned in first-appearance order, which the accumulator keeps
+    return TmeanAccumulator().add_ids(code_ids, uniques, target).frame(code_name, tmean_name)
+
+def _sums_exactly(values):
+    # whole numbers whose running total stays below 2**53 add up exactly in any order
+    return bool(np.all(values == np.floor(values))) and np.abs(values).sum() < 2.0 ** 53
+
+def compensated_sums(code_ids, values, n_codes):
+    """
+    Per-code sums of `values` as (sum, compensation) pairs: the sum is the
+    exact total rounded once (math.fsum) and the compensation what rounding
+    left out, so the sums don't depend on the order or chunking of the values.
+
+    Args:
+        code_ids (ndarray): code id (0 <= id < n_codes) of each value
+        values (ndarray): float64 values, no NaN
+
+    Returns:
+        (ndarray, ndarray): sums and compensations, one per code id
+    """
+    if _sums_exactly(values):
+        return np.bincount(code_ids, weights=values, minlength=n_codes), np.zeros(n_codes)
+    sums, compensations = np.zeros(n_codes), np.zeros(n_codes)
+    order = np.argsort(code_ids, kind='stable')
+    code_ids, values = code_ids[order], values[order]
+    starts = np.flatnonzero(np.diff(code_ids)) + 1
+    for code, part in zip(code_ids[np.r_[0, starts]], np.split(values, starts)):
+        if not np.isfinite(part).all():
+            # inf, or NaN for inf - inf, as a plain sum gives them
+            sums[code] = part.sum()
+            continue
+        terms = part.tolist()
+        sums[code] = math.fsum(terms)
+        terms.append(-sums[code])
+        compensations[code] = math.fsum(terms)
+    return sums, compensations
+
+def add_compensated(sums, compensations, other_sums, other_compensations):
+    """
+    Elementwise sum of two arrays of (sum, compensation) pairs, as pairs of
+    the same form.
+    """
+    total = sums + other_sums
+    if not compensations.any() and not other_compensations.any() \
+            and _sums_exactly(np.concatenate([sums, other_sums])):
+        return total, np.zeros(len(total))
+    total_compensations = np.zeros(len(total))
+    for i, terms in enumerate(zip(sums.tolist(), compensations.tolist(),
+                                  other_sums.tolist(), other_compensations.tolist())):
+        if not math.isfinite(total[i]):
+            continue
+        total[i] = math.fsum(terms)
+        total_compensations[i] = math.fsum(terms + (-total[i],))
+    return total, total_compensations
+
+class TmeanAccumulator:
+    """
+    Running per-code (sum, count) of a target, built chunk by chunk.
+
+    Accumulators over disjoint chunks merge by adding their sums and counts,
+    so target means over a claims table larger than memory only ever need one
+    chunk plus one entry per code in memory. Sums are compensated_sums pairs,
+    so fractional targets give the same means however the claims are chunked.
+    Codes keep first-appearance order; NaN targets are skipped, and a code
+    seen only with NaN targets gets a NaN mean, like groupby().mean().
+    """
+
+    def __init__(self):
+        self.codes = pd.Index([], dtype=object)
+        self.sums = np.zeros(0, dtype=np.float64)
+        self.compensations = np.zeros(0, dtype=np.float64)
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def add(self, codes, values):
+        """
+        Add one value per code; missing codes are ignored.
+        """
+        code_ids, uniques = factorize_codes(codes)
+        return self.add_ids(code_ids, uniques, values)
+
+    def add_ids(self, code_ids, uniques, values):
+        """
+        Add values for already factorized codes (-1 for missing).
+        """
+        values = np.asarray(values, dtype=np.float64)
+        present = code_ids >= 0
+        code_ids, values = code_ids[present], values[present]
+        has_value = ~np.isnan(values)
+
+        seen = np.bincount(code_ids, minlength=len(uniques)) > 0
+        sums, compensations = compensated_sums(code_ids[has_value], values[has_value], len(uniques))
+        counts = np.bincount(code_ids[has_value], minlength=len(uniques))
+        return self._merge(pd.Index(uniques[seen], dtype=object), sums[seen], compensations[seen], counts[seen])
+
+    def merge(self, other):
+        return self._merge(other.codes, other.sums, other.compensations, other.counts)
+
+    def _merge(self, codes, sums, compensations, counts):
+        positions = self.codes.get_indexer(codes)
+        new = positions < 0
+        if new.any():
+            positions[new] = np.arange(len(self.codes), len(self.codes) + new.sum())
+            self.codes = self.codes.append(codes[new])
+            self.sums = np.concatenate([self.sums, np.zeros(new.sum())])
+            self.compensations = np.concatenate([self.compensations, np.zeros(new.sum())])
+            self.counts = np.concatenate([self.counts, np.zeros(new.sum(), dtype=np.int64)])
+        # each code appears once in `codes`, so fancy-index assignments are safe
+        self.sums[positions], self.compensations[positions] = add_compensated(
+            self.sums[positions], self.compensations[positions], sums, compensations)
+        self.counts[positions] += counts
+        return self
+
+    def frame(self, code_name, tmean_name, sort=False):
+        """
+        Returns:
+            DataFrame: [code_name, tmean_name], sorted by code if `sort`
+                (groupby order) or else in first-appearance order
+        """
+        with np.errstate(invalid='ignore'):
+            means = self.sums / self.counts
+        df = pd.DataFrame({code_name: np.asarray(self.codes, dtype=object), tmean_name: means})
+        if sort:
+            df = df.sort_values(code_name, kind='stable', ignore_index=True)
+        return df
+
+def chunked_code_tmeans(chunks, target_col, code_col='PRNCPAL_DGNS_CD', code_cols=secondary_diagnosis_cols):
+    """
+    principal_code_tmean and secondary_code_tmean over a stream of claims
+    chunks (one row per claim), holding only one chunk at a time.
+
+    The means equal the in-memory ones exactly, fractional targets included:
+    both sum with compensated_sums.
+
+    Returns:
+        (DataFrame, DataFrame): the principal and secondary tmean tables
+    """
+    principal, secondary = TmeanAccumulator(), TmeanAccumulator()
+    for chunk in chunks:
+        target = chunk[target_col].to_numpy(dtype=np.float64)
+        principal.add(chunk[code_col], target)
+        rows, code_ids, uniques = melt_secondary_codes(chunk, code_cols)
+        secondary.add_ids(code_ids, uniques, target[rows])
+    return (
+        principal.frame(code_col, 'PRNCPAL_DGNS_CD_TMEAN', sort=True),
+        secondary.frame('SECONDARY_DGNS_CD', 'SECONDARY_DGNS_TMEAN'),
+    )
+
+class TmeanLookup:
+    """
+    Code -> target-mean lookup built once from a tmean table.
+
+    Codes missing from the table look up as NaN, like a left merge.
+    """
+
+    def __init__(self, tmean_codes, tmean_values):
+        self.index = pd.Index(tmean_codes)
+        # get_indexer returns -1 for a miss, which picks the trailing NaN
+        self.values = np.append(np.asarray(tmean_values, dtype=np.float64), np.nan)
+        self._last = (None, None)
+
+    def __call__(self, codes):
+        return self.values[self.index.get_indexer(codes)]
+
+    def id_values(self, codes):
+        """
+        Values to gather ids into `codes` with: the lookup of every code, then
+        NaN for id -1. The result for the last pd.Index is kept, so a code
+        dictionary's vocabulary, passed batch after batch, is resolved once.
+        """
+        last_codes, last_values = self._last
+        if codes is last_codes:
+            return last_values
+        values = np.append(self(codes), np.nan)
+        if isinstance(codes, pd.Index):
+            # one tuple, so concurrent callers never see a mismatched pair
+            self._last = (codes, values)
+        return values
+
+class ClaimCodes:
+    """
+    Principal and secondary codes of a claims batch, factorized once.
+
+    Every model's tmean lookup then only has to map the batch's unique codes
+    and gather by id, so adding a model doesn't re-hash 26 code columns.
+    Missing codes get id -1 and look up as NaN, like a TmeanLookup miss.
+
+    If the code columns are Categoricals of one code dictionary
+    (code_dictionary.py), their integer codes are used as the ids directly;
+    given a `dictionary`, string codes are mapped to its ids (codes it
+    doesn't know become -1). Either way the ids index the whole vocabulary,
+    whose lookups TmeanLookup keeps between batches.
+    """
+
+    def __init__(self, df_claims, dictionary=None):
+        principal = df_claims['PRNCPAL_DGNS_CD']
+        secondary, categories = _code_matrix(df_claims, secondary_diagnosis_cols)
+        if categories is not None and principal.dtype == df_claims[secondary_diagnosis_cols[0]].dtype:
+            self.principal_ids = principal.cat.codes.to_numpy()
+            self.secondary_ids = secondary
+            self.principal_codes = self.secondary_codes = principal.cat.categories
+        elif dictionary is not None:
+            self.principal_ids = dictionary.ids(principal.to_numpy(dtype=object))
+            self.secondary_ids = dictionary.ids(df_claims[secondary_diagnosis_cols].to_numpy(dtype=object))
+            self.principal_codes = self.secondary_codes = dictionary.categories
+        else:
+            self.principal_ids, self.principal_codes = pd.factorize(principal)
+            secondary_ids, self.secondary_codes = pd.factorize(secondary.ravel())
+            self.secondary_ids = secondary_ids.reshape(len(df_claims), len(secondary_diagnosis_cols))
+
+    def take(self, rows):
+        """
+        The codes of a subset of the batch (boolean mask or positions).
+        """
+        subset = object.__new__(ClaimCodes)
+        subset.principal_ids = self.principal_ids[rows]
+        subset.principal_codes = self.principal_codes
+        subset.secondary_ids = self.secondary_ids[rows]
+        subset.secondary_codes = self.secondary_codes
+        return subset
+
+    def tmean_matrix(self, principal_lookup, secondary_lookup):
+        """
+        Returns:
+            ndarray: (claims, 26) float matrix, principal tmean first
+        """
+        principal_values = principal_lookup.id_values(self.principal_codes)
+        secondary_values = secondary_lookup.id_values(self.secondary_codes)
+
+        tmean = np.empty((len(self.principal_ids), 1 + len(secondary_diagnosis_cols)), dtype=np.float64)
+        tmean[:, 0] = principal_values[self.principal_ids]
+        tmean[:, 1:] = secondary_values[self.secondary_ids]
+        return tmean
+
+def tmean_lookups(df_principal_tmean, df_secondary_tmean):
+    """
+    (principal, secondary) TmeanLookup pair for a model's two tmean tables.
+    """
+    return (
+        TmeanLookup(df_principal_tmean['PRNCPAL_DGNS_CD'], df_principal_tmean['PRNCPAL_DGNS_CD_TMEAN']),
+        TmeanLookup(df_secondary_tmean['SECONDARY_DGNS_CD'], df_secondary_tmean['SECONDARY_DGNS_TMEAN']),
+    )
+
+def _feature_frame(df_claims, tmean, target_col):
+    df_features = df_claims[['CLM_ID', 'PRNCPAL_DGNS_CD', target_col] + secondary_diagnosis_cols].reset_index(drop=True)
+    df_tmean = pd.DataFrame(tmean, columns=['PRNCPAL_DGNS_CD_TMEAN'] + secondary_diagnosis_tmean_cols)
+    return pd.concat([df_features, df_tmean], axis=1)
+
+def assemble_tmean_features(df_claims, df_principal_tmean, df_secondary_tmean, target_col):
+    """
+    Build the scoring frame: claim columns followed by all 26 *_TMEAN columns.
+
+    Each tmean table becomes one TmeanLookup and the 25 secondary columns are
+    written straight into a preallocated float matrix, instead of one
+    DataFrame.merge (and a full frame copy) per column.
+
+    Args:
+        df_claims (DataFrame): one row per claim
+        df_principal_tmean (DataFrame): [PRNCPAL_DGNS_CD, PRNCPAL_DGNS_CD_TMEAN]
+        df_secondary_tmean (DataFrame): [SECONDARY_DGNS_CD, SECONDARY_DGNS_TMEAN]
+        target_col (str): the model's target column, carried through unchanged
+
+    Returns:
+        DataFrame: CLM_ID, PRNCPAL_DGNS_CD, target, ICD_DGNS_CD1..25,
+        PRNCPAL_DGNS_CD_TMEAN, ICD_DGNS_CD1_TMEAN..ICD_DGNS_CD25_TMEAN
+    """
+    principal_lookup, secondary_lookup = tmean_lookups(df_principal_tmean, df_secondary_tmean)
+
+    tmean = np.empty((len(df_claims), 1 + len(secondary_diagnosis_cols)), dtype=np.float64)
+    tmean[:, 0] = principal_lookup(df_claims['PRNCPAL_DGNS_CD'])
+    for i, col in enumerate(secondary_diagnosis_cols, start=1):
+        tmean[:, i] = secondary_lookup(df_claims[col])
+
+    return _feature_frame(df_claims, tmean, target_col)
+
+def assemble_coded_features(df_claims, codes, lookups, target_col):
+    """
+    Same frame as assemble_tmean_features, from codes factorized once per batch.
+
+    Args:
+        df_claims (DataFrame): one row per claim
+        codes (ClaimCodes): df_claims' codes, row for row
+        lookups ((TmeanLookup, TmeanLookup)): from tmean_lookups
+        target_col (str): the model's target column, carried through unchanged
+    """
+    return _feature_frame(df_claims, codes.tmean_matrix(*lookups), target_col)
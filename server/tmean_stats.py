@@ -0,0 +1,377 @@
+# Incremental target-mean statistics.
+#
+# Each tmean table is materialized from a stats table holding the target's
+# (sum, count) per code and claim month (the month of CLM_FROM_DT). Sums and
+# counts merge by addition, so new claims are folded in by reading only the
+# claims_dedup rows past the spec's tmean watermark, and the tmean table is then
+# rebuilt from the stats rows rather than from the claims. Each sum keeps the
+# compensation for what its additions rounded off (tmean.compensated_sums), so
+# updated tables equal a rebuild from every claim for fractional targets too.
+#
+# Because the stats are kept per month, a spec can also limit its means to a
+# window of recent months (ModelSpec.tmean_window_months) or weight months by an
+# exponential half-life (ModelSpec.tmean_half_life_months), both counted back
+# from the newest claim month.
+#
+# save_tmean_snapshot copies a spec's current tmean tables under a snapshot id;
+# a spec with tmean_snapshot set scores with those values instead of the live
+# tables. Every scoring run records the snapshot holding the values it used
+# (scoring_tmean_snapshot saves one when the tables changed since the last), so
+# the predictions views show what each claim was scored with even after the
+# live tables move on (predictions.py).
+#
+#     python tmean_stats.py --db fraud.db --snapshot
+
+import argparse
+import hashlib
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from claims_access import read_claims, read_claims_since, refresh_claims_dedup
+from incremental import get_watermark, set_watermark
+from tmean import TmeanAccumulator, compensated_sums, factorize_codes, melt_secondary_codes, secondary_diagnosis_cols
+
+period_col = 'CLM_FROM_DT'
+
+def stats_table(tmean_table):
+    return f'{tmean_table}_stats'
+
+def _tmean_tables(spec):
+    """
+    (tmean table, code column, tmean column, sort by code) for both tables.
+    """
+    return [
+        (spec.principal_tmean_table, 'PRNCPAL_DGNS_CD', 'PRNCPAL_DGNS_CD_TMEAN', True),
+        (spec.secondary_tmean_table, 'SECONDARY_DGNS_CD', 'SECONDARY_DGNS_TMEAN', False),
+    ]
+
+def tmean_watermark_name(spec):
+    # its own scoring_watermark row, so reset_watermark(spec.name) leaves it be
+    return f'{spec.name}:tmean'
+
+def stats_columns(spec):
+    """
+    The claims columns building a spec's stats reads.
+    """
+    cols = ['CLM_ID', 'PRNCPAL_DGNS_CD'] + secondary_diagnosis_cols
+    return list(dict.fromkeys(cols + spec.source_cols + [period_col]))
+
+def claim_periods(df_claims):
+    """
+    Claim month ('YYYY-MM' of the ISO CLM_FROM_DT text); '' when missing.
+    """
+    return df_claims[period_col].astype('string').str.slice(0, 7).fillna('').to_numpy(dtype=object)
+
+def _add_pairs(acc, code_ids, uniques, periods, values):
+    """
+    Add values keyed by (period, code) pairs, as 'period|code' strings so a
+    TmeanAccumulator can hold them. Only the chunk's distinct pairs are turned
+    into strings.
+    """
+    present = code_ids >= 0
+    if not present.any():
+        return
+    period_ids, period_uniques = pd.factorize(periods[present])
+    n_periods = len(period_uniques)
+    pair_ids, pair_uniques = pd.factorize(code_ids[present].astype(np.int64) * n_periods + period_ids)
+    keys = np.array([f'{period_uniques[p % n_periods]}|{uniques[p // n_periods]}' for p in pair_uniques], dtype=object)
+    acc.add_ids(pair_ids, keys, values[present])
+
+def accumulate_stats(spec, chunks):
+    """
+    Per (period, code) target (sum, count) of a stream of claims chunks.
+
+    Returns:
+        (TmeanAccumulator, TmeanAccumulator): principal and secondary stats
+    """
+    principal, secondary = TmeanAccumulator(), TmeanAccumulator()
+    for chunk in chunks:
+        spec.add_target(chunk)
+        target = chunk[spec.target_col].to_numpy(dtype=np.float64)
+        periods = claim_periods(chunk)
+
+        code_ids, uniques = factorize_codes(chunk['PRNCPAL_DGNS_CD'])
+        _add_pairs(principal, code_ids, uniques, periods, target)
+        rows, code_ids, uniques = melt_secondary_codes(chunk)
+        _add_pairs(secondary, code_ids, uniques, periods[rows], target[rows])
+    return principal, secondary
+
+def _create_stats_table(conn, tmean_table, code_col, replace):
+    table = stats_table(tmean_table)
+    if replace:
+        conn.execute(f'DROP TABLE IF EXISTS "{table}";')
+    # a rowid table: rowid order is the codes' first-appearance order
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{table}" (
+            "{code_col}" TEXT NOT NULL,
+            PERIOD TEXT NOT NULL,
+            TARGET_SUM REAL NOT NULL,
+            TARGET_COUNT INTEGER NOT NULL,
+            TARGET_SUM_COMP REAL NOT NULL DEFAULT 0,
+            UNIQUE ("{code_col}", PERIOD)
+        );
+    """)
+    columns = {row[1] for row in conn.execute(f'PRAGMA table_info("{table}");')}
+    if 'TARGET_SUM_COMP' not in columns:
+        conn.execute(f'ALTER TABLE "{table}" ADD COLUMN TARGET_SUM_COMP REAL NOT NULL DEFAULT 0;')
+
+# the rounding error of TARGET_SUM + excluded.TARGET_SUM (TwoSum); NULL, and so
+# 0, when inf makes it NaN
+_sum_error = """COALESCE(
+    (TARGET_SUM - ((TARGET_SUM + excluded.TARGET_SUM) - ((TARGET_SUM + excluded.TARGET_SUM) - TARGET_SUM)))
+    + (excluded.TARGET_SUM - ((TARGET_SUM + excluded.TARGET_SUM) - TARGET_SUM)), 0)"""
+
+def _upsert_stats(conn, tmean_table, code_col, acc):
+    periods_codes = [key.split('|', 1) for key in acc.codes]
+    rows = ((code, period, float(s), float(c), int(n))
+            for (period, code), s, c, n in zip(periods_codes, acc.sums, acc.compensations, acc.counts))
+    conn.executemany(f"""
+        INSERT INTO "{stats_table(tmean_table)}" ("{code_col}", PERIOD, TARGET_SUM, TARGET_SUM_COMP, TARGET_COUNT)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT ("{code_col}", PERIOD) DO UPDATE SET
+            TARGET_SUM = TARGET_SUM + excluded.TARGET_SUM,
+            TARGET_SUM_COMP = TARGET_SUM_COMP + excluded.TARGET_SUM_COMP + {_sum_error},
+            TARGET_COUNT = TARGET_COUNT + excluded.TARGET_COUNT;
+    """, rows)
+
+def update_tmean_stats(conn, spec, chunk_rows=250_000):
+    """
+    Fold the claims_dedup rows past the spec's tmean watermark into its stats
+    tables, building them from every claim if there is no watermark (or
+    claims_dedup was rebuilt below it).
+
+    Returns:
+        int: number of claims added
+    """
+    last_rowid, _ = get_watermark(conn, tmean_watermark_name(spec), 'claims_dedup')
+    high_rowid = conn.execute('SELECT COALESCE(MAX(rowid), 0) FROM claims_dedup;').fetchone()[0]
+    rebuild = last_rowid == 0
+    if not rebuild and high_rowid == last_rowid:
+        return 0
+
+    if rebuild:
+        chunks = read_claims(conn, stats_columns(spec), chunk_rows=chunk_rows)
+    else:
+        chunks = read_claims_since(conn, last_rowid, stats_columns(spec), high_rowid, chunk_rows=chunk_rows)
+    n_claims = 0
+
+    def counted(chunks):
+        nonlocal n_claims
+        for chunk in chunks:
+            n_claims += len(chunk)
+            yield chunk
+
+    principal, secondary = accumulate_stats(spec, counted(chunks))
+    # stats and watermark in one transaction: a crash in between would otherwise
+    # leave the watermark behind and add the same claims twice on the next run
+    with conn:
+        conn.execute('BEGIN;')
+        for (tmean_table, code_col, _, _), acc in zip(_tmean_tables(spec), (principal, secondary)):
+            _create_stats_table(conn, tmean_table, code_col, replace=rebuild)
+            _upsert_stats(conn, tmean_table, code_col, acc)
+        set_watermark(conn, tmean_watermark_name(spec), 'claims_dedup', high_rowid, None, commit=False)
+    return n_claims
+
+def period_weights(periods, window_months=None, half_life_months=None):
+    """
+    Weight of each stats row's period: 1 without a window or half-life;
+    otherwise undated rows get 0, months outside the window 0, and the rest
+    0.5 ** (age / half_life_months), with age in months before the newest one.
+    """
+    periods = pd.Series(periods, dtype='string')
+    if window_months is None and half_life_months is None:
+        return np.ones(len(periods))
+    years = pd.to_numeric(periods.str.slice(0, 4), errors='coerce')
+    months = pd.to_numeric(periods.str.slice(5, 7), errors='coerce')
+    index = (years * 12 + months - 1).to_numpy(dtype=np.float64, na_value=np.nan)
+    dated = ~np.isnan(index)
+    if not dated.any():
+        return np.zeros(len(periods))
+
+    age = np.where(dated, np.nanmax(index) - index, 0)
+    weights = dated.astype(np.float64)
+    if window_months is not None:
+        weights *= age < window_months
+    if half_life_months is not None:
+        weights *= 0.5 ** (age / half_life_months)
+    return weights
+
+def materialize_tmean_tables(conn, spec):
+    """
+    Rewrite the spec's tmean tables from its stats tables:
+    [code, tmean, TARGET_SUM, TARGET_COUNT], principal codes sorted and
+    secondary codes in first-appearance order, as the in-memory builders
+    order them. Counts are weighted (and so fractional) under a half-life.
+    Each code's sums and compensations over its months are added with
+    compensated_sums, so TARGET_SUM is the total rounded once.
+    """
+    for tmean_table, code_col, tmean_col, sort in _tmean_tables(spec):
+        stats = pd.read_sql_query(f"""
+            SELECT "{code_col}", PERIOD, TARGET_SUM, TARGET_SUM_COMP, TARGET_COUNT
+            FROM "{stats_table(tmean_table)}" ORDER BY rowid;
+        """, conn)
+        weights = period_weights(stats['PERIOD'], spec.tmean_window_months, spec.tmean_half_life_months)
+        stats['TARGET_COUNT'] = stats['TARGET_COUNT'] * weights
+
+        grouped = stats.groupby(code_col, sort=sort)
+        df = grouped[['TARGET_COUNT']].sum().reset_index()
+        group_ids = grouped.ngroup().to_numpy()
+        sums, _ = compensated_sums(np.concatenate([group_ids, group_ids]),
+                                   np.concatenate([stats['TARGET_SUM'] * weights, stats['TARGET_SUM_COMP'] * weights]),
+                                   len(df))
+        df.insert(1, 'TARGET_SUM', sums)
+        if spec.tmean_half_life_months is None:
+            df['TARGET_COUNT'] = df['TARGET_COUNT'].astype(np.int64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            df.insert(1, tmean_col, df['TARGET_SUM'] / df['TARGET_COUNT'])
+        df.to_sql(tmean_table, conn, if_exists='replace', index=False)
+    conn.commit()
+
+def update_model_tables(conn, spec, chunk_rows=250_000):
+    """
+    Bring a spec's tmean tables up to date with claims_dedup in O(new
+    claims): update the stats, then rematerialize the tables from them.
+    Stored predictions are kept.
+    """
+    n_claims = update_tmean_stats(conn, spec, chunk_rows)
+    if n_claims:
+        print(f"Added {n_claims} claims to the {spec.name} tmean statistics.")
+    materialize_tmean_tables(conn, spec)
+
+def init_tmean_snapshot_tables(conn):
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS tmean_snapshots (
+            snapshot_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            model_name TEXT NOT NULL,
+            last_rowid INTEGER,
+            window_months INTEGER,
+            half_life_months REAL,
+            content_hash TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS tmean_snapshot_values (
+            snapshot_id INTEGER NOT NULL REFERENCES tmean_snapshots (snapshot_id),
+            kind TEXT NOT NULL,
+            code TEXT NOT NULL,
+            tmean REAL,
+            target_sum REAL,
+            target_count REAL,
+            PRIMARY KEY (snapshot_id, kind, code)
+        ) WITHOUT ROWID;
+    """)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(tmean_snapshots);")}
+    if 'content_hash' not in columns:
+        conn.execute("ALTER TABLE tmean_snapshots ADD COLUMN content_hash TEXT;")
+    conn.commit()
+
+def _live_tmean_tables(conn, spec):
+    return tuple(pd.read_sql_query(f'SELECT * FROM "{table}";', conn) for table, _, _, _ in _tmean_tables(spec))
+
+def tmean_tables_hash(df_principal_tmean, df_secondary_tmean):
+    """
+    Digest of the (code, tmean) pairs of a tmean table pair, in any row order.
+    """
+    digest = hashlib.sha256()
+    for df in (df_principal_tmean, df_secondary_tmean):
+        pairs = df.iloc[:, :2].sort_values(df.columns[0], ignore_index=True)
+        digest.update(pd.util.hash_pandas_object(pairs, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def save_tmean_snapshot(conn, spec, content_hash=None):
+    """
+    Copy the spec's current tmean tables into a new snapshot.
+
+    Args:
+        content_hash (str, optional): tmean_tables_hash of the live tables,
+            if the caller already has it
+
+    Returns:
+        int: the snapshot id, for ModelSpec(tmean_snapshot=...)
+    """
+    init_tmean_snapshot_tables(conn)
+    if content_hash is None:
+        content_hash = tmean_tables_hash(*_live_tmean_tables(conn, spec))
+    last_rowid, _ = get_watermark(conn, tmean_watermark_name(spec), 'claims_dedup')
+    with conn:
+        snapshot_id = conn.execute("""
+            INSERT INTO tmean_snapshots (model_name, last_rowid, window_months, half_life_months, content_hash)
+            VALUES (?, ?, ?, ?, ?);
+        """, (spec.name, last_rowid, spec.tmean_window_months, spec.tmean_half_life_months, content_hash)).lastrowid
+        for (tmean_table, code_col, tmean_col, _), kind in zip(_tmean_tables(spec), ('principal', 'secondary')):
+            conn.execute(f"""
+                INSERT INTO tmean_snapshot_values (snapshot_id, kind, code, tmean, target_sum, target_count)
+                SELECT ?, ?, "{code_col}", "{tmean_col}", TARGET_SUM, TARGET_COUNT FROM "{tmean_table}";
+            """, (snapshot_id, kind))
+    return snapshot_id
+
+def scoring_tmean_snapshot(conn, spec, tables=None):
+    """
+    The snapshot holding the tmean values the spec scores with: its pinned
+    tmean_snapshot, else the newest snapshot with the same content as the
+    live tables, saved now if they changed since.
+
+    Args:
+        tables ((DataFrame, DataFrame), optional): the live tables, if the
+            caller has already read them
+
+    Returns:
+        int: snapshot id
+    """
+    if spec.tmean_snapshot is not None:
+        return spec.tmean_snapshot
+    init_tmean_snapshot_tables(conn)
+    content_hash = tmean_tables_hash(*(tables if tables is not None else _live_tmean_tables(conn, spec)))
+    row = conn.execute("SELECT MAX(snapshot_id) FROM tmean_snapshots WHERE model_name = ? AND content_hash = ?;",
+                       (spec.name, content_hash)).fetchone()
+    if row[0] is not None:
+        return row[0]
+    return save_tmean_snapshot(conn, spec, content_hash)
+
+def load_tmean_snapshot(conn, spec, snapshot_id):
+    """
+    A saved snapshot as (principal, secondary) tmean tables, with the same
+    columns as the live ones.
+    """
+    init_tmean_snapshot_tables(conn)
+    row = conn.execute("SELECT model_name FROM tmean_snapshots WHERE snapshot_id = ?;", (snapshot_id,)).fetchone()
+    if row is None:
+        raise ValueError(f"No tmean snapshot {snapshot_id}")
+    if row[0] != spec.name:
+        raise ValueError(f"tmean snapshot {snapshot_id} belongs to {row[0]}, not {spec.name}")
+
+    tables = []
+    for (_, code_col, tmean_col, _), kind in zip(_tmean_tables(spec), ('principal', 'secondary')):
+        tables.append(pd.read_sql_query(f"""
+            SELECT code AS "{code_col}", tmean AS "{tmean_col}", target_sum AS TARGET_SUM, target_count AS TARGET_COUNT
+            FROM tmean_snapshot_values WHERE snapshot_id = ? AND kind = ?;
+        """, conn, params=(snapshot_id, kind)))
+    return tuple(tables)
+
+def refresh_tmean_tables(sqlite_db_path, specs, snapshot=False, chunk_rows=250_000):
+    """
+    Pull new claims into claims_dedup and update every spec's tmean tables,
+    optionally saving a snapshot of each.
+    """
+    conn = sqlite3.connect(sqlite_db_path)
+    refresh_claims_dedup(conn)
+    for spec in specs:
+        update_model_tables(conn, spec, chunk_rows)
+        if snapshot:
+            print(f"Saved tmean snapshot {save_tmean_snapshot(conn, spec)} for {spec.name}.")
+    conn.close()
+
+def main():
+    p = argparse.ArgumentParser(description="Update the fraud models' tmean tables with new claims.")
+    p.add_argument("--db", default="fraud.db", help="Initialized fraud DB")
+    p.add_argument("--snapshot", action="store_true", help="Save a snapshot of each model's updated tables")
+    p.add_argument("--chunk-rows", type=int, default=250_000)
+    args = p.parse_args()
+
+    # imported here: the model modules import pipeline, which imports this module
+    from fraud_models import fraud_models
+    refresh_tmean_tables(args.db, fraud_models, snapshot=args.snapshot, chunk_rows=args.chunk_rows)
+
+if __name__ == "__main__":
+    main()